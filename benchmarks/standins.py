@@ -0,0 +1,136 @@
+# benchmarks/standins.py
+# Local stand-ins for the services' external dependencies, so a benchmark run needs nothing
+# but this machine: a JWKS issuer in place of Keycloak, and an in-memory Motor-compatible
+# MongoDB (mongomock-motor). The relational database is SQLite or a local Postgres (see run.py).
+import base64
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+from mongomock.command_cursor import CommandCursor
+from mongomock_motor import AsyncCommandCursor, AsyncMongoMockClient, AsyncMongoMockCollection, AsyncMongoMockDatabase
+from pymongo import UpdateOne
+
+
+def _b64_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+# --- Fake Keycloak ---
+class FakeIssuer:
+    """
+    Mints RS256 tokens shaped like Keycloak's and serves the matching JWKS at
+    <url>/auth/realms/<realm>/protocol/openid-connect/certs from a background thread.
+    """
+
+    def __init__(self, realm: str, kid: str = "bench-key", host: str = "127.0.0.1"):
+        self.realm = realm
+        self.kid = kid
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode()
+        numbers = key.public_key().public_numbers()
+        jwks = {"keys": [{
+            "kid": kid, "kty": "RSA", "alg": "RS256", "use": "sig",
+            "n": _b64_uint(numbers.n), "e": _b64_uint(numbers.e),
+        }]}
+        body = json.dumps(jwks).encode()
+        certs_path = f"/auth/realms/{realm}/protocol/openid-connect/certs"
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != certs_path:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Keep benchmark output readable
+
+        self._server = ThreadingHTTPServer((host, 0), Handler)
+        self.url = f"http://{host}:{self._server.server_address[1]}" # KEYCLOAK_URL for task-service
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-jwks", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def mint(self, user_id: str, username: str | None = None, roles: list[str] = (), ttl: int = 3600) -> str:
+        now = int(time.time())
+        claims = {
+            "sub": user_id,
+            "preferred_username": username or user_id,
+            "realm_access": {"roles": list(roles)},
+            "iss": f"{self.url}/auth/realms/{self.realm}",
+            "iat": now,
+            "exp": now + ttl,
+        }
+        return jwt.encode(claims, self._private_pem, algorithm="RS256", headers={"kid": self.kid})
+
+
+# --- In-memory MongoDB ---
+def _stored(value):
+    # mongomock stores datetimes as naive UTC
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class InMemoryMongoCollection(AsyncMongoMockCollection):
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        # mongomock can't take pymongo >= 4.11's UpdateOne, and matches each filter by scanning the
+        # whole collection (twice, with the unique index check). The services only bulk-write $inc
+        # upserts on one key (the rollups), so apply those in a single pass over the documents.
+        fields = sorted(requests[0]._filter) if requests else []
+        if not all(
+            isinstance(request, UpdateOne) and request._upsert and sorted(request._filter) == fields
+            and set(request._doc) == {"$inc"} for request in requests
+        ):
+            return await super().bulk_write(requests, ordered=ordered, **kwargs)
+        existing = {tuple(document.get(field) for field in fields): document for document in self._store.documents}
+        for request in requests:
+            document = existing.get(tuple(_stored(request._filter[field]) for field in fields))
+            if document is None:
+                await self.insert_one({**request._filter, **request._doc["$inc"]})
+                continue
+            for field, amount in request._doc["$inc"].items():
+                document[field] = document.get(field, 0) + amount # Stored documents are plain dicts
+
+
+class InMemoryMongoDatabase(AsyncMongoMockDatabase):
+    def get_collection(self, *args, **kwargs) -> InMemoryMongoCollection:
+        return InMemoryMongoCollection(self, self.delegate.get_collection(*args, **kwargs))
+
+    async def list_collections(self, filter=None, **kwargs):
+        # Missing from mongomock; analytics-service uses it to detect the event_logs layout
+        wanted = (filter or {}).get("name")
+        infos = [
+            {"name": name, "type": "collection", "options": {}}
+            for name in self.delegate.list_collection_names() if wanted is None or name == wanted
+        ]
+        return AsyncCommandCursor(CommandCursor(infos))
+
+
+class InMemoryMongoClient(AsyncMongoMockClient):
+    """Drop-in for motor's AsyncIOMotorClient; the connection string and driver options are ignored."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+
+    def get_database(self, *args, **kwargs) -> InMemoryMongoDatabase:
+        database = super().get_database(*args, **kwargs)
+        return InMemoryMongoDatabase(self, database.delegate)
@@ -0,0 +1,132 @@
+# benchmarks/workloads.py
+# Scripted workloads. Each one issues a single HTTP request per call to request(); run.py
+# calls it from a fixed number of concurrent workers and times every call.
+import random
+from datetime import datetime, timezone
+
+STATUSES = ("todo", "inprogress", "done")
+WORDS = (
+    "fix", "login", "page", "update", "docs", "deploy", "review", "api", "cache", "report",
+    "export", "search", "dashboard", "billing", "email", "timeout", "migration", "index",
+)
+
+
+class Workload:
+    name = ""
+    service = "" # Which service the requests go to ("task", "analytics" or "notification")
+    description = ""
+    ok_statuses = (200,)
+    items_per_request = 1 # Tasks/events/notifications carried by one request
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed) # Same requests on every run
+
+    async def setup(self, bench):
+        """Prepare data before warm-up (not timed)."""
+
+    async def request(self, bench, worker: int, i: int):
+        raise NotImplementedError
+
+
+def random_title(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+
+def random_task(rng: random.Random, users: list[str]) -> dict:
+    return {
+        "title": random_title(rng),
+        "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))),
+        "status": rng.choice(STATUSES),
+        "assignee_id": rng.choice(users) if rng.random() < 0.8 else None,
+    }
+
+
+class ListPaging(Workload):
+    name = "list_paging"
+    service = "task"
+    description = "GET /tasks/ pages of 50 with keyset cursors; each worker walks the list and starts over at the end"
+    page_size = 50
+
+    def __init__(self, seed: int, seed_tasks: int):
+        super().__init__(seed)
+        self.seed_tasks = seed_tasks
+        self.items_per_request = self.page_size
+        self._cursors: dict[int, str | None] = {} # worker -> cursor for its next page
+
+    async def setup(self, bench):
+        batch_size = 1000 # BATCH_MAX_ITEMS default
+        for start in range(0, self.seed_tasks, batch_size):
+            items = [random_task(self.random, bench.user_ids) for _ in range(min(batch_size, self.seed_tasks - start))]
+            response = await bench.client("task").post("/tasks/batch", json=items, headers=bench.auth_headers(0))
+            response.raise_for_status()
+
+    async def request(self, bench, worker: int, i: int):
+        params = {"limit": self.page_size}
+        cursor = self._cursors.get(worker)
+        if cursor:
+            params["cursor"] = cursor
+        response = await bench.client("task").get("/tasks/", params=params, headers=bench.auth_headers(worker))
+        self._cursors[worker] = response.headers.get("X-Next-Cursor") # None at the end: start over
+        return response
+
+
+class WriteBurst(Workload):
+    name = "write_burst"
+    service = "task"
+    description = "POST /tasks/ single creates (summary deltas, outbox events and change feed rows in each transaction)"
+    ok_statuses = (201,)
+
+    async def request(self, bench, worker: int, i: int):
+        task = random_task(self.random, bench.user_ids)
+        return await bench.client("task").post("/tasks/", json=task, headers=bench.auth_headers(worker))
+
+
+class EventFlood(Workload):
+    name = "event_flood"
+    service = "analytics"
+    description = "POST /log-events with 100 events per request (buffered ingestion and rollups)"
+    ok_statuses = (202,)
+    items_per_request = 100
+    event_types = ("task_created", "task_updated", "task_completed", "task_assigned", "user_login")
+
+    async def request(self, bench, worker: int, i: int):
+        now = datetime.now(timezone.utc).isoformat() # Live traffic: the rollups touch only the current buckets
+        events = [
+            {
+                "event_type": self.random.choice(self.event_types),
+                "user_id": self.random.choice(bench.user_ids),
+                "timestamp": now,
+                "details": {"task_id": self.random.randint(1, 100000)},
+            }
+            for _ in range(self.items_per_request)
+        ]
+        return await bench.client("analytics").post("/log-events", json=events)
+
+
+class NotificationBurst(Workload):
+    name = "notification_burst"
+    service = "notification"
+    description = "POST /send-notifications with 20 in-app/email notifications per request (spool journaling)"
+    ok_statuses = (202,)
+    items_per_request = 20
+
+    async def request(self, bench, worker: int, i: int):
+        payloads = [
+            {
+                "recipient": f"{self.random.choice(bench.user_ids)}@example.com",
+                "subject": random_title(self.random),
+                "message": random_title(self.random),
+                "type": self.random.choice(("in-app", "email")),
+            }
+            for _ in range(self.items_per_request)
+        ]
+        return await bench.client("notification").post("/send-notifications", json=payloads)
+
+
+def build_workloads(seed: int, seed_tasks: int) -> dict[str, Workload]:
+    workloads = [
+        ListPaging(seed, seed_tasks),
+        WriteBurst(seed),
+        EventFlood(seed),
+        NotificationBurst(seed),
+    ]
+    return {workload.name: workload for workload in workloads}
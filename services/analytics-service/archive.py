@@ -0,0 +1,671 @@
+# services/analytics-service/archive.py
+# Columnar archive for old event_logs, so MongoDB only holds recent events.
+#
+# archive_events() moves events from whole UTC days older than a cutoff out of event_logs into
+#   <root>/<YYYY-MM-DD>/parts.json                  event_type -> the day's parts (generation, rows, task id range)
+#   <root>/<YYYY-MM-DD>/<event_type>/part-<generation>/
+#     timestamp.npy     int64 ms since the epoch (UTC), sorted
+#     user_id.npy       int32 codes into dictionary.json (-1 = no user)
+#     task_id.npy       int64 details.task_id (MISSING_TASK_ID when absent or not an integer)
+#     dictionary.json   {"user_id": [code -> value]}
+#     rest.ndjson.gz    everything else per row (_id, details, ...) as extended JSON, for restores
+# event_type is implied by the directory. The query columns are fixed-width .npy files that
+# EventArchive reads with one call each and filters/aggregates with numpy, keeping recently used
+# ones in a memory-bounded cache; the row payload nobody queries is gzip-compressed.
+#
+# manifest.json records 'archived_until': queries read [.., archived_until) from here and
+# [archived_until, ..) from MongoDB, so the two never overlap. Events move oldest first, in
+# chunks of at most ARCHIVE_CHUNK_SIZE within one day (a few more when they share the last
+# timestamp), built in a worker thread, so neither the event loop nor the archiver's memory
+# carries a whole day. Per chunk, in this order: its parts and parts.json are written and
+# fsynced, the manifest moves archived_until past the chunk under a new generation and lists
+# the chunk's parts as pending deletion, and only then are its events deleted. Readers only see
+# parts of generations up to the manifest's; a run first finishes the deletes its predecessor
+# left pending and discards parts it never recorded. So a crash at any point leaves every event
+# readable exactly once, and a rerun never archives an event twice. Late events for archived
+# time go into parts of their own on the next run.
+# Rollups keep counting archived events; `python rollups.py rebuild` reads them back from here.
+import argparse
+import asyncio
+import fcntl
+import gzip
+import json
+import os
+import shutil
+import threading
+import urllib.parse
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from bson import json_util
+
+from storage import EVENT_LOGS, detect_event_log_layout
+
+EPOCH = datetime(1970, 1, 1)
+DAY = timedelta(days=1)
+MISSING_TASK_ID = np.iinfo(np.int64).min
+FETCH_BATCH_SIZE = 10000 # Documents per cursor round trip while archiving
+ARCHIVE_CHUNK_SIZE = 200000 # Events moved (and held in memory) at a time; also the largest part
+DELETE_BATCH_SIZE = 10000 # _ids per delete_many
+MANIFEST = "manifest.json"
+DAY_PARTS = "parts.json"
+COLUMN_FIELDS = ("timestamp", "event_type", "user_id") # Stored as columns; the rest goes to rest.ndjson.gz
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # MongoDB hands back naive UTC; query parameters may carry a timezone
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def to_ms(value: datetime) -> int:
+    return (_naive_utc(value) - EPOCH) // timedelta(milliseconds=1)
+
+def from_ms(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=ms)
+
+def _day_start(value: datetime) -> datetime:
+    return _naive_utc(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+FIXED_BUCKETS = {"minute": 60000, "hour": 3600000, "day": 86400000} # Bucket sizes in ms
+
+def bucket_starts(timestamps: np.ndarray, unit: str) -> np.ndarray:
+    """Bucket start (int64 ms) per timestamp, matching MongoDB's $dateTrunc (weeks start on Sunday)."""
+    if unit in FIXED_BUCKETS:
+        return timestamps // FIXED_BUCKETS[unit] * FIXED_BUCKETS[unit] # Floor division rounds pre-1970 times down too
+    if unit == "week":
+        days = timestamps // 86400000
+        return (days - (days + 4) % 7) * 86400000 # 1970-01-01 was a Thursday
+    return timestamps.astype("datetime64[ms]").astype("datetime64[M]").astype("datetime64[ms]").astype(np.int64)
+
+
+# --- Writing ---
+def _fsync(path: str):
+    # Directories too: that's what makes a rename (or a new entry) survive a crash
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_json(path: str, data: dict):
+    """Atomically replace 'path', durable once this returns."""
+    staging = f"{path}.tmp"
+    with open(staging, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(staging, path)
+    _fsync(os.path.dirname(path))
+
+
+class _PartitionBuilder:
+    """Rows of one part: a chunk's events of one event_type."""
+
+    def __init__(self):
+        self.timestamps: list[datetime] = []
+        self.users: list = []
+        self.task_ids: list[int] = []
+        self.rest: list[dict] = []
+
+    def add(self, event: dict):
+        self.timestamps.append(event["timestamp"])
+        self.users.append(event.get("user_id"))
+        task_id = (event.get("details") or {}).get("task_id")
+        self.task_ids.append(task_id if isinstance(task_id, int) and not isinstance(task_id, bool) else MISSING_TASK_ID)
+        self.rest.append({key: value for key, value in event.items() if key not in COLUMN_FIELDS})
+
+    def summary(self) -> dict:
+        """The part's details for parts.json: row count and task id range (lets lookups skip the part)."""
+        task_ids = [task_id for task_id in self.task_ids if task_id != MISSING_TASK_ID]
+        return {"rows": len(self.timestamps), "task_ids": [min(task_ids), max(task_ids)] if task_ids else None}
+
+    def write(self, path: str):
+        """Write the part to 'path' (via a temporary directory), fsynced before it is renamed into place."""
+        order = np.argsort(np.array(self.timestamps, dtype="datetime64[ms]"), kind="stable")
+        dictionary = sorted({user for user in self.users if user is not None}, key=str)
+        codes = {user: code for code, user in enumerate(dictionary)}
+
+        staging = f"{path}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        timestamps = np.array(self.timestamps, dtype="datetime64[ms]").astype(np.int64)
+        np.save(os.path.join(staging, "timestamp.npy"), timestamps[order])
+        np.save(os.path.join(staging, "user_id.npy"), np.array([codes.get(user, -1) for user in self.users], dtype=np.int32)[order])
+        np.save(os.path.join(staging, "task_id.npy"), np.array(self.task_ids, dtype=np.int64)[order])
+        with open(os.path.join(staging, "dictionary.json"), "w") as f:
+            json.dump({"user_id": dictionary}, f)
+        with gzip.open(os.path.join(staging, "rest.ndjson.gz"), "wt") as f:
+            for index in order:
+                f.write(json_util.dumps(self.rest[index]) + "\n")
+        for name in os.listdir(staging):
+            _fsync(os.path.join(staging, name))
+        _fsync(staging)
+        shutil.rmtree(path, ignore_errors=True) # Left by a run that stopped before recording it
+        os.rename(staging, path)
+        _fsync(os.path.dirname(path))
+
+class _Chunk:
+    """Events moved together: one part per event_type, and the _ids to delete once they're recorded."""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.parts: dict[str, _PartitionBuilder] = {}
+        self.ids = []
+
+    def add(self, documents: list[dict]):
+        """Add a fetched batch; CPU-bound, so the archiver runs it in a worker thread."""
+        for document in documents:
+            event = self.layout.from_document(document)
+            builder = self.parts.get(event["event_type"])
+            if builder is None:
+                builder = self.parts[event["event_type"]] = _PartitionBuilder()
+            builder.add(event)
+            self.ids.append(document["_id"])
+
+
+def _day_dir(root: str, day: datetime) -> str:
+    return os.path.join(root, day.strftime("%Y-%m-%d"))
+
+def _part_path(root: str, day: datetime, event_type: str, name: str) -> str:
+    return os.path.join(_day_dir(root, day), urllib.parse.quote(event_type, safe=""), name)
+
+def read_day_parts(root: str, day: datetime) -> dict[str, list[dict]]:
+    """
+    event_type -> [{"part": name, "generation": n, "rows": n, "task_ids": [min, max] or None}, ...]
+    for the day's parts (DAY_PARTS), recorded or not; empty for days not archived.
+    """
+    try:
+        with open(os.path.join(_day_dir(root, day), DAY_PARTS)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _write_chunk(root: str, day: datetime, chunk: _Chunk, generation: int) -> list[str]:
+    """Write the chunk's parts, then add them to the day's parts.json; returns their paths relative to 'root'."""
+    day_parts = read_day_parts(root, day)
+    paths = []
+    for event_type, builder in chunk.parts.items():
+        name = f"part-{generation:08d}"
+        path = _part_path(root, day, event_type, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        builder.write(path)
+        day_parts.setdefault(event_type, []).append({"part": name, "generation": generation, **builder.summary()})
+        paths.append(os.path.relpath(path, root))
+    _write_json(os.path.join(_day_dir(root, day), DAY_PARTS), day_parts)
+    _fsync(root) # The day's directory, if new
+    return paths
+
+def read_manifest(root: str) -> dict:
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"archived_until": None, "generation": 0}
+
+def _write_manifest(root: str, archived_until: datetime, generation: int, pending: dict | None = None):
+    # 'pending': the parts of the last chunk, whose events may not all be deleted from MongoDB yet
+    manifest = {"archived_until": archived_until.isoformat(), "generation": generation}
+    if pending is not None:
+        manifest["pending"] = pending
+    _write_json(os.path.join(root, MANIFEST), manifest)
+
+def _part_ids(path: str) -> list:
+    with gzip.open(os.path.join(path, "rest.ndjson.gz"), "rt") as f:
+        return [json_util.loads(line)["_id"] for line in f]
+
+def _discard_unrecorded_parts(root: str, generation: int):
+    """Drop parts newer than the manifest's generation: a run wrote them but stopped before recording them."""
+    for day_name in os.listdir(root):
+        try:
+            day = datetime.strptime(day_name, "%Y-%m-%d")
+        except ValueError:
+            continue # manifest.json, .lock
+        day_parts = read_day_parts(root, day)
+        recorded = {}
+        for event_type, parts in day_parts.items():
+            kept = [part for part in parts if part["generation"] <= generation]
+            if kept:
+                recorded[event_type] = kept
+        if not recorded:
+            shutil.rmtree(_day_dir(root, day), ignore_errors=True)
+            continue
+        if recorded != day_parts:
+            _write_json(os.path.join(_day_dir(root, day), DAY_PARTS), recorded)
+        keep = {_part_path(root, day, event_type, part["part"]) for event_type, parts in recorded.items() for part in parts}
+        for quoted in os.listdir(_day_dir(root, day)):
+            type_dir = os.path.join(_day_dir(root, day), quoted)
+            if os.path.isdir(type_dir):
+                for name in os.listdir(type_dir):
+                    if os.path.join(type_dir, name) not in keep:
+                        shutil.rmtree(os.path.join(type_dir, name), ignore_errors=True)
+
+async def _delete_archived(collection, ids: list, timestamps: dict):
+    # The timestamp range keeps the deletes on an index for the time-series layout too
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        await collection.delete_many({"_id": {"$in": ids[start:start + DELETE_BATCH_SIZE]}, "timestamp": timestamps})
+
+async def finish_interrupted_run(database, root: str):
+    """
+    Complete what a run that stopped part-way left behind: the deletes of its last recorded chunk,
+    and parts it wrote without recording. Call while holding archive_lock(root).
+    """
+    manifest = read_manifest(root)
+    pending = manifest.get("pending")
+    if pending is not None:
+        timestamps = {"$gte": datetime.fromisoformat(pending["start"]), "$lt": datetime.fromisoformat(pending["end"])}
+        for path in pending["parts"]:
+            ids = await asyncio.to_thread(_part_ids, os.path.join(root, path))
+            await _delete_archived(database[EVENT_LOGS], ids, timestamps)
+        await asyncio.to_thread(_write_manifest, root, datetime.fromisoformat(manifest["archived_until"]), manifest["generation"])
+    await asyncio.to_thread(_discard_unrecorded_parts, root, manifest["generation"])
+
+
+@contextmanager
+def archive_lock(root: str):
+    """Exclusive use of the archive directory (archiving, rollup rebuilds); yields False if someone else has it."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+async def archive_events(database, root: str, older_than_days: float, chunk_size: int = ARCHIVE_CHUNK_SIZE) -> int:
+    """
+    Move events from whole UTC days before (now - older_than_days) into the archive, oldest first,
+    at most about 'chunk_size' at a time. Returns how many events were archived. Only one archiver
+    runs per archive directory.
+    """
+    with archive_lock(root) as locked:
+        if not locked:
+            print("Archiving (or a rollup rebuild) already running elsewhere; skipping.")
+            return 0
+        await finish_interrupted_run(database, root)
+
+        layout = await detect_event_log_layout(database)
+        collection = database[EVENT_LOGS]
+        cutoff = _day_start(datetime.now(timezone.utc) - timedelta(days=older_than_days))
+        manifest = read_manifest(root)
+        archived_until = datetime.fromisoformat(manifest["archived_until"]) if manifest["archived_until"] else None
+        generation = manifest["generation"]
+        archived = 0
+        while True:
+            # The chunk: the oldest remaining events, up to the end of their day. Everything sharing the
+            # last timestamp comes along, so archived_until can move right past the chunk.
+            oldest = await collection.find({"timestamp": {"$lt": cutoff}}, {"_id": 0, "timestamp": 1}).sort("timestamp", 1).limit(1).to_list(length=1)
+            if not oldest:
+                break
+            day = _day_start(oldest[0]["timestamp"])
+            end = min(day + DAY, cutoff)
+            last = await (
+                collection.find({"timestamp": {"$gte": day, "$lt": end}}, {"_id": 0, "timestamp": 1})
+                .sort("timestamp", 1).skip(chunk_size - 1).limit(1).to_list(length=1)
+            )
+            if last:
+                end = min(last[0]["timestamp"] + timedelta(milliseconds=1), end) # Stored times are whole ms
+            timestamps = {"$gte": day, "$lt": end}
+            chunk = _Chunk(layout)
+            cursor = collection.find({"timestamp": timestamps}, batch_size=FETCH_BATCH_SIZE)
+            while batch := await cursor.to_list(length=FETCH_BATCH_SIZE):
+                await asyncio.to_thread(chunk.add, batch)
+            if not chunk.ids:
+                continue # Expired meanwhile
+
+            # 1. Parts, then the day's list of parts, on disk for good
+            generation += 1
+            parts = await asyncio.to_thread(_write_chunk, root, day, chunk, generation)
+            # 2. Queries switch to the archive for the chunk (a new generation even when the boundary
+            # stays put, so readers pick up parts written for late events)
+            archived_until = max(archived_until, end) if archived_until else end
+            pending = {"parts": parts, "start": day.isoformat(), "end": end.isoformat()}
+            await asyncio.to_thread(_write_manifest, root, archived_until, generation, pending)
+            # 3. Only then do the events leave MongoDB. Events arriving for the chunk meanwhile stay for the next run.
+            await _delete_archived(collection, chunk.ids, timestamps)
+            print(f"Archived {len(chunk.ids)} events from {day:%Y-%m-%d}.")
+            archived += len(chunk.ids)
+
+        if archived or archived_until is None or archived_until < cutoff:
+            # Up to the cutoff (the remaining days had no events), and nothing pending any more
+            await asyncio.to_thread(_write_manifest, root, max(archived_until, cutoff) if archived_until else cutoff, generation + 1)
+        return archived
+
+
+# --- Reading ---
+def _group(columns: list[np.ndarray], weights: np.ndarray) -> tuple[list[np.ndarray], np.ndarray, np.ndarray]:
+    """
+    Sum 'weights' per distinct row of 'columns' (sort-based, no Python loop over rows).
+    Returns (distinct rows as columns, sums, start of each group in sort order).
+    """
+    if weights.size == 0:
+        return [column[:0] for column in columns], weights[:0], np.empty(0, dtype=np.intp)
+    order = np.lexsort(columns[::-1]) # First column is the primary sort key
+    columns = [column[order] for column in columns]
+    change = np.zeros(weights.size, dtype=bool)
+    change[0] = True
+    for column in columns:
+        change[1:] |= column[1:] != column[:-1]
+    starts = np.flatnonzero(change)
+    return [column[starts] for column in columns], np.add.reduceat(weights[order], starts), starts
+
+
+class Partition:
+    """
+    One archived part. Columns are read whole on first use and kept with the partition: no file
+    stays open, so the number of cached partitions isn't bounded by the file descriptor limit.
+    """
+
+    def __init__(self, path: str, event_type: str, on_load=None):
+        self.path = path
+        self.event_type = event_type
+        self.nbytes = 0
+        self._on_load = on_load # Called with (partition, bytes) as columns are loaded, for the cache budget
+        self._columns: dict[str, np.ndarray] = {}
+        self._users: list | None = None
+        self.global_users: np.ndarray | None = None # Partition user code -> EventArchive code, filled in by the archive
+        self.timestamp = self.column("timestamp")
+
+    def column(self, name: str) -> np.ndarray:
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = np.load(os.path.join(self.path, f"{name}.npy"))
+            self.nbytes += column.nbytes
+            if self._on_load is not None:
+                self._on_load(self, column.nbytes)
+        return column
+
+    @property
+    def users(self) -> list:
+        if self._users is None:
+            with open(os.path.join(self.path, "dictionary.json")) as f:
+                self._users = json.load(f)["user_id"]
+        return self._users
+
+    def window(self, start_ms: int, end_ms: int) -> slice:
+        """Rows with start_ms <= timestamp < end_ms (timestamps are sorted)."""
+        return slice(int(np.searchsorted(self.timestamp, start_ms, "left")), int(np.searchsorted(self.timestamp, end_ms, "left")))
+
+
+class EventArchive:
+    """Vectorised queries over the archive; the query methods block, so call them via asyncio.to_thread()."""
+
+    def __init__(self, root: str, cache_bytes: int = 256 * 2**20):
+        self.root = root
+        self.cache_bytes = cache_bytes # Column data kept in memory across queries (least recently used goes first)
+        self._cached_bytes = 0
+        self._partitions: OrderedDict[str, Partition] = OrderedDict()
+        self._listings: dict[datetime, list[tuple[str, str]]] = {} # Day -> (event_type, part path)
+        self._generation = None
+        self._archived_until: datetime | None = None
+        # Archive-wide codes, so partitions with different dictionaries can be grouped together
+        self._codes: dict[str, dict] = {"event_type": {}, "user_id": {}}
+        self._values: dict[str, list] = {"event_type": [], "user_id": []}
+        self._lock = threading.Lock() # Queries run in worker threads
+
+    def archived_until(self) -> datetime | None:
+        """Events before this are in the archive (not in MongoDB); None when nothing has been archived."""
+        manifest = read_manifest(self.root)
+        with self._lock:
+            if manifest["generation"] != self._generation:
+                self._generation = manifest["generation"]
+                self._archived_until = datetime.fromisoformat(manifest["archived_until"]) if manifest["archived_until"] else None
+                self._listings.clear() # Parts may have been rewritten for days we listed before
+            return self._archived_until
+
+    def _code(self, name: str, value) -> int:
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            with self._lock:
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(self._values[name])
+                    self._values[name].append(value)
+        return code
+
+    def _partition(self, path: str, event_type: str) -> Partition:
+        with self._lock:
+            partition = self._partitions.get(path)
+            if partition is not None:
+                self._partitions.move_to_end(path)
+                return partition
+        partition = Partition(path, event_type, on_load=self._loaded)
+        with self._lock:
+            self._partitions[path] = partition
+            self._cached_bytes += partition.nbytes
+            self._evict()
+        return partition
+
+    def _loaded(self, partition: Partition, nbytes: int):
+        with self._lock:
+            if self._partitions.get(partition.path) is partition: # Not yet in the cache, or already evicted
+                self._cached_bytes += nbytes
+                self._evict()
+
+    def _evict(self):
+        # The most recent partition stays even when it alone is over budget: a query is using it
+        while self._cached_bytes > self.cache_bytes and len(self._partitions) > 1:
+            _, evicted = self._partitions.popitem(last=False)
+            self._cached_bytes -= evicted.nbytes
+
+    def _user_codes(self, partition: Partition, rows: slice) -> np.ndarray:
+        if partition.global_users is None:
+            # Trailing -1 so "no user" (-1) indexes to itself
+            partition.global_users = np.array([self._code("user_id", user) for user in partition.users] + [-1], dtype=np.int64)
+        return partition.global_users[partition.column("user_id")[rows]]
+
+    def first_day(self) -> datetime | None:
+        """The oldest archived day, if any."""
+        if not os.path.isdir(self.root):
+            return None
+        days = sorted(name for name in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, name, DAY_PARTS)))
+        return datetime.strptime(days[0], "%Y-%m-%d") if days else None
+
+    def _day_parts(self, day: datetime) -> list[tuple[str, str, dict]]:
+        listing = self._listings.get(day)
+        if listing is None:
+            # Parts of later generations aren't recorded yet: their events are still in MongoDB
+            listing = self._listings[day] = [
+                (event_type, _part_path(self.root, day, event_type, part["part"]), part)
+                for event_type, parts in sorted(read_day_parts(self.root, day).items())
+                for part in parts if part["generation"] <= self._generation
+            ]
+        return listing
+
+    def partitions(self, start: datetime | None, end: datetime, event_types=None, task_ids: np.ndarray | None = None):
+        """
+        Partitions for days overlapping [start, end), clipped to the archived range. With 'task_ids'
+        (sorted), only those whose task id range can hold one of them; the rest aren't even opened.
+        """
+        until = self.archived_until()
+        if until is None:
+            return
+        end = min(_naive_utc(end), until)
+        start = start if start is not None else self.first_day()
+        if start is None:
+            return
+        day = _day_start(start)
+        while day < end:
+            for event_type, path, part in self._day_parts(day):
+                if event_types and event_type not in event_types:
+                    continue
+                if task_ids is not None and "task_ids" in part:
+                    if part["task_ids"] is None:
+                        continue
+                    low, high = part["task_ids"]
+                    position = np.searchsorted(task_ids, low)
+                    if position == task_ids.size or task_ids[position] > high:
+                        continue
+                yield self._partition(path, event_type)
+            day += DAY
+
+    def event_stats(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket: str | None,
+        keys: list[str],
+        metrics: list[str],
+        event_types: list[str] | None = None,
+        user_id: str | None = None,
+        hot_documents: list[dict] = (),
+    ) -> list[dict]:
+        """
+        Rows like queries.event_stats_pipeline() output for [start, end): keys are the group keys,
+        then "bucket". Archived days are aggregated here; 'hot_documents' - the same aggregation
+        over the rest of the range from MongoDB, grouped by user_id as well when counting distinct
+        users - are merged in.
+        """
+        with_users = "distinct_users" in metrics
+        user_column = keys.index("user_id") if "user_id" in keys else len(keys) if with_users else None
+        width = len(keys) + (1 if user_column == len(keys) else 0)
+        start_ms, end_ms = to_ms(start), to_ms(end)
+
+        chunks, chunk_counts = [], []
+        for partition in self.partitions(start, end, event_types):
+            rows = partition.window(start_ms, end_ms)
+            if rows.start == rows.stop:
+                continue
+            users = self._user_codes(partition, rows) if user_column is not None or user_id is not None else None
+            if user_id is not None:
+                user_filter = self._codes["user_id"].get(user_id, -2) # -2 matches nothing
+                if user_filter not in partition.global_users:
+                    continue
+            size = rows.stop - rows.start
+            columns = []
+            for key in keys:
+                if key == "event_type":
+                    columns.append(np.full(size, self._code("event_type", partition.event_type), dtype=np.int64))
+                elif key == "user_id":
+                    columns.append(users)
+                elif key == "task_id":
+                    columns.append(np.asarray(partition.column("task_id")[rows]))
+                else:
+                    columns.append(bucket_starts(partition.timestamp[rows], bucket))
+            if width > len(keys):
+                columns.append(users)
+            if not columns:
+                columns = [np.zeros(size, dtype=np.int64)] # Nothing to group on: a single total
+            weights = np.ones(size, dtype=np.int64)
+            if user_id is not None:
+                mask = users == user_filter
+                columns, weights = [column[mask] for column in columns], weights[mask]
+            columns, counts, _ = _group(columns, weights) # Keep the running result small
+            chunks.append(columns)
+            chunk_counts.append(counts)
+
+        if chunks:
+            columns, counts, _ = _group([np.concatenate(parts) for parts in zip(*chunks)], np.concatenate(chunk_counts))
+        else:
+            columns, counts = [np.empty(0, dtype=np.int64) for _ in range(max(width, 1))], np.empty(0, dtype=np.int64)
+
+        # Per group of keys: events, distinct users (-1 is "no user") and where its users are in 'columns'
+        user_starts = None
+        if width > len(keys):
+            key_columns, totals, user_starts = _group(columns[:len(keys)] or [np.zeros(counts.size, dtype=np.int64)], counts)
+            _, distinct, _ = _group(columns[:len(keys)] or [np.zeros(counts.size, dtype=np.int64)], (columns[-1] >= 0).astype(np.int64))
+        else:
+            key_columns, totals = columns[:len(keys)], counts
+            distinct = (columns[user_column] >= 0).astype(np.int64) if user_column is not None else None
+
+        decoded = []
+        for key, column in zip(keys, key_columns):
+            if key in self._values:
+                values = self._values[key] + [None] # -1 -> None
+                decoded.append([values[code] for code in column.tolist()])
+            elif key == "task_id":
+                decoded.append([None if value == MISSING_TASK_ID else value for value in column.tolist()])
+            else:
+                decoded.append(column.astype("datetime64[ms]").tolist()) # datetime objects, as MongoDB returns them
+        group_keys = list(zip(*decoded)) if keys else ([()] if totals.size else [])
+        totals = totals.tolist()
+        distinct = distinct.tolist() if distinct is not None else None
+        index = {key: position for position, key in enumerate(group_keys)}
+
+        # Fold in MongoDB's rows; distinct users of a group present on both sides are recounted from the sets
+        archived = len(group_keys)
+        extra_users: dict[int, set] = {}
+        for document in hot_documents:
+            key = tuple(document.get(name) for name in keys)
+            position = index.get(key)
+            if position is None:
+                position = index[key] = len(group_keys)
+                group_keys.append(key)
+                totals.append(0)
+                if distinct is not None:
+                    distinct.append(0)
+            totals[position] += document["count"]
+            if with_users and document.get("user_id") is not None:
+                extra_users.setdefault(position, set()).add(document["user_id"])
+        for position, users in extra_users.items():
+            if user_starts is not None and position < archived:
+                stop = user_starts[position + 1] if position + 1 < archived else columns[-1].size
+                users |= {self._values["user_id"][code] for code in columns[-1][user_starts[position]:stop].tolist() if code >= 0}
+            distinct[position] = len(users) # Grouped by user_id, that's the group's one user
+
+        result = []
+        for position, key in enumerate(group_keys):
+            row = {} # Metrics first, as MongoDB's $project leaves them
+            if "count" in metrics:
+                row["count"] = totals[position]
+            if with_users:
+                row["distinct_users"] = distinct[position]
+            row.update(zip(keys, key))
+            result.append(row)
+        if "bucket" in keys:
+            result.sort(key=lambda row: row["bucket"])
+        return result
+
+    def completions(self, start: datetime, end: datetime) -> tuple[np.ndarray, np.ndarray]:
+        """(task ids, timestamps in ms) of archived task_completed events in [start, end)."""
+        start_ms, end_ms = to_ms(start), to_ms(end)
+        ids, times = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for partition in self.partitions(start, end, ["task_completed"]):
+            rows = partition.window(start_ms, end_ms)
+            task_ids = partition.column("task_id")[rows]
+            present = task_ids != MISSING_TASK_ID
+            ids.append(task_ids[present])
+            times.append(partition.timestamp[rows][present])
+        return np.concatenate(ids), np.concatenate(times)
+
+    def creations(self, task_ids: np.ndarray, end: datetime) -> tuple[np.ndarray, np.ndarray]:
+        """(task ids, timestamps in ms) of archived task_created events before 'end' for 'task_ids' (sorted, unique)."""
+        end_ms = to_ms(end)
+        ids, times = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        if task_ids.size == 0:
+            return ids[0], times[0]
+        for partition in self.partitions(None, end, ["task_created"], task_ids):
+            rows = partition.window(np.iinfo(np.int64).min, end_ms)
+            found = partition.column("task_id")[rows]
+            wanted = np.isin(found, task_ids)
+            ids.append(found[wanted])
+            times.append(partition.timestamp[rows][wanted])
+        return np.concatenate(ids), np.concatenate(times)
+
+
+async def _main():
+    import motor.motor_asyncio
+    from main import ARCHIVE_AFTER_DAYS, ARCHIVE_DIR, MONGO_DETAILS
+
+    parser = argparse.ArgumentParser(description="Archive old event_logs into columnar files.")
+    parser.add_argument("command", choices=["run"], help="run: archive whole days older than the cutoff")
+    parser.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS or 90, help="Cutoff age in days (default: ARCHIVE_AFTER_DAYS, else 90)")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="Archive directory (default: ARCHIVE_DIR)")
+    args = parser.parse_args()
+
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
+    try:
+        archived = await archive_events(client.analytics_db, args.dir, args.older_than_days)
+        print(f"Archived {archived} events.")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    # Usage (from services/analytics-service): python archive.py run --older-than-days 90
+    asyncio.run(_main())
@@ -0,0 +1,155 @@
+# services/analytics-service/ingest.py
+import asyncio
+import time
+
+from pymongo.errors import BulkWriteError
+
+
+class IngestQueueFull(Exception):
+    """The buffer stayed full for longer than the caller was willing to wait."""
+
+
+class EventIngestor:
+    """
+    Buffers events in memory and writes them to MongoDB with unordered insert_many,
+    flushing when 'batch_size' events are waiting or 'flush_interval' seconds have passed.
+    The buffer is bounded: when there is no room, submit_many() waits up to 'put_timeout' and
+    then raises IngestQueueFull so the API can push back on producers. A request's events are
+    queued all together or not at all, so a producer can retry the whole request.
+    """
+
+    def __init__(self, max_buffer: int, batch_size: int, flush_interval: float, put_timeout: float, max_retries: int = 3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self._collection = None
+        self._to_document = None
+        self._task: asyncio.Task | None = None
+        self._on_flush = [] # async callables receiving each written batch
+        self._space = asyncio.Event() # Set whenever the writer takes events out of the buffer
+
+    def on_flush(self, callback):
+        """Register an async callback that receives the events of each batch once they are written."""
+        self._on_flush.append(callback)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self, collection, to_document=None):
+        """Start writing to 'collection'; 'to_document' optionally reshapes each event before insert."""
+        self._collection = collection
+        self._to_document = to_document
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still buffered, then stop the background writer."""
+        if self._task is None:
+            return
+        await self._queue.put(None) # Sentinel: everything queued before it gets written
+        await self._task
+        self._task = None
+
+    async def submit(self, event: dict):
+        await self.submit_many([event])
+
+    async def submit_many(self, events: list[dict]):
+        """Queue all of 'events', or none of them (IngestQueueFull) if there's no room within put_timeout."""
+        if self._task is None:
+            raise IngestQueueFull("Ingestion is not running")
+        if len(events) > self._queue.maxsize:
+            raise IngestQueueFull(f"More events than the buffer holds ({self._queue.maxsize})")
+        deadline = time.monotonic() + self.put_timeout
+        while self._queue.maxsize - self._queue.qsize() < len(events):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IngestQueueFull("Event buffer is full")
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                raise IngestQueueFull("Event buffer is full")
+        for event in events: # No await in between, so nothing else can take the room
+            self._queue.put_nowait(event)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            self._space.set()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                # Take whatever is already queued without waiting, then wait out the interval
+                try:
+                    event = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                self._space.set()
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Never let one batch end the writer: the buffer would fill and every submit fail
+                print(f"Error flushing {len(batch)} events, dropping them: {e}")
+
+    def _documents(self, batch: list[dict]) -> tuple[list[dict], list[dict]]:
+        """(events, documents to insert), leaving out events 'to_document' can't convert."""
+        if not self._to_document:
+            return batch, batch
+        events, documents = [], []
+        for event in batch:
+            try:
+                document = self._to_document(event)
+            except Exception as e:
+                print(f"Dropping malformed event {event.get('_id')}: {e!r}")
+                continue
+            events.append(event)
+            documents.append(document)
+        return events, documents
+
+    async def _flush(self, batch: list[dict]):
+        batch, documents = self._documents(batch)
+        if not documents:
+            return
+        written = batch
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._collection.insert_many(documents, ordered=False)
+                break
+            except BulkWriteError as e:
+                # Events carry pre-assigned _ids, so duplicate-key errors mean "already written":
+                # by an earlier attempt of this flush (count them), or by an earlier delivery of a
+                # redelivered event (first attempt: don't count them again in the rollups)
+                write_errors = e.details.get("writeErrors", [])
+                errors = [err for err in write_errors if err.get("code") != 11000]
+                if errors:
+                    print(f"Error writing {len(errors)} of {len(batch)} events to MongoDB: {errors[0].get('errmsg')}")
+                failed = {err["index"] for err in write_errors if attempt == 0 or err.get("code") != 11000}
+                written = [event for index, event in enumerate(batch) if index not in failed]
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    # Decide on error handling: dead-letter queue? For now, log and drop the batch
+                    print(f"Error writing {len(batch)} events to MongoDB, dropping batch: {e}")
+                    return
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+        for callback in self._on_flush:
+            try:
+                await callback(written)
+            except Exception as e:
+                print(f"Error in ingest flush callback: {e}")
@@ -1,11 +1,29 @@
 # services/analytics-service/main.py
-from fastapi import FastAPI, HTTPException, status, Depends
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Query, Request, status, Depends
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 from typing import Any, List, Dict
+import numpy as np
 from datetime import datetime
+from bson import ObjectId
 import motor.motor_asyncio # Async MongoDB driver
+import asyncio
+import json
 import os
+import sys
 from contextlib import asynccontextmanager
+from pymongo import monitoring
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")) # Shared metrics/timing
+from metrics import Histogram, render_metrics
+import admission # Per-client rate limits, per-route concurrency caps, load shedding
+import responses
+import timing
+import archive
+from ingest import EventIngestor, IngestQueueFull
+from rollups import ROLLUP_COLLECTION, apply_rollups, ensure_rollup_indexes, read_event_type_totals
+from storage import ensure_event_log_storage
+import queries
+from queries import Bucket, GroupKey, Metric
 
 # --- Configuration ---
 # Use environment variables for sensitive info
@@ -13,22 +31,109 @@ MONGO_DETAILS = os.getenv("MONGO_DETAILS", "mongodb://localhost:27017") # Defaul
 # In Docker Compose, use service name: "mongodb://mongo_db:27017"
 # In real deployments, use proper connection strings with auth
 
+# Buffered ingestion: events are acknowledged right away and written in batches
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500")) # Flush when this many events are waiting...
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.25")) # ...or after this many seconds
+INGEST_MAX_BUFFER = int(os.getenv("INGEST_MAX_BUFFER", "50000")) # Bounded buffer (backpressure beyond this)
+INGEST_PUT_TIMEOUT = float(os.getenv("INGEST_PUT_TIMEOUT", "1.0")) # Seconds to wait for buffer space before 503
+MAX_EVENTS_PER_REQUEST = int(os.getenv("MAX_EVENTS_PER_REQUEST", "10000")) # Limit for POST /log-events
+
+# event_logs storage, applied idempotently at startup (see storage.py)
+EVENT_LOGS_TIME_SERIES = os.getenv("EVENT_LOGS_TIME_SERIES", "false").lower() == "true" # Only when creating the collection
+EVENT_LOGS_TS_GRANULARITY = os.getenv("EVENT_LOGS_TS_GRANULARITY", "minutes") # "seconds", "minutes" or "hours"
+EVENT_LOGS_RETENTION_DAYS = float(os.getenv("EVENT_LOGS_RETENTION_DAYS", "0")) or None # 0 = keep forever
+
+# Columnar archive for old events (see archive.py); keep retention (if any) longer than ARCHIVE_AFTER_DAYS
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "event_archive")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "0")) # Move whole days older than this out of MongoDB (0 = never)
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600")) # Seconds between archiving runs
+ARCHIVE_CACHE_MB = float(os.getenv("ARCHIVE_CACHE_MB", "256")) # Archived columns kept in memory between queries
+
+# Request timing / profiling (see services/common/timing.py)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles") # Where sampled request profiles are written
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") # X-Admin-Token for /admin/* (unset = admin endpoints disabled)
+
+# Response compression (see services/common/responses.py)
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")) # Bytes; -1 disables compression
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")) # When 'brotli' is installed
+
+# Admission control (see services/common/admission.py); callers are keyed by client address
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "200")) # Requests/second per client (0 = no rate limit)
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "400"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32")) # Concurrent requests per client (0 = unlimited)
+ADMISSION_ROUTE_CONCURRENCY = int(os.getenv("ADMISSION_ROUTE_CONCURRENCY", "64")) # Per route (0 = unlimited)
+ADMISSION_ROUTE_LIMITS = admission.parse_route_limits(os.getenv("ADMISSION_ROUTE_LIMITS", "GET /stats/events=4,GET /stats/task-completion=8,GET /stats/cycle-time=8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100")) # Requests waiting for a route slot
+ADMISSION_MAX_QUEUE_WAIT = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "0.5")) # Seconds before a waiting request is shed (503)
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER") # e.g. "X-Forwarded-For" behind a proxy
+
 # Global variable for MongoDB client and database (managed by lifespan)
 mongo_client = None
 db = None
+ingestor = EventIngestor(
+    max_buffer=INGEST_MAX_BUFFER,
+    batch_size=INGEST_BATCH_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL,
+    put_timeout=INGEST_PUT_TIMEOUT,
+)
+event_archive = archive.EventArchive(ARCHIVE_DIR, cache_bytes=int(ARCHIVE_CACHE_MB * 2**20)) # Queried whenever something has been archived (also by the CLI)
+
+# --- Mongo Command Timing ---
+MONGO_COMMAND_SECONDS = Histogram("mongo_command_seconds", "MongoDB command round trips by command")
+
+class CommandTimer(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        self._observe(event)
+
+    def _observe(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_SECONDS.observe(seconds, command=event.command_name)
+        # Lands on the request's Server-Timing only if the driver call runs in the request's context
+        timing.record("db-execute", seconds)
+
+async def archive_periodically(database):
+    while True:
+        try:
+            await archive.archive_events(database, ARCHIVE_DIR, ARCHIVE_AFTER_DAYS)
+        except Exception as e:
+            print(f"Error archiving events: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
 
 # --- Lifespan Management for DB Connection ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Connect to MongoDB
     global mongo_client, db
+    archiver = None
     print(f"Connecting to MongoDB at {MONGO_DETAILS}...")
     try:
-        mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
+        mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS, event_listeners=[CommandTimer()])
         # Ping server to verify connection early
         await mongo_client.admin.command('ping')
         db = mongo_client.analytics_db # Use a specific database name
         print("Successfully connected to MongoDB.")
+        # Declare indexes / time-series layout / retention (no-op when already in place)
+        layout = await ensure_event_log_storage(
+            db,
+            time_series=EVENT_LOGS_TIME_SERIES,
+            granularity=EVENT_LOGS_TS_GRANULARITY,
+            retention_days=EVENT_LOGS_RETENTION_DAYS,
+        )
+        await ensure_rollup_indexes(db[ROLLUP_COLLECTION])
+        ingestor.on_flush(lambda events: apply_rollups(db, events)) # Keep rollups current as batches land
+        # Collection name could be dynamic (e.g., based on year/month) or static
+        ingestor.start(db.event_logs, to_document=layout.to_document)
+        if ARCHIVE_AFTER_DAYS > 0:
+            archiver = asyncio.create_task(archive_periodically(db))
     except Exception as e:
          print(f"Error connecting to MongoDB: {e}")
          # Decide if the app should fail to start or run without DB
@@ -39,7 +144,11 @@ async def lifespan(app: FastAPI):
 
     yield # Application runs here
 
-    # Shutdown: Disconnect from MongoDB
+    # Shutdown: write out buffered events, then disconnect from MongoDB
+    if archiver is not None:
+        archiver.cancel()
+    print(f"Flushing {ingestor.pending} buffered events...")
+    await ingestor.stop()
     if mongo_client:
         print("Closing MongoDB connection.")
         mongo_client.close()
@@ -49,8 +158,35 @@ app = FastAPI(
     title="Analytics Service",
     description="Receives event logs and provides analytics data.",
     version="0.1.0",
-    lifespan=lifespan # Register the lifespan context manager
+    lifespan=lifespan, # Register the lifespan context manager
+    default_response_class=responses.FastJSONResponse
+)
+# Before instrument(), so compression time and admission queueing show up in the request's timings
+app.add_middleware(
+    responses.CompressionMiddleware,
+    minimum_size=COMPRESSION_MINIMUM_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
 )
+if ADMISSION_ENABLED:
+    app.add_middleware(
+        admission.AdmissionMiddleware,
+        controller=admission.AdmissionController(
+            "analytics-service",
+            rate=ADMISSION_RATE,
+            burst=ADMISSION_BURST,
+            max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+            route_concurrency=ADMISSION_ROUTE_CONCURRENCY,
+            route_limits=ADMISSION_ROUTE_LIMITS,
+            max_queue=ADMISSION_MAX_QUEUE,
+            max_queue_wait=ADMISSION_MAX_QUEUE_WAIT,
+        ),
+        key_func=admission.client_key_func(ADMISSION_CLIENT_HEADER),
+    )
+profiler = timing.SamplingProfiler("analytics-service", PROFILE_DIR)
+timing.instrument(app, "analytics-service", server_timing=SERVER_TIMING_ENABLED, profiler=profiler)
+# GET/PUT/DELETE /admin/profiling: profile a sample of requests for flame graphs
+app.include_router(timing.profiling_router(profiler, timing.require_admin_token(ADMIN_TOKEN)))
 
 # --- Database Dependency ---
 # Simple dependency to check if DB connection is available
@@ -60,11 +196,22 @@ async def get_database():
     return db
 
 # --- Pydantic Models ---
+# Indexes on event_logs are declared in storage.py and created at startup
 class EventLog(BaseModel):
-    event_type: str = Field(..., index=True) # e.g., "task_created", "user_login", "task_completed"
-    user_id: str | None = Field(None, index=True)
+    event_type: str = Field(...) # e.g., "task_created", "user_login", "task_completed"
+    user_id: str | None = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     details: Dict[str, Any] | None = None # Flexible dictionary for event-specific data
+    # Optional idempotency key from the producer (e.g. the task-service outbox). It becomes the
+    # document _id, so a redelivered event is stored once (regular layout; time-series collections
+    # have no unique _id index, so there duplicates are kept).
+    event_id: str | None = Field(None, max_length=64)
+
+def to_event_document(event: EventLog) -> dict:
+    document = event.model_dump()
+    # Assigned here so we can return it before the write happens
+    document["_id"] = document.pop("event_id") or ObjectId()
+    return document
 
 # --- API Endpoints ---
 @app.post("/log-event", status_code=status.HTTP_202_ACCEPTED)
@@ -72,47 +219,229 @@ async def log_event(
     event: EventLog,
     database = Depends(get_database) # Inject DB dependency
 ):
-    """Receives an event and logs it to MongoDB."""
+    """Receives an event and queues it for a batched write to MongoDB."""
+    document = to_event_document(event)
+    await enqueue_events([document])
+    return {"message": "Event accepted for logging", "id": str(document["_id"])}
+
+
+@app.post("/log-events", status_code=status.HTTP_202_ACCEPTED)
+async def log_events(
+    request: Request,
+    database = Depends(get_database)
+):
+    """
+    Bulk ingestion: accepts a JSON array of events, or NDJSON (one event per line)
+    with Content-Type: application/x-ndjson. Valid events are queued; invalid ones are reported.
+    """
+    documents, errors = [], []
+    rejected = 0
+
+    def accept(index: int, raw):
+        nonlocal rejected
+        try:
+            document = to_event_document(EventLog.model_validate(raw))
+        except ValidationError as e:
+            rejected += 1
+            if len(errors) < 100: # Don't echo back thousands of errors
+                errors.append({"index": index, "error": e.errors(include_url=False)})
+            return
+        documents.append(document)
+
+    if "ndjson" in request.headers.get("content-type", ""):
+        # Parse the stream line by line instead of buffering the whole body first
+        index, buffer = 0, b""
+        async for chunk in request.stream():
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    check_request_size(index + 1)
+                    accept(index, parse_json_line(line))
+                    index += 1
+        if buffer.strip():
+            check_request_size(index + 1)
+            accept(index, parse_json_line(buffer))
+    else:
+        try:
+            raw_events = json.loads(await request.body())
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(raw_events, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of events")
+        check_request_size(len(raw_events))
+        for index, raw in enumerate(raw_events):
+            accept(index, raw)
+
+    await enqueue_events(documents)
+    return {"accepted": len(documents), "rejected": rejected, "errors": errors}
+
+
+def parse_json_line(line: bytes):
     try:
-        # Collection name could be dynamic (e.g., based on year/month) or static
-        collection = database.event_logs
-        result = await collection.insert_one(event.model_dump())
-        # Return confirmation or the ID of the inserted document
-        return {"message": "Event logged successfully", "id": str(result.inserted_id)}
-    except Exception as e:
-         print(f"Error logging event to MongoDB: {e}")
-         # Decide on error handling: retry? dead-letter queue? just log?
-         # For now, raise an internal server error
-         raise HTTPException(status_code=500, detail="Failed to log event")
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return line.decode(errors="replace") # Not an object, so it fails EventLog validation and is reported
+
+def check_request_size(count: int):
+    if count > MAX_EVENTS_PER_REQUEST:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many events in one request (max {MAX_EVENTS_PER_REQUEST})",
+        )
+
+async def enqueue_events(documents: list[dict]):
+    try:
+        await ingestor.submit_many(documents)
+    except IngestQueueFull as e:
+        # Backpressure: ask the producer to slow down instead of buffering without bound.
+        # Nothing from this request was queued, so retrying all of it doesn't duplicate events.
+        raise HTTPException(status_code=503, detail=f"Failed to log events, none were accepted: {e}", headers={"Retry-After": "1"})
 
 
 @app.get("/stats/task-completion", response_model=Dict[str, Any])
 async def get_task_completion_stats(database = Depends(get_database)):
-    """Example endpoint to calculate some simple stats."""
-    # --- !!! Placeholder - Requires Aggregation Query !!! ---
-    # This is where you'd write a MongoDB aggregation pipeline
-    # Example: Count tasks completed per day/week/user etc.
-    print("Calculating task completion stats (placeholder)...")
-
-    # Example: Count total events logged
+    """Task completion stats, read from pre-aggregated rollups (constant time, no event_logs scan)."""
+    # Rollups are updated as events are ingested; rebuild them with: python rollups.py rebuild
     try:
-        collection = database.event_logs
-        total_events = await collection.count_documents({})
-        completed_tasks_count = await collection.count_documents({"event_type": "task_completed"})
-
-        # Add more complex aggregation pipelines here later
-        # pipeline = [ { '$match': { 'event_type': 'task_completed' } }, ... ]
-        # results = await collection.aggregate(pipeline).to_list(length=None)
-
-        return {
-            "total_events_logged": total_events,
-            "completed_tasks_count": completed_tasks_count,
-            "detail": "More detailed stats require implementing aggregation queries."
-        }
+        totals = await read_event_type_totals(database)
+        return responses.FastJSONResponse({
+            "total_events_logged": sum(totals.values()),
+            "completed_tasks_count": totals.get("task_completed", 0),
+            "events_by_type": totals,
+        })
     except Exception as e:
         print(f"Error retrieving stats from MongoDB: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve statistics")
 
+def check_time_range(start: datetime, end: datetime):
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'end' must be after 'start'")
+
+@app.get("/stats/events")
+async def get_event_stats(
+    start: datetime,
+    end: datetime,
+    bucket: Bucket | None = None, # Time bucket size; omit for one row per group over the whole range
+    group_by: List[GroupKey] = Query([]), # e.g. ?group_by=event_type&group_by=task_id
+    metrics: List[Metric] = Query(["count"]),
+    event_type: List[str] | None = Query(None), # Only these event types
+    user_id: str | None = None,
+    database = Depends(get_database)
+):
+    """
+    Event counts / distinct users over [start, end), grouped by time bucket and keys.
+    Aggregated in MongoDB and streamed back as NDJSON, one row per group. Archived days are
+    aggregated from the columnar archive and merged in.
+    """
+    check_time_range(start, end)
+    archived_until = event_archive.archived_until()
+    if archived_until is not None and archive.to_ms(start) < archive.to_ms(archived_until):
+        return await get_merged_event_stats(start, end, archived_until, bucket, group_by, metrics, event_type, user_id, database)
+    pipeline = queries.event_stats_pipeline(start, end, bucket, group_by, metrics, event_type, user_id)
+    cursor = database.event_logs.aggregate(pipeline, allowDiskUse=True, batchSize=queries.FETCH_BATCH_SIZE)
+
+    async def rows():
+        lines = []
+        async for doc in cursor:
+            lines.append(responses.dumps(doc))
+            if len(lines) >= 1000:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+async def get_merged_event_stats(start, end, archived_until, bucket, group_by, metrics, event_type, user_id, database):
+    keys = [*dict.fromkeys(group_by), *(["bucket"] if bucket else [])] # Output order of event_stats_pipeline()
+    documents = []
+    if archive.to_ms(end) > archive.to_ms(archived_until):
+        # Distinct counts don't add up across the two sides, so MongoDB reports users per group too
+        hot_group_by = [*group_by, "user_id"] if "distinct_users" in metrics and "user_id" not in group_by else group_by
+        pipeline = queries.event_stats_pipeline(archived_until, end, bucket, hot_group_by, ["count"], event_type, user_id)
+        try:
+            documents = await database.event_logs.aggregate(pipeline, allowDiskUse=True, batchSize=queries.FETCH_BATCH_SIZE).to_list(length=None)
+        except Exception as e:
+            print(f"Error retrieving event stats from MongoDB: {e}")
+            raise HTTPException(status_code=500, detail="Failed to retrieve statistics")
+    with timing.phase("archive"):
+        rows = await asyncio.to_thread(event_archive.event_stats, start, end, bucket, keys, metrics, event_type, user_id, documents)
+    with timing.phase("serialise"):
+        body = b"".join(responses.dumps(row) + b"\n" for row in rows)
+    return Response(body, media_type="application/x-ndjson")
+
+
+@app.get("/stats/cycle-time", response_model=Dict[str, Any])
+async def get_cycle_time_stats(
+    start: datetime,
+    end: datetime,
+    bucket: Bucket | None = None, # Bucket by completion time
+    percentiles: List[float] = Query([50, 90, 95, 99]),
+    bins: int = Query(20, ge=1, le=200), # Histogram bins
+    database = Depends(get_database)
+):
+    """Created->completed cycle time (seconds) for tasks completed in [start, end): percentiles and histogram."""
+    check_time_range(start, end)
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+    archived_until = event_archive.archived_until()
+    if archived_until is not None:
+        # Creations may be archived even when the range isn't, so the archive always takes part
+        seconds, completed = await get_merged_cycle_times(start, end, archived_until, database)
+        if bucket is None:
+            return responses.FastJSONResponse(queries.summarize_durations(seconds, percentiles, bins))
+        buckets = archive.bucket_starts(completed, bucket).astype("datetime64[ms]")
+        return responses.FastJSONResponse({"buckets": queries.summarize_by_bucket(buckets, seconds, percentiles, bins)})
+    try:
+        columns = await queries.fetch_task_times(database.event_logs, start, end, bucket)
+    except Exception as e:
+        print(f"Error retrieving cycle times from MongoDB: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve statistics")
+
+    seconds, known = queries.cycle_seconds(columns["created"], columns["completed"])
+    # Our own numbers: rendered directly (numpy values included), no response_model pass
+    if bucket is None:
+        return responses.FastJSONResponse(queries.summarize_durations(seconds, percentiles, bins))
+    buckets = np.array(columns["bucket"], dtype="datetime64[ms]")[known]
+    return responses.FastJSONResponse({"buckets": queries.summarize_by_bucket(buckets, seconds, percentiles, bins)})
+
+async def get_merged_cycle_times(start, end, archived_until, database):
+    completions, hot = [], {"_id": [], "completed": []}
+    if archive.to_ms(end) > archive.to_ms(archived_until):
+        try:
+            cursor = database.event_logs.aggregate(
+                queries.completions_pipeline(max(start, archived_until, key=archive.to_ms), end), allowDiskUse=True, batchSize=queries.FETCH_BATCH_SIZE
+            )
+            hot = await queries.fetch_columns(cursor, ["_id", "completed"])
+        except Exception as e:
+            print(f"Error retrieving cycle times from MongoDB: {e}")
+            raise HTTPException(status_code=500, detail="Failed to retrieve statistics")
+        completions.append(queries.task_time_arrays(hot["_id"], hot["completed"]))
+    with timing.phase("archive"):
+        completions.append(await asyncio.to_thread(event_archive.completions, start, end))
+    task_ids = np.unique(np.concatenate([ids for ids, _ in completions]))
+    unarchived_ids = [task_id for task_id in hot["_id"] if not queries.archived_id(task_id)] # Only ever in MongoDB
+
+    # Tasks may have been created long before 'start', so creations are looked up on both sides
+    try:
+        created = await queries.fetch_creations(database.event_logs, task_ids.tolist() + unarchived_ids, end)
+    except Exception as e:
+        print(f"Error retrieving cycle times from MongoDB: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve statistics")
+    creations = [queries.task_time_arrays(list(created), list(created.values()))]
+    with timing.phase("archive"):
+        creations.append(await asyncio.to_thread(event_archive.creations, task_ids, end))
+        seconds, completed = queries.merge_cycle_times(completions, creations)
+    if not unarchived_ids:
+        return seconds, completed
+    unarchived_seconds, unarchived_completed = queries.unarchived_cycle_times(hot["_id"], hot["completed"], created)
+    return np.concatenate([seconds, unarchived_seconds]), np.concatenate([completed, unarchived_completed])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint (request/phase latencies, Mongo command times)."""
+    return render_metrics()
+
 @app.get("/health")
 async def health_check(database = Depends(get_database)):
     """Basic health check including DB connection."""
@@ -0,0 +1,211 @@
+# services/analytics-service/queries.py
+# Ranged, grouped analytics queries. Filtering and grouping run server-side as
+# aggregation pipelines; percentiles/histograms are computed with numpy over whole arrays.
+from datetime import datetime
+from typing import Literal
+
+import numpy as np
+
+import storage
+
+Bucket = Literal["minute", "hour", "day", "week", "month"]
+GroupKey = Literal["event_type", "user_id", "task_id"]
+Metric = Literal["count", "distinct_users"]
+
+FETCH_BATCH_SIZE = 10000 # Documents pulled per cursor round trip
+
+
+def _path(name: str) -> str:
+    if name == "task_id":
+        return "$details.task_id"
+    return f"${storage.layout.field(name)}"
+
+def _match(start: datetime, end: datetime, event_types: list[str] | None, user_id: str | None) -> dict:
+    match = {"timestamp": {"$gte": start, "$lt": end}} # Served by the (field, timestamp) indexes
+    if event_types:
+        match[storage.layout.field("event_type")] = {"$in": event_types}
+    if user_id is not None:
+        match[storage.layout.field("user_id")] = user_id
+    return match
+
+
+def event_stats_pipeline(
+    start: datetime,
+    end: datetime,
+    bucket: Bucket | None,
+    group_by: list[GroupKey],
+    metrics: list[Metric],
+    event_types: list[str] | None = None,
+    user_id: str | None = None,
+) -> list[dict]:
+    """One output document per (bucket, group keys) with the requested metrics."""
+    keys = {key: _path(key) for key in group_by}
+    if bucket is not None:
+        keys["bucket"] = {"$dateTrunc": {"date": "$timestamp", "unit": bucket}}
+
+    pipeline = [{"$match": _match(start, end, event_types, user_id)}]
+    if "distinct_users" in metrics and "user_id" not in group_by:
+        # Two-stage group instead of $addToSet, so memory doesn't grow with the number of users per group
+        pipeline += [
+            {"$group": {"_id": {**keys, "_user": _path("user_id")}, "count": {"$sum": 1}}},
+            {"$group": {
+                "_id": {key: f"$_id.{key}" for key in keys},
+                "count": {"$sum": "$count"},
+                "distinct_users": {"$sum": {"$cond": [{"$eq": ["$_id._user", None]}, 0, 1]}},
+            }},
+        ]
+    else:
+        group = {"_id": keys, "count": {"$sum": 1}}
+        if "distinct_users" in metrics:
+            group["distinct_users"] = {"$max": {"$cond": [{"$eq": [_path("user_id"), None]}, 0, 1]}} # Grouped by user
+        pipeline.append({"$group": group})
+
+    projection = {"_id": 0, **{key: f"$_id.{key}" for key in keys}}
+    for metric in metrics:
+        projection[metric] = 1
+    pipeline.append({"$project": projection})
+    if bucket is not None:
+        pipeline.append({"$sort": {"bucket": 1}})
+    return pipeline
+
+
+def completions_pipeline(start: datetime, end: datetime, bucket: Bucket | None = None) -> list[dict]:
+    """Last completion per task completed in [start, end): bounded by the range, not by history."""
+    pipeline = [
+        {"$match": {
+            storage.layout.field("event_type"): "task_completed",
+            "timestamp": {"$gte": start, "$lt": end}, # Served by the (event_type, timestamp) index
+            "details.task_id": {"$ne": None},
+        }},
+        {"$group": {"_id": "$details.task_id", "completed": {"$max": "$timestamp"}}},
+    ]
+    if bucket is not None:
+        pipeline.append({"$addFields": {"bucket": {"$dateTrunc": {"date": "$completed", "unit": bucket}}}})
+    return pipeline
+
+def creations_pipeline(task_ids: list, end: datetime) -> list[dict]:
+    """First creation before 'end' of each of 'task_ids' (served by the details.task_id index)."""
+    return [
+        {"$match": {
+            "details.task_id": {"$in": task_ids},
+            storage.layout.field("event_type"): "task_created",
+            "timestamp": {"$lt": end},
+        }},
+        {"$group": {"_id": "$details.task_id", "created": {"$min": "$timestamp"}}},
+    ]
+
+
+async def fetch_columns(cursor, fields: list[str]) -> dict[str, list]:
+    """Drain a cursor in large batches into per-field lists (column form, ready for numpy)."""
+    columns = {field: [] for field in fields}
+    while True:
+        batch = await cursor.to_list(length=FETCH_BATCH_SIZE)
+        if not batch:
+            return columns
+        for field in fields:
+            columns[field].extend(doc.get(field) for doc in batch)
+
+async def fetch_creations(collection, task_ids: list, end: datetime) -> dict:
+    """task id -> first creation before 'end', for 'task_ids', FETCH_BATCH_SIZE ids per query."""
+    created = {}
+    for offset in range(0, len(task_ids), FETCH_BATCH_SIZE):
+        cursor = collection.aggregate(creations_pipeline(task_ids[offset:offset + FETCH_BATCH_SIZE], end), batchSize=FETCH_BATCH_SIZE)
+        async for doc in cursor:
+            created[doc["_id"]] = doc["created"]
+    return created
+
+async def fetch_task_times(collection, start: datetime, end: datetime, bucket: Bucket | None = None) -> dict[str, list]:
+    """
+    Columns task_id, completed, created (None when not found) and, with 'bucket', bucket for the
+    tasks completed in [start, end). Completions are matched first; creations are then looked up
+    for just those task ids.
+    """
+    fields = ["_id", "completed", "bucket"] if bucket else ["_id", "completed"]
+    columns = await fetch_columns(
+        collection.aggregate(completions_pipeline(start, end, bucket), allowDiskUse=True, batchSize=FETCH_BATCH_SIZE), fields
+    )
+    task_ids = columns.pop("_id")
+    created = await fetch_creations(collection, task_ids, end)
+    return {"task_id": task_ids, "created": [created.get(task_id) for task_id in task_ids], **columns}
+
+def cycle_seconds(created: list, completed: list) -> tuple[np.ndarray, np.ndarray]:
+    """Created->completed seconds for tasks with a known creation, and the mask of those tasks."""
+    created = np.array(created, dtype="datetime64[ms]") # None -> NaT
+    completed = np.array(completed, dtype="datetime64[ms]")
+    known = ~np.isnat(created)
+    return (completed[known] - created[known]).astype(np.int64) / 1000.0, known
+
+
+# --- Merging with the archive ---
+# Ranges before archive.archived_until() are answered from the columnar archive, the rest from
+# MongoDB (event stats are merged in EventArchive.event_stats()). Creations are looked up on both
+# sides, for just the tasks completed in the range. The archive only holds integer task ids;
+# tasks with other ids are answered from MongoDB alone (unarchived_cycle_times()).
+INT64_MIN, INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+def archived_id(task_id) -> bool:
+    """Whether the archive can hold this task id (see archive.MISSING_TASK_ID)."""
+    return isinstance(task_id, int) and not isinstance(task_id, bool)
+
+def task_time_arrays(task_ids: list, times: list) -> tuple[np.ndarray, np.ndarray]:
+    """(task ids, timestamps in ms) as int64 arrays from MongoDB values, for the integer task ids."""
+    keep = [index for index, task_id in enumerate(task_ids) if archived_id(task_id)]
+    return (
+        np.array([task_ids[index] for index in keep], dtype=np.int64),
+        np.array([times[index] for index in keep], dtype="datetime64[ms]").astype(np.int64),
+    )
+
+def merge_cycle_times(completions: list[tuple[np.ndarray, np.ndarray]], creations: list[tuple[np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Cycle times from (task ids, timestamps in ms) of completions and creations gathered from the
+    archive and MongoDB: per task, first creation to last completion; tasks without a known
+    creation are left out. Returns (seconds, completion times in ms).
+    """
+    tasks, index = np.unique(np.concatenate([ids for ids, _ in completions]), return_inverse=True)
+    completed = np.full(tasks.size, INT64_MIN, dtype=np.int64)
+    np.maximum.at(completed, index, np.concatenate([times for _, times in completions]))
+    created_ids = np.concatenate([ids for ids, _ in creations])
+    created_ms = np.concatenate([times for _, times in creations])
+    position = np.minimum(np.searchsorted(tasks, created_ids), max(tasks.size - 1, 0))
+    known = tasks[position] == created_ids if tasks.size else np.zeros(created_ids.size, dtype=bool)
+    created = np.full(tasks.size, INT64_MAX, dtype=np.int64)
+    np.minimum.at(created, position[known], created_ms[known])
+    done = created != INT64_MAX
+    return (completed[done] - created[done]) / 1000.0, completed[done]
+
+def unarchived_cycle_times(task_ids: list, completed: list, created: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Cycle times of the tasks in MongoDB completions ('task_ids', 'completed') whose ids the archive
+    can't hold, given their creations from MongoDB ('created', task id -> time), as in the
+    MongoDB-only path. Returns (seconds, completion times in ms) like merge_cycle_times().
+    """
+    keep = [index for index, task_id in enumerate(task_ids) if not archived_id(task_id)]
+    completed = [completed[index] for index in keep]
+    seconds, known = cycle_seconds([created.get(task_ids[index]) for index in keep], completed)
+    return seconds, np.array(completed, dtype="datetime64[ms]").astype(np.int64)[known]
+
+
+def summarize_durations(seconds: np.ndarray, percentiles: list[float], bins: int) -> dict:
+    if seconds.size == 0:
+        return {"count": 0, "percentiles": {}, "histogram": {"edges": [], "counts": []}}
+    values = np.percentile(seconds, percentiles)
+    counts, edges = np.histogram(seconds, bins=bins)
+    return {
+        "count": int(seconds.size),
+        "mean": float(seconds.mean()),
+        "percentiles": {f"p{p:g}": float(v) for p, v in zip(percentiles, values)},
+        "histogram": {"edges": edges.tolist(), "counts": counts.tolist()},
+    }
+
+def summarize_by_bucket(buckets: list, seconds: np.ndarray, percentiles: list[float], bins: int) -> list[dict]:
+    """Per-bucket summaries: sort once by bucket, then split into contiguous runs (no per-document loop)."""
+    if seconds.size == 0:
+        return []
+    keys = np.array(buckets, dtype="datetime64[ms]")
+    order = np.argsort(keys, kind="stable")
+    keys, seconds = keys[order], seconds[order]
+    unique, starts = np.unique(keys, return_index=True)
+    return [
+        {"bucket": bucket.astype(datetime).isoformat(), **summarize_durations(group, percentiles, bins)}
+        for bucket, group in zip(unique, np.split(seconds, starts[1:]))
+    ]
@@ -0,0 +1,228 @@
+# services/analytics-service/rollups.py
+# Pre-aggregated event counts, so stats endpoints never scan event_logs.
+#
+# One document per (granularity, bucket, event_type, user_id):
+#   {"granularity": "hour" | "day" | "all", "bucket": <bucket start or None>,
+#    "event_type": ..., "user_id": ... (None for the "all" level), "count": n}
+# "hour"/"day" are per user; "all" is the all-time total per event type, so global
+# counts are a handful of small reads regardless of how many events exist. Counts outlive
+# the events: archived or expired events stay counted, rebuilds included.
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, UpdateOne
+
+from archive import archive_lock, finish_interrupted_run
+from storage import EventLogLayout, detect_event_log_layout
+
+ROLLUP_COLLECTION = "event_rollups"
+GRANULARITIES = ("hour", "day")
+
+
+def _bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None) # MongoDB stores naive UTC
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rollup_keys(event: dict):
+    event_type, user_id = event["event_type"], event.get("user_id")
+    for granularity in GRANULARITIES:
+        yield (granularity, _bucket_start(event["timestamp"], granularity), event_type, user_id)
+    yield ("all", None, event_type, None)
+
+
+async def ensure_rollup_indexes(collection):
+    # Unique key for the upserts (and for $merge during rebuilds); also serves
+    # range reads by granularity/event_type/bucket
+    await collection.create_index(
+        [("granularity", ASCENDING), ("event_type", ASCENDING), ("bucket", ASCENDING), ("user_id", ASCENDING)],
+        unique=True,
+        name="rollup_key",
+    )
+
+async def apply_rollups(database, events: list[dict]):
+    """Fold a batch of newly written events into the rollups with one unordered bulk_write of $inc upserts."""
+    counts = Counter(key for event in events for key in rollup_keys(event))
+    if not counts:
+        return
+    operations = [
+        UpdateOne(
+            {"granularity": granularity, "bucket": bucket, "event_type": event_type, "user_id": user_id},
+            {"$inc": {"count": count}},
+            upsert=True,
+        )
+        for (granularity, bucket, event_type, user_id), count in counts.items()
+    ]
+    await database[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+async def read_event_type_totals(database) -> dict[str, int]:
+    """All-time event counts per event_type, read from the "all" rollup level."""
+    cursor = database[ROLLUP_COLLECTION].find({"granularity": "all"}, {"_id": 0, "event_type": 1, "count": 1})
+    return {doc["event_type"]: doc["count"] async for doc in cursor}
+
+
+# --- Rebuild / Backfill ---
+ROLLUP_KEY = ["granularity", "event_type", "bucket", "user_id"]
+REBUILD_BATCH_SIZE = 10000 # Upserts per bulk_write when folding in archived counts
+
+def _rebuild_pipeline(granularity: str, target: str, layout: EventLogLayout, since: datetime) -> list[dict]:
+    return [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {
+            "_id": {
+                "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": granularity}},
+                "event_type": f"${layout.field('event_type')}",
+                "user_id": {"$ifNull": [f"${layout.field('user_id')}", None]},
+            },
+            "count": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "granularity": {"$literal": granularity},
+            "bucket": "$_id.bucket",
+            "event_type": "$_id.event_type",
+            "user_id": "$_id.user_id",
+            "count": 1,
+        }},
+        {"$merge": {"into": target, "on": ROLLUP_KEY, "whenMatched": "replace"}},
+    ]
+
+def _totals_pipeline(target: str) -> list[dict]:
+    # The "all" level is the sum of the days, which also covers days whose events are gone
+    return [
+        {"$match": {"granularity": "day"}},
+        {"$group": {"_id": "$event_type", "count": {"$sum": "$count"}}},
+        {"$project": {
+            "_id": 0,
+            "granularity": {"$literal": "all"},
+            "bucket": {"$literal": None},
+            "event_type": "$_id",
+            "user_id": {"$literal": None},
+            "count": 1,
+        }},
+        {"$merge": {"into": target, "on": ROLLUP_KEY, "whenMatched": "replace"}},
+    ]
+
+async def _count_on_record(database, event_archive, start: datetime, end: datetime) -> int:
+    """Events in [start, end) that can still be counted: archived ones, then event_logs from archived_until on."""
+    archived_until = event_archive.archived_until() if event_archive is not None else None
+    count = 0
+    if archived_until is not None and start < archived_until:
+        rows = await asyncio.to_thread(event_archive.event_stats, start, min(end, archived_until), None, [], ["count"])
+        count += sum(row["count"] for row in rows)
+    since = max(start, archived_until) if archived_until is not None else start
+    if since < end:
+        count += await database.event_logs.count_documents({"timestamp": {"$gte": since, "$lt": end}})
+    return count
+
+async def _counted(database, day: datetime) -> int:
+    counted = await database[ROLLUP_COLLECTION].aggregate([
+        {"$match": {"granularity": "day", "bucket": day}},
+        {"$group": {"_id": None, "count": {"$sum": "$count"}}},
+    ]).to_list(length=1)
+    return counted[0]["count"] if counted else 0
+
+async def _ranges_on_record(database, event_archive) -> list[tuple[datetime, datetime | None]]:
+    """
+    [start, end) ranges whose events are all still on record, to recount: the archive (from its
+    first day), and event_logs from the day of its oldest event on (end None). Everything else
+    lost events to the retention TTL, so its rollups are kept; so is a range's first day when it
+    has fewer events left than were counted.
+    """
+    ranges = []
+    archived_until = event_archive.archived_until() if event_archive is not None else None
+    if archived_until is not None and event_archive.first_day() is not None:
+        ranges.append((event_archive.first_day(), archived_until))
+    since = {"timestamp": {"$gte": archived_until}} if archived_until is not None else {}
+    oldest = await database.event_logs.find(since, {"timestamp": 1}).sort("timestamp", ASCENDING).limit(1).to_list(length=1)
+    if oldest:
+        ranges.append((_bucket_start(oldest[0]["timestamp"], "day"), None))
+
+    complete = []
+    for start, end in ranges:
+        next_day = start + timedelta(days=1)
+        if await _counted(database, start) > await _count_on_record(database, event_archive, start, next_day):
+            start = next_day
+        if end is None or start < end:
+            complete.append((start, end))
+    return complete
+
+async def rebuild_rollups(database, event_archive=None):
+    """
+    Recompute the rollups from raw events, then swap the result in: archived days from
+    'event_archive' (an archive.EventArchive), the rest from event_logs. Buckets whose events are
+    no longer all on record keep their current counts instead of being dropped, and "all" is
+    summed from the days. Events ingested while this runs may be missed, and late events for
+    archived days count once archiving has moved them; rerun when traffic is quiet.
+    """
+    if event_archive is None:
+        await _rebuild(database, None)
+        return
+    with archive_lock(event_archive.root) as locked:
+        if not locked:
+            raise RuntimeError(f"Archiving is running in {event_archive.root}; rebuild the rollups once it has finished")
+        await finish_interrupted_run(database, event_archive.root) # Or its undeleted events would count twice
+        await _rebuild(database, event_archive)
+
+async def _rebuild(database, event_archive):
+    staging = f"{ROLLUP_COLLECTION}_rebuild"
+    layout = await detect_event_log_layout(database)
+    ranges = await _ranges_on_record(database, event_archive)
+    await database[staging].drop()
+    await ensure_rollup_indexes(database[staging]) # $merge "on" fields need a unique index
+
+    # Buckets with nothing left to recount (all of them, if no events are on record)
+    kept = {"granularity": {"$in": list(GRANULARITIES)}}
+    if ranges:
+        kept["$nor"] = [{"bucket": {"$gte": start, **({"$lt": end} if end is not None else {})}} for start, end in ranges]
+    await database[ROLLUP_COLLECTION].aggregate([
+        {"$match": kept},
+        {"$project": {"_id": 0}},
+        {"$merge": {"into": staging, "on": ROLLUP_KEY, "whenMatched": "replace"}},
+    ]).to_list(length=None)
+
+    for granularity in GRANULARITIES:
+        # event_logs first: its $merge replaces buckets that the archive's $inc then adds to, where
+        # archived_until falls inside a bucket
+        for start, end in sorted(ranges, key=lambda range_: range_[1] is not None):
+            if end is None:
+                await database.event_logs.aggregate(_rebuild_pipeline(granularity, staging, layout, start), allowDiskUse=True).to_list(length=None)
+                continue
+            rows = await asyncio.to_thread(event_archive.event_stats, start, end, granularity, ["event_type", "user_id", "bucket"], ["count"])
+            operations = [
+                UpdateOne(
+                    {"granularity": granularity, "bucket": row["bucket"], "event_type": row["event_type"], "user_id": row["user_id"]},
+                    {"$inc": {"count": row["count"]}},
+                    upsert=True,
+                )
+                for row in rows
+            ]
+            for offset in range(0, len(operations), REBUILD_BATCH_SIZE):
+                await database[staging].bulk_write(operations[offset:offset + REBUILD_BATCH_SIZE], ordered=False)
+        print(f"Rebuilt '{granularity}' rollups.")
+    await database[staging].aggregate(_totals_pipeline(staging)).to_list(length=None)
+    print("Rebuilt 'all' rollups.")
+    await database[staging].rename(ROLLUP_COLLECTION, dropTarget=True)
+
+
+async def _main():
+    import motor.motor_asyncio
+    from main import MONGO_DETAILS, event_archive
+
+    parser = argparse.ArgumentParser(description="Maintain analytics rollups.")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute all rollups from event_logs and the archive")
+    parser.parse_args()
+
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
+    try:
+        await rebuild_rollups(client.analytics_db, event_archive)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    # Usage (from services/analytics-service): python rollups.py rebuild
+    asyncio.run(_main())
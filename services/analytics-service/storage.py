@@ -0,0 +1,123 @@
+# services/analytics-service/storage.py
+# Declares the event_logs collection (indexes, optional time-series layout, retention)
+# and applies it idempotently at startup.
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+EVENT_LOGS = "event_logs"
+META_FIELDS = ("event_type", "user_id") # Stored under "meta" in a time-series collection
+TTL_INDEX_NAME = "timestamp_ttl"
+
+# Query indexes for a regular collection. Time-series collections get an automatic
+# (meta, timestamp) clustered index, so the equivalent there is on meta.* fields.
+EVENT_LOG_INDEXES = [
+    IndexModel([("event_type", ASCENDING), ("timestamp", DESCENDING)], name="event_type_timestamp"),
+    IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_id_timestamp"),
+    # Whole-range scans by time (archiving old days); descending so it can coexist with the TTL index
+    IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+    # Creation lookups for the tasks completed in a range (cycle times)
+    IndexModel([("details.task_id", ASCENDING), ("timestamp", ASCENDING)], name="task_id_timestamp"),
+]
+TIME_SERIES_INDEXES = [
+    IndexModel([("meta.event_type", ASCENDING), ("timestamp", DESCENDING)], name="event_type_timestamp"),
+    IndexModel([("meta.user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_id_timestamp"),
+    IndexModel([("details.task_id", ASCENDING), ("timestamp", ASCENDING)], name="task_id_timestamp"), # Secondary index on a measurement field
+]
+
+
+class EventLogLayout:
+    """Where event fields live: top level in a regular collection, under 'meta' in a time-series one."""
+
+    def __init__(self, time_series: bool = False):
+        self.time_series = time_series
+
+    def field(self, name: str) -> str:
+        """Document path for an EventLog field, for use in filters and pipelines."""
+        if self.time_series and name in META_FIELDS:
+            return f"meta.{name}"
+        return name
+
+    def to_document(self, event: dict) -> dict:
+        if not self.time_series:
+            return event
+        document = {key: value for key, value in event.items() if key not in META_FIELDS}
+        document["meta"] = {name: event.get(name) for name in META_FIELDS}
+        return document
+
+    def from_document(self, document: dict) -> dict:
+        if not self.time_series or "meta" not in document:
+            return document
+        event = {key: value for key, value in document.items() if key != "meta"}
+        event.update(document["meta"])
+        return event
+
+
+# Replaced by ensure_event_log_storage() at startup; read it at call time (storage.layout)
+layout = EventLogLayout()
+
+
+async def _collection_info(database) -> dict | None:
+    cursor = await database.list_collections(filter={"name": EVENT_LOGS}) # A coroutine in Motor, not a cursor
+    async for info in cursor:
+        return info
+    return None
+
+async def detect_event_log_layout(database) -> EventLogLayout:
+    """Layout of the existing event_logs collection (regular if it doesn't exist yet)."""
+    info = await _collection_info(database)
+    return EventLogLayout(time_series=info is not None and info.get("type") == "timeseries")
+
+
+async def ensure_event_log_storage(database, time_series: bool, granularity: str, retention_days: float | None) -> EventLogLayout:
+    """Create event_logs (and its indexes/retention) if needed. Safe to run on every startup."""
+    global layout
+    retention_seconds = int(retention_days * 86400) if retention_days else None
+    info = await _collection_info(database)
+    existing = EventLogLayout(time_series=info is not None and info.get("type") == "timeseries")
+
+    if info is None and time_series:
+        options = {"timeseries": {"timeField": "timestamp", "metaField": "meta", "granularity": granularity}}
+        if retention_seconds:
+            options["expireAfterSeconds"] = retention_seconds
+        await database.create_collection(EVENT_LOGS, **options)
+        existing = EventLogLayout(time_series=True)
+        print(f"Created time-series collection '{EVENT_LOGS}'.")
+    elif info is not None and time_series and not existing.time_series:
+        # A regular collection can't be converted in place; migrate the data to switch layouts
+        print(f"Warning: '{EVENT_LOGS}' already exists as a regular collection; keeping that layout.")
+
+    collection = database[EVENT_LOGS]
+    if existing.time_series:
+        await collection.create_indexes(TIME_SERIES_INDEXES)
+        # Retention on a time-series collection is a collection option, not an index
+        current = info.get("options", {}).get("expireAfterSeconds") if info else retention_seconds
+        if current != retention_seconds:
+            try:
+                await database.command({"collMod": EVENT_LOGS, "expireAfterSeconds": retention_seconds or "off"})
+            except OperationFailure as e:
+                print(f"Error updating event_logs retention: {e}")
+    else:
+        await collection.create_indexes(EVENT_LOG_INDEXES)
+        await _ensure_ttl_index(collection, retention_seconds)
+
+    layout = existing
+    return layout
+
+
+async def _ensure_ttl_index(collection, retention_seconds: int | None):
+    index_info = await collection.index_information()
+    if retention_seconds is None:
+        if TTL_INDEX_NAME in index_info:
+            await collection.drop_index(TTL_INDEX_NAME) # Retention was switched off
+        return
+    current = index_info.get(TTL_INDEX_NAME, {}).get("expireAfterSeconds")
+    if current is None:
+        await collection.create_index([("timestamp", ASCENDING)], name=TTL_INDEX_NAME, expireAfterSeconds=retention_seconds)
+    elif current != retention_seconds:
+        try:
+            await collection.database.command({
+                "collMod": collection.name,
+                "index": {"name": TTL_INDEX_NAME, "expireAfterSeconds": retention_seconds},
+            })
+        except OperationFailure as e:
+            print(f"Error updating event_logs retention: {e}")
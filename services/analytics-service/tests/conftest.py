@@ -0,0 +1,56 @@
+# services/analytics-service/tests/conftest.py
+# From services/analytics-service: python -m pytest tests
+# Needs requirements.txt, benchmarks/requirements.txt (MongoDB is its in-memory stand-in) and pytest.
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), os.path.join(HERE, "..", "..", "common"), os.path.join(HERE, "..", "..", "..", "benchmarks")]
+
+from mongomock import aggregate as mongomock_aggregate
+from mongomock_motor import AsyncMongoMockCollection
+from standins import InMemoryMongoClient
+
+
+# --- What mongomock lacks for rollup rebuilds: $dateTrunc (minute/hour/day) and $merge ---
+TRUNCATE = {
+    "minute": lambda value: value.replace(second=0, microsecond=0),
+    "hour": lambda value: value.replace(minute=0, second=0, microsecond=0),
+    "day": lambda value: value.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+_handle_date_operator = mongomock_aggregate._Parser._handle_date_operator
+
+def _date_trunc(self, operator, values):
+    if operator == "$dateTrunc":
+        return TRUNCATE[values["unit"]](self.parse(values["date"]))
+    return _handle_date_operator(self, operator, values)
+
+mongomock_aggregate.date_operators.append("$dateTrunc")
+mongomock_aggregate._Parser._handle_date_operator = _date_trunc
+
+_aggregate = AsyncMongoMockCollection.aggregate
+
+def _aggregate_with_merge(self, pipeline, *args, **kwargs):
+    if not pipeline or "$merge" not in pipeline[-1]:
+        return _aggregate(self, pipeline, *args, **kwargs)
+    spec = pipeline[-1]["$merge"]
+    collection = self._AsyncMongoMockCollection__collection
+    target = collection.database[spec["into"]]
+    for document in collection.aggregate(pipeline[:-1]):
+        document.pop("_id", None)
+        target.replace_one({key: document.get(key) for key in spec["on"]}, document, upsert=True)
+    return _aggregate(self, [{"$match": {"_id": {"$exists": False}}}]) # $merge outputs nothing
+
+AsyncMongoMockCollection.aggregate = _aggregate_with_merge
+
+
+@pytest.fixture
+def database():
+    return InMemoryMongoClient().analytics_db
+
+@pytest.fixture
+def today():
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -0,0 +1,151 @@
+# services/analytics-service/tests/test_archive.py
+import asyncio
+import random
+from collections import Counter
+from datetime import timedelta
+
+import pytest
+
+import archive
+
+EVENT_TYPES = ["task_created", "task_completed", "user_login"]
+
+
+def make_events(today, count: int, days: tuple[int, int], seed: int) -> list[dict]:
+    """'count' events spread over [today - days[1], today - days[0]) days."""
+    rnd = random.Random(seed)
+    start = today - timedelta(days=days[1])
+    return [{
+        "event_type": rnd.choice(EVENT_TYPES),
+        "timestamp": start + timedelta(milliseconds=rnd.randrange((days[1] - days[0]) * 86400000)),
+        "user_id": rnd.choice(["a", "b", None]),
+        "details": {"task_id": rnd.randrange(50)},
+    } for _ in range(count)]
+
+async def insert(database, events: list[dict]):
+    await database.event_logs.insert_many([dict(event) for event in events]) # insert_many adds _id to what it's given
+
+async def readable(database, event_archive, today) -> Counter:
+    """Events per type as the stats endpoints see them: the archive up to archived_until, MongoDB from there."""
+    until = event_archive.archived_until()
+    counts = Counter()
+    if until is not None:
+        for row in event_archive.event_stats(today - timedelta(days=400), today, None, ["event_type"], ["count"]):
+            counts[row["event_type"]] += row["count"]
+    match = {"timestamp": {"$gte": until or today - timedelta(days=400), "$lt": today}}
+    async for document in database.event_logs.aggregate([{"$match": match}, {"$group": {"_id": "$event_type", "count": {"$sum": 1}}}]):
+        counts[document["_id"]] += document["count"]
+    return counts
+
+def per_type(events: list[dict]) -> Counter:
+    return Counter(event["event_type"] for event in events)
+
+def fail_on_call(number: int, function):
+    """'function' that raises on its 'number'th call, after doing half of that call's deletes."""
+    calls = {"count": 0}
+    async def failing(self, filter, *args, **kwargs):
+        calls["count"] += 1
+        if calls["count"] == number:
+            ids = filter["_id"]["$in"]
+            await function(self, {**filter, "_id": {"$in": ids[:len(ids) // 2]}})
+            raise RuntimeError("stopped during deletes")
+        return await function(self, filter, *args, **kwargs)
+    return failing
+
+
+def test_archives_old_days_in_bounded_chunks(database, today, tmp_path):
+    events = make_events(today, 2000, (91, 94), seed=1)
+    recent = make_events(today, 100, (0, 10), seed=2)
+    asyncio.run(insert(database, events + recent))
+    event_archive = archive.EventArchive(str(tmp_path))
+
+    archived = asyncio.run(archive.archive_events(database, str(tmp_path), 90, chunk_size=300))
+
+    assert archived == len(events)
+    assert asyncio.run(database.event_logs.count_documents({})) == len(recent)
+    assert event_archive.archived_until() == today - timedelta(days=90)
+    assert asyncio.run(readable(database, event_archive, today)) == per_type(events + recent)
+    for days_ago in (92, 93, 94):
+        parts = archive.read_day_parts(str(tmp_path), today - timedelta(days=days_ago))
+        # A chunk stays within a day, holds at most 300 events and writes one part per event type
+        chunk_rows = Counter()
+        for entries in parts.values():
+            for part in entries:
+                chunk_rows[part["generation"]] += part["rows"]
+        assert len(chunk_rows) >= 3 and max(chunk_rows.values()) <= 300
+
+def test_events_sharing_a_timestamp_stay_in_one_chunk(database, today, tmp_path):
+    moment = today - timedelta(days=95, hours=3)
+    events = [{"event_type": "user_login", "timestamp": moment, "user_id": str(index)} for index in range(50)]
+    events += [{"event_type": "user_login", "timestamp": moment - timedelta(seconds=1), "user_id": None}] * 5
+    asyncio.run(insert(database, events))
+    event_archive = archive.EventArchive(str(tmp_path))
+
+    archive_run = archive.archive_events(database, str(tmp_path), 90, chunk_size=10)
+    assert asyncio.run(archive_run) == len(events)
+
+    parts = archive.read_day_parts(str(tmp_path), archive._day_start(moment))["user_login"]
+    assert [part["rows"] for part in parts] == [55] # The tenth event shares its timestamp with all but five
+    assert asyncio.run(readable(database, event_archive, today)) == per_type(events)
+
+def test_interrupted_deletes_are_finished_by_the_next_run(database, today, tmp_path, monkeypatch):
+    events = make_events(today, 3000, (95, 100), seed=3)
+    asyncio.run(insert(database, events))
+    event_archive = archive.EventArchive(str(tmp_path))
+    collection_type = type(database.event_logs)
+    monkeypatch.setattr(collection_type, "delete_many", fail_on_call(3, collection_type.delete_many))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(archive.archive_events(database, str(tmp_path), 90, chunk_size=500))
+
+    # archived_until stops inside the interrupted chunk's day; the rest is still in MongoDB
+    assert event_archive.archived_until() < today - timedelta(days=95)
+    assert asyncio.run(readable(database, event_archive, today)) == per_type(events)
+    monkeypatch.undo()
+    asyncio.run(archive.archive_events(database, str(tmp_path), 90, chunk_size=500))
+    assert asyncio.run(database.event_logs.count_documents({})) == 0
+    assert asyncio.run(readable(database, event_archive, today)) == per_type(events)
+
+def test_unrecorded_parts_are_discarded(database, today, tmp_path, monkeypatch):
+    events = make_events(today, 1000, (95, 97), seed=4)
+    asyncio.run(insert(database, events))
+    event_archive = archive.EventArchive(str(tmp_path))
+    write_manifest = archive._write_manifest
+    def failing(root, archived_until, generation, pending=None):
+        if generation == 3:
+            raise RuntimeError("stopped before the manifest")
+        write_manifest(root, archived_until, generation, pending)
+    monkeypatch.setattr(archive, "_write_manifest", failing)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(archive.archive_events(database, str(tmp_path), 90, chunk_size=400))
+
+    # The third chunk's parts are on disk, but neither read nor deleted from MongoDB
+    assert archive.read_manifest(str(tmp_path))["generation"] == 2
+    assert asyncio.run(readable(database, event_archive, today)) == per_type(events)
+    monkeypatch.undo()
+    asyncio.run(archive.archive_events(database, str(tmp_path), 90, chunk_size=400))
+    assert asyncio.run(readable(database, event_archive, today)) == per_type(events)
+    rows = sum(part["rows"] for day in (96, 97) for entries in archive.read_day_parts(str(tmp_path), today - timedelta(days=day)).values() for part in entries)
+    assert rows == len(events)
+
+def test_late_events_and_reruns_are_archived_once(database, today, tmp_path):
+    events = make_events(today, 1000, (95, 100), seed=5)
+    asyncio.run(insert(database, events))
+    event_archive = archive.EventArchive(str(tmp_path))
+    asyncio.run(archive.archive_events(database, str(tmp_path), 90))
+
+    late = make_events(today, 200, (96, 98), seed=6)
+    asyncio.run(insert(database, late))
+    assert asyncio.run(archive.archive_events(database, str(tmp_path), 90)) == len(late)
+    assert asyncio.run(archive.archive_events(database, str(tmp_path), 90)) == 0
+
+    assert asyncio.run(database.event_logs.count_documents({})) == 0
+    assert asyncio.run(readable(database, event_archive, today)) == per_type(events + late)
+
+def test_only_one_archiver_runs_per_directory(database, today, tmp_path):
+    asyncio.run(insert(database, make_events(today, 10, (95, 96), seed=7)))
+    with archive.archive_lock(str(tmp_path)) as locked:
+        assert locked
+        assert asyncio.run(archive.archive_events(database, str(tmp_path), 90)) == 0
+    assert asyncio.run(database.event_logs.count_documents({})) == 10
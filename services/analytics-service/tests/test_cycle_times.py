@@ -0,0 +1,46 @@
+# services/analytics-service/tests/test_cycle_times.py
+import asyncio
+import json
+import random
+from datetime import timedelta
+
+import pytest
+
+import archive
+import main
+from test_archive import insert
+
+
+def task_events(today, seed: int) -> list[dict]:
+    """Integer task ids spread over 60 days (some archived), plus recent tasks with string ids."""
+    rnd = random.Random(seed)
+    events = []
+    def task(task_id, created, took):
+        events.append({"event_type": "task_created", "timestamp": created, "user_id": "u", "details": {"task_id": task_id}})
+        if created + took < today:
+            events.append({"event_type": "task_completed", "timestamp": created + took, "user_id": "u", "details": {"task_id": task_id}})
+    for task_id in range(300):
+        task(task_id, today - timedelta(days=rnd.uniform(5, 60)), timedelta(days=rnd.uniform(0.1, 20)))
+    for task_id in range(40):
+        task(f"t-{task_id}", today - timedelta(days=rnd.uniform(2, 25)), timedelta(days=rnd.uniform(0.1, 3)))
+    return events
+
+
+@pytest.mark.parametrize("bucket", [None, "day"])
+def test_merged_cycle_times_match_mongodb_only(database, today, tmp_path, monkeypatch, bucket):
+    """Archiving doesn't change the answer, including for tasks whose ids the archive can't hold."""
+    monkeypatch.setattr(main, "event_archive", archive.EventArchive(str(tmp_path)))
+    ranges = [(today - timedelta(days=40), today - timedelta(days=20)), (today - timedelta(days=30), today)]
+
+    async def answers():
+        return [json.loads((await main.get_cycle_time_stats(start, end, bucket, [50, 90], 10, database)).body) for start, end in ranges]
+
+    async def scenario():
+        await insert(database, task_events(today, 5))
+        before = await answers()
+        await archive.archive_events(database, str(tmp_path), 30)
+        assert main.event_archive.archived_until() is not None
+        return before, await answers()
+
+    before, after = asyncio.run(scenario())
+    assert after == before
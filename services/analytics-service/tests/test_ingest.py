@@ -0,0 +1,46 @@
+# services/analytics-service/tests/test_ingest.py
+import asyncio
+
+from ingest import EventIngestor
+
+
+def test_a_malformed_event_is_dropped_and_the_writer_keeps_going(database):
+    def to_document(event: dict) -> dict:
+        if "event_type" not in event:
+            raise KeyError("event_type")
+        return event
+
+    async def run():
+        ingestor = EventIngestor(max_buffer=10, batch_size=5, flush_interval=0.01, put_timeout=0.1)
+        written = []
+        async def collect(events):
+            written.extend(events)
+        ingestor.on_flush(collect)
+        ingestor.start(database.event_logs, to_document=to_document)
+        await ingestor.submit_many([{"_id": 1, "event_type": "a"}, {"_id": 2}, {"_id": 3, "event_type": "b"}])
+        await asyncio.sleep(0.05)
+        await ingestor.submit({"_id": 4, "event_type": "c"}) # Accepted: the writer is still running
+        await ingestor.stop()
+        return [event["_id"] for event in written]
+
+    assert asyncio.run(run()) == [1, 3, 4]
+    assert asyncio.run(database.event_logs.count_documents({})) == 3
+
+def test_a_failing_flush_does_not_stop_the_writer(database, monkeypatch):
+    async def run():
+        ingestor = EventIngestor(max_buffer=10, batch_size=5, flush_interval=0.01, put_timeout=0.1)
+        failures = iter([RuntimeError("unexpected")])
+        flush = ingestor._flush
+        async def flaky_flush(batch):
+            for error in failures:
+                raise error
+            await flush(batch)
+        monkeypatch.setattr(ingestor, "_flush", flaky_flush)
+        ingestor.start(database.event_logs)
+        await ingestor.submit({"_id": 1, "event_type": "a"})
+        await asyncio.sleep(0.05)
+        await ingestor.submit({"_id": 2, "event_type": "a"})
+        await ingestor.stop()
+
+    asyncio.run(run())
+    assert asyncio.run(database.event_logs.distinct("_id")) == [2]
@@ -0,0 +1,59 @@
+# services/analytics-service/tests/test_rollups.py
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import archive
+import rollups
+from test_archive import fail_on_call, insert, make_events
+
+
+async def snapshot(database) -> list[tuple]:
+    documents = await database[rollups.ROLLUP_COLLECTION].find({}, {"_id": 0}).to_list(length=None)
+    return sorted((doc["granularity"], str(doc["bucket"]), doc["event_type"], str(doc["user_id"]), doc["count"]) for doc in documents)
+
+async def counted(database, events: list[dict]) -> list[tuple]:
+    await insert(database, events)
+    await rollups.apply_rollups(database, events)
+    return await snapshot(database)
+
+async def rebuilt(database, event_archive, today) -> list[tuple]:
+    # Throw some recent counts off first, so the rebuild has something to put right
+    recent = {"granularity": "hour", "bucket": {"$gte": today - timedelta(days=3)}}
+    await database[rollups.ROLLUP_COLLECTION].update_many(recent, {"$inc": {"count": 5}})
+    await rollups.rebuild_rollups(database, event_archive)
+    return await snapshot(database)
+
+
+@pytest.mark.parametrize("archived", [False, True])
+@pytest.mark.parametrize("expired", [False, True])
+def test_rebuild_keeps_counts_of_archived_and_expired_events(database, today, tmp_path, archived, expired):
+    original = asyncio.run(counted(database, make_events(today, 1000, (1, 40), seed=1)))
+    event_archive = archive.EventArchive(str(tmp_path)) if archived else None
+    if archived:
+        asyncio.run(archive.archive_events(database, str(tmp_path), 20))
+    if expired:
+        # Part-way through a day, as the retention TTL would
+        asyncio.run(database.event_logs.delete_many({"timestamp": {"$lt": today - timedelta(days=15, hours=7)}}))
+
+    assert asyncio.run(rebuilt(database, event_archive, today)) == original
+
+def test_rebuild_after_an_interrupted_archiving_run(database, today, tmp_path, monkeypatch):
+    original = asyncio.run(counted(database, make_events(today, 1000, (18, 24), seed=2)))
+    collection_type = type(database.event_logs)
+    monkeypatch.setattr(collection_type, "delete_many", fail_on_call(4, collection_type.delete_many))
+    with pytest.raises(RuntimeError):
+        asyncio.run(archive.archive_events(database, str(tmp_path), 20, chunk_size=60))
+    monkeypatch.undo()
+
+    # archived_until is inside a day and the last chunk's events are still in MongoDB too
+    archived_until = archive.EventArchive(str(tmp_path)).archived_until()
+    assert archived_until != archive._day_start(archived_until)
+    assert asyncio.run(rebuilt(database, archive.EventArchive(str(tmp_path)), today)) == original
+
+def test_rebuild_refuses_to_run_while_archiving(database, tmp_path):
+    with archive.archive_lock(str(tmp_path)) as locked:
+        assert locked
+        with pytest.raises(RuntimeError):
+            asyncio.run(rollups.rebuild_rollups(database, archive.EventArchive(str(tmp_path))))
@@ -0,0 +1,293 @@
+# services/common/admission.py
+# Admission control at the API edge, so one runaway client can't take every DB/Mongo connection:
+#  - per caller (user id, or client address where there's no login): a token bucket for the
+#    request rate and a cap on requests in flight -> 429 with Retry-After
+#  - per route: a cap on concurrent requests with a bounded FIFO queue; requests that can't get
+#    a slot within max_queue_wait are shed -> 503 with Retry-After
+# Decisions are counted on /metrics (admission_decisions_total) and queueing shows up as the
+# 'admission-queue' phase in Server-Timing.
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from metrics import Counter, Gauge, Histogram
+from timing import record
+
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Admission control decisions by service, route and outcome (admitted, rate_limited, caller_concurrency, queue_full, queue_timeout)",
+)
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "admission_queue_seconds",
+    "Time requests waited for a route slot, by service and route",
+)
+
+_controllers: list["AdmissionController"] = [] # For the gauges below
+
+def _route_gauge(attribute: str):
+    def callback():
+        for controller in _controllers:
+            for route, gate in list(controller.gates.items()):
+                yield {"service": controller.service, "route": route}, getattr(gate, attribute)
+    return callback
+
+Gauge("admission_route_in_flight", "Requests holding a route slot", _route_gauge("active"))
+Gauge("admission_route_queued", "Requests waiting for a route slot", _route_gauge("queued"))
+
+
+class Rejected:
+    __slots__ = ("status_code", "reason", "retry_after", "detail")
+
+    def __init__(self, status_code: int, reason: str, retry_after: float, detail: str):
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after # Seconds
+        self.detail = detail
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            {"detail": self.detail},
+            status_code=self.status_code,
+            headers={"Retry-After": str(max(1, math.ceil(self.retry_after)))},
+        )
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        """Take a token: 0 when there was one, else the seconds until there will be."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class RouteGate:
+    """Concurrency cap for one route. Waiters are served in arrival order; a freed slot is handed straight to the next one."""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float) -> str | None:
+        """None once a slot is held (call release() when done), else why not: 'queue_full' or 'queue_timeout'."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.max_queue or timeout <= 0:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout) # Returns if release() handed us the slot, even right at the deadline
+            return None
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release() # Handed a slot we won't use: pass it on
+            else:
+                self._discard(waiter)
+            raise
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None) # The slot moves to the waiter; 'active' stays the same
+                return
+        self.active -= 1
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+class AdmissionController:
+    """
+    Per-caller and per-route limits for one service. Caller limits: 'rate' requests/second with
+    bursts up to 'burst' (rate 0 = no rate limit) and at most 'max_in_flight' concurrent requests
+    (0 = unlimited). Route limits: 'route_concurrency' concurrent requests per route unless
+    'route_limits' says otherwise (keyed "METHOD /path/{template}", 0 = unlimited); routes in
+    'uncapped_routes' (long-lived streams) only count against the caller's rate.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        rate: float = 0.0,
+        burst: int = 1,
+        max_in_flight: int = 0,
+        route_concurrency: int = 0,
+        route_limits: dict[str, int] | None = None,
+        uncapped_routes=(),
+        max_queue: int = 100,
+        max_queue_wait: float = 0.5,
+        max_callers: int = 100000,
+    ):
+        self.service = service
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_in_flight = max_in_flight
+        self.route_concurrency = route_concurrency
+        self.route_limits = dict(route_limits or {})
+        self.uncapped_routes = set(uncapped_routes)
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.max_callers = max_callers
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict() # Least recently seen first, pruned at max_callers
+        self._in_flight: dict[str, int] = {}
+        self.gates: dict[str, RouteGate] = {}
+        _controllers.append(self)
+
+    def _gate(self, route: str) -> RouteGate | None:
+        gate = self.gates.get(route)
+        if gate is None:
+            if route in self.uncapped_routes:
+                return None
+            limit = self.route_limits.get(route, self.route_concurrency)
+            if limit <= 0:
+                return None
+            gate = self.gates[route] = RouteGate(limit, self.max_queue)
+        return gate
+
+    def _take_token(self, key: str) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+            if len(self._buckets) > self.max_callers:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(self.rate, self.burst, now)
+
+    async def admit(self, key: str, route: str | None) -> tuple[Rejected | None, RouteGate | None]:
+        """(None, gate) when admitted - call release(key, gate) once the request is done - else (Rejected, None)."""
+        wait = self._take_token(key)
+        if wait > 0:
+            return Rejected(429, "rate_limited", wait, "Too many requests, slow down"), None
+        if self.max_in_flight > 0 and self._in_flight.get(key, 0) >= self.max_in_flight:
+            return Rejected(429, "caller_concurrency", 1, "Too many concurrent requests"), None
+
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1 # Held while queueing, so one caller can't fill the queue
+        gate = self._gate(route) if route is not None else None
+        if gate is not None:
+            start = time.perf_counter()
+            try:
+                refused = await gate.acquire(self.max_queue_wait)
+            except BaseException:
+                self._leave(key)
+                raise
+            waited = time.perf_counter() - start
+            record("admission-queue", waited)
+            ADMISSION_QUEUE_SECONDS.observe(waited, service=self.service, route=route)
+            if refused is not None:
+                self._leave(key)
+                return Rejected(503, refused, self.max_queue_wait, "Service busy, try again shortly"), None
+        return None, gate
+
+    def release(self, key: str, gate: RouteGate | None):
+        if gate is not None:
+            gate.release()
+        self._leave(key)
+
+    def _leave(self, key: str):
+        count = self._in_flight.get(key, 0) - 1
+        if count > 0:
+            self._in_flight[key] = count
+        else:
+            self._in_flight.pop(key, None)
+
+
+# --- Caller Keys ---
+def client_key_func(client_header: str | None = None):
+    """
+    Key by client address. Behind a proxy every request comes from the proxy, so pass the header
+    it sets (e.g. "X-Forwarded-For"; the first address in it is used) - only if the proxy overwrites it.
+    """
+    async def key_func(scope) -> str:
+        if client_header:
+            forwarded = Headers(scope=scope).get(client_header)
+            if forwarded:
+                return "client:" + forwarded.split(",")[0].strip()
+        client = scope.get("client")
+        return "client:" + (client[0] if client else "unknown")
+    return key_func
+
+def route_label(scope) -> str | None:
+    """'METHOD /path/{template}' of the route the request will hit (None if nothing matches)."""
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    for route in getattr(router, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path}"
+    return None
+
+
+# --- Middleware ---
+class AdmissionMiddleware:
+    """
+    Pure ASGI admission control. 'key_func' is an async (scope) -> caller key. Slots are held until
+    the response has been sent, streamed bodies included. Add it before timing.instrument() so
+    rejections and queueing show up in the request timings; 'exempt_paths' (health checks,
+    metrics scrapes) are never limited.
+    """
+
+    def __init__(self, app, controller: AdmissionController, key_func=None, exempt_paths=("/metrics", "/health")):
+        self.app = app
+        self.controller = controller
+        self.key_func = key_func or client_key_func()
+        self.exempt_paths = set(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        route = route_label(scope)
+        key = await self.key_func(scope)
+        rejected, gate = await self.controller.admit(key, route)
+        label = route or "unmatched"
+        if rejected is not None:
+            ADMISSION_DECISIONS.inc(service=self.controller.service, route=label, outcome=rejected.reason)
+            await rejected.response()(scope, receive, send)
+            return
+        ADMISSION_DECISIONS.inc(service=self.controller.service, route=label, outcome="admitted")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(key, gate)
+
+
+def parse_route_limits(text: str) -> dict[str, int]:
+    """'GET /stats/events=4, POST /log-events=32' -> {"GET /stats/events": 4, "POST /log-events": 32} (for env settings)."""
+    limits = {}
+    for part in text.split(","):
+        route, sep, limit = part.rpartition("=")
+        if sep and route.strip():
+            limits[" ".join(route.split())] = int(limit)
+    return limits
@@ -0,0 +1,238 @@
+# services/common/responses.py
+# Shared response layer for all services:
+#  - dumps(): JSON straight to bytes with orjson (pydantic-core's encoder when orjson isn't installed)
+#  - FastJSONResponse / orm_response(): return trusted ORM rows through a response schema without
+#    FastAPI validating them again and running jsonable_encoder on the result
+#  - CompressionMiddleware: gzip, or brotli when installed, for bodies above a size threshold
+import time
+import zlib
+from typing import Union, get_args, get_origin
+
+import pydantic_core
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+
+from timing import TimedJSONResponse, phase, record
+
+try:
+    import orjson # Optional dependency (pip install orjson)
+except ImportError:
+    orjson = None
+
+try:
+    import brotli # Optional dependency (pip install brotli)
+except ImportError:
+    brotli = None
+
+
+# --- Encoding ---
+def _fallback(value):
+    # numpy scalars/arrays (analytics) have tolist(); anything else unknown (e.g. ObjectId) becomes a string
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+def _default(value):
+    # Called by orjson for types it doesn't handle natively: pydantic models, Decimal, sets, ...
+    return pydantic_core.to_jsonable_python(value, fallback=_fallback)
+
+if orjson is not None:
+    # Datetimes come out as pydantic writes them (UTC as "Z"), numpy values as plain numbers
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+    def dumps(content) -> bytes:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(content) -> bytes:
+        return pydantic_core.to_json(content, fallback=_fallback)
+
+
+class FastJSONResponse(TimedJSONResponse):
+    """
+    Default response class for the services: renders with dumps(), timed as 'serialise'.
+    Returning one from an endpoint (instead of plain data) also skips FastAPI's response_model
+    validation and jsonable_encoder pass, so do that only with data we produced ourselves.
+    """
+
+    def render(self, content) -> bytes:
+        with phase("serialise"):
+            return dumps(content)
+
+
+# --- ORM Projection ---
+def _nested_model(annotation) -> tuple[type[BaseModel] | None, bool]:
+    """(model class, is a list) for fields like 'TaskSchema', 'TaskSchema | None' or 'list[TaskSchema]'."""
+    origin = get_origin(annotation)
+    if origin is list:
+        model, _ = _nested_model(get_args(annotation)[0])
+        return model, True
+    if origin is Union or (origin is not None and type(None) in get_args(annotation)):
+        for arg in get_args(annotation):
+            model, many = _nested_model(arg)
+            if model is not None:
+                return model, many
+        return None, False
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None, False
+
+
+class Projection:
+    """
+    Reads a schema's fields straight off trusted objects (ORM rows or dicts) into plain dicts,
+    i.e. what response_model would produce, minus validating rows we just loaded from our own
+    database. Nested schema fields (e.g. TaskSearchHit.task) are projected the same way.
+    Covers plain fields only: aliases and custom serializers on the schema are not applied.
+    """
+
+    def __init__(self, schema: type[BaseModel]):
+        self.schema = schema
+        self.fields = [] # (name, default, nested Projection or None, is a list)
+        for name, field in schema.model_fields.items():
+            model, many = _nested_model(field.annotation)
+            default = None if field.is_required() else field.get_default(call_default_factory=True)
+            self.fields.append((name, default, projection(model) if model is not None else None, many))
+
+    def __call__(self, obj) -> dict:
+        if isinstance(obj, self.schema):
+            return obj.model_dump()
+        is_dict = isinstance(obj, dict)
+        data = {}
+        for name, default, nested, many in self.fields:
+            value = obj.get(name, default) if is_dict else getattr(obj, name, default)
+            if nested is not None and value is not None:
+                value = [nested(item) for item in value] if many else nested(value)
+            data[name] = value
+        return data
+
+_projections: dict[type, Projection] = {}
+
+def projection(schema: type[BaseModel]) -> Projection:
+    if schema not in _projections:
+        _projections[schema] = Projection(schema)
+    return _projections[schema]
+
+def project(content, schema: type[BaseModel]):
+    """A row (or list of rows) as plain data shaped by 'schema', ready for dumps()."""
+    project_one = projection(schema)
+    if isinstance(content, (list, tuple)):
+        return [project_one(item) for item in content]
+    return project_one(content)
+
+def orm_response(content, schema: type[BaseModel], status_code: int = 200, headers: dict | None = None) -> FastJSONResponse:
+    """
+    Response for trusted ORM output (a row or a list of rows) shaped by 'schema'. Keep
+    response_model on the route for the OpenAPI docs; FastAPI doesn't apply it to a Response.
+    """
+    with phase("serialise"):
+        data = project(content, schema)
+    return FastJSONResponse(data, status_code=status_code, headers=headers)
+
+
+# --- Compression ---
+SKIPPED_MEDIA_TYPES = ("text/event-stream",) # Compressors buffer, which would hold back live events
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """Best of 'br' (if brotli is installed) and 'gzip' by the client's q-values; None for identity."""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip()] = quality
+    best, best_quality = None, 0.0
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)): # br wins ties
+        quality = offered.get(encoding, offered.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16) # gzip container
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # Streamed chunks are flushed as they come, or the compressor would sit on them (the CSV header,
+        # small NDJSON batches) until enough input piles up, and the client's first bytes with it
+        start = time.perf_counter()
+        if self._brotli is not None:
+            output = self._brotli.process(data) + (self._brotli.finish() if final else self._brotli.flush())
+        else:
+            output = self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        record("compress", time.perf_counter() - start)
+        return output
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI gzip/brotli compression. Complete bodies are compressed from 'minimum_size' bytes up
+    (-1 disables); streamed bodies (exports, NDJSON stats) are always compressed as they go.
+    Responses that already have a Content-Encoding, and event streams, pass through untouched.
+    Add it before timing.instrument() so compression time is part of the request's timings.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.minimum_size < 0:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None # Set once we've decided to compress; False to pass through
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message # Held back until the first body chunk shows how big the response is
+                return
+            if message["type"] != "http.response.body" or compressor is False:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(scope=start_message)
+                media_type = headers.get("content-type", "").split(";")[0].strip()
+                if "content-encoding" in headers or media_type in SKIPPED_MEDIA_TYPES or \
+                        (not more_body and len(body) < self.minimum_size):
+                    compressor = False
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                body = compressor.compress(body, final=not more_body)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}" # Same entity, different bytes
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+            else:
+                body = compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
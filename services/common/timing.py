@@ -0,0 +1,288 @@
+# services/common/timing.py
+# Per-request phase timings for all services (auth, db-checkout, db-execute, serialise, ...).
+# Each request gets a RequestTimings in a context variable; code anywhere in the request adds
+# to it with phase()/record(). TimingMiddleware reports the totals as a Server-Timing header and
+# as histograms on /metrics, and can run a sampling profiler on a fraction of requests.
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import re
+import secrets
+import time
+from contextlib import contextmanager
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, Field
+from starlette.datastructures import MutableHeaders
+
+from metrics import Histogram
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by service, route and status",
+)
+PHASE_SECONDS = Histogram(
+    "http_request_phase_seconds",
+    "Time spent per request phase (auth, db-checkout, db-execute, serialise, ...)",
+)
+
+
+class RequestTimings:
+    __slots__ = ("phases", "route", "returned_at")
+
+    def __init__(self):
+        self.phases: dict[str, float] = {} # phase -> seconds (summed if it happens more than once)
+        self.route: str | None = None # Route template, set once the request is routed
+        self.returned_at: float | None = None # When the endpoint returned (perf_counter), until the response is built
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+_current: contextvars.ContextVar[RequestTimings | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+def record(phase: str, seconds: float):
+    """Add time to a phase of the current request (no-op outside a request)."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+@contextmanager
+def phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+# --- Serialisation ---
+class TimedJSONResponse(JSONResponse):
+    """
+    Default response class that counts JSON rendering as 'serialise', along with what FastAPI did
+    between the endpoint returning and building the response (response_model validation and
+    jsonable_encoder, noted by TimedRoute).
+    """
+
+    def __init__(self, content=None, status_code: int = 200, headers=None, media_type: str | None = None, background=None):
+        # Same signature as JSONResponse: FastAPI reads the default status code off it for OpenAPI
+        timings = _current.get()
+        if timings is not None and timings.returned_at is not None:
+            timings.add("serialise", time.perf_counter() - timings.returned_at)
+            timings.returned_at = None
+        super().__init__(content, status_code, headers, media_type, background) # Renders
+
+    def render(self, content) -> bytes:
+        with phase("serialise"):
+            return super().render(content)
+
+def _note_return():
+    timings = _current.get()
+    if timings is not None:
+        timings.returned_at = time.perf_counter()
+
+def _noting_return(call):
+    # Same kind of callable as 'call', so FastAPI still awaits it or runs it in the threadpool
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            result = await call(*args, **kwargs)
+            _note_return()
+            return result
+    else:
+        @functools.wraps(call)
+        def endpoint(*args, **kwargs):
+            result = call(*args, **kwargs)
+            _note_return() # The threadpool runs it in a copy of the request's context
+            return result
+    return endpoint
+
+
+class TimedRoute(APIRoute):
+    """
+    Labels the request's timings with the route template (not the raw path, to bound cardinality)
+    and notes when the endpoint returns, for TimedJSONResponse.
+    """
+
+    def get_route_handler(self):
+        self.dependant.call = _noting_return(self.dependant.call) # This route's own dependant; the endpoint is unchanged
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request):
+            timings = _current.get()
+            if timings is not None:
+                timings.route = path
+            return await handler(request)
+        return timed_handler
+
+
+# --- Middleware ---
+class TimingMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware, so streaming responses aren't buffered)."""
+
+    def __init__(self, app, service: str, server_timing: bool = True, profiler: "SamplingProfiler | None" = None):
+        self.app = app
+        self.service = service
+        self.server_timing = server_timing
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timings(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    # Phases finished so far; for streamed bodies that excludes the streaming itself
+                    MutableHeaders(scope=message).append("Server-Timing", server_timing_header(timings, time.perf_counter() - start))
+            await send(message)
+
+        session = self.profiler.begin() if self.profiler is not None else None
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            total = time.perf_counter() - start
+            _current.reset(token)
+            route = timings.route or "unmatched"
+            REQUEST_SECONDS.observe(total, service=self.service, method=scope["method"], route=route, status=status_code)
+            for name, seconds in timings.phases.items():
+                PHASE_SECONDS.observe(seconds, service=self.service, route=route, phase=name)
+            if session is not None:
+                await self.profiler.end(session, scope["method"], route)
+
+def server_timing_header(timings: RequestTimings, total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.phases.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def instrument(app, service: str, server_timing: bool = True, profiler: "SamplingProfiler | None" = None):
+    """
+    Add timing to an app. Call right after creating it (before routes are declared), with
+    FastAPI(default_response_class=TimedJSONResponse) so serialisation is timed as well.
+    """
+    app.router.route_class = TimedRoute
+    app.add_middleware(TimingMiddleware, service=service, server_timing=server_timing, profiler=profiler)
+
+
+# --- Sampling Profiler ---
+class SamplingProfiler:
+    """
+    Profiles a random fraction of requests while enabled and writes one file per request to
+    'output_dir': speedscope JSON (open in speedscope.app for a flame graph) with pyinstrument,
+    or a cProfile .prof file (e.g. flameprof / snakeviz) without it.
+    At most one request is profiled at a time per process.
+    """
+
+    def __init__(self, service: str, output_dir: str, interval: float = 0.001):
+        self.service = service
+        self.output_dir = output_dir
+        self.interval = interval # Seconds between samples (pyinstrument)
+        self.sample_rate = 0.0
+        self.until = 0.0 # time.time() when sampling switches itself off
+        self.captured = 0
+        self._busy = False
+
+    def configure(self, sample_rate: float, duration: float):
+        self.sample_rate = sample_rate
+        self.until = time.time() + duration if sample_rate > 0 else 0.0
+
+    def status(self) -> dict:
+        active = self.sample_rate > 0 and time.time() < self.until
+        return {
+            "active": active,
+            "sample_rate": self.sample_rate if active else 0.0,
+            "seconds_left": max(0.0, self.until - time.time()) if active else 0.0,
+            "captured": self.captured,
+            "output_dir": os.path.abspath(self.output_dir),
+        }
+
+    def begin(self):
+        if self._busy or self.sample_rate <= 0 or time.time() >= self.until or random.random() >= self.sample_rate:
+            return None
+        self._busy = True
+        try:
+            try:
+                from pyinstrument import Profiler # Optional dependency
+                session = Profiler(interval=self.interval, async_mode="enabled")
+                session.start()
+            except ImportError:
+                import cProfile
+                session = cProfile.Profile()
+                session.enable()
+            return session
+        except Exception as e:
+            self._busy = False
+            print(f"Error starting profiler: {e}")
+            return None
+
+    async def end(self, session, method: str, route: str):
+        try:
+            if hasattr(session, "disable"):
+                session.disable()
+            else:
+                session.stop()
+            name = re.sub(r"[^A-Za-z0-9]+", "_", f"{method} {route}").strip("_")
+            path = os.path.join(self.output_dir, f"{self.service}-{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{name}")
+            await asyncio.to_thread(self._write, session, path) # Rendering can take a while; keep it off the loop
+            self.captured += 1
+        except Exception as e:
+            print(f"Error writing profile: {e}")
+        finally:
+            self._busy = False
+
+    @staticmethod
+    def _write(session, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if hasattr(session, "dump_stats"):
+            session.dump_stats(path + ".prof")
+            return
+        from pyinstrument.renderers import SpeedscopeRenderer
+        with open(path + ".speedscope.json", "w") as f:
+            f.write(session.output(SpeedscopeRenderer()))
+
+
+class ProfilingSettings(BaseModel):
+    sample_rate: float = Field(..., ge=0.0, le=1.0) # Fraction of requests to profile (0 switches off)
+    duration: float = Field(300.0, gt=0, le=86400) # Seconds until sampling switches itself off
+
+def profiling_router(profiler: SamplingProfiler, require_admin) -> APIRouter:
+    """GET/PUT/DELETE /admin/profiling, guarded by the 'require_admin' dependency."""
+    router = APIRouter(prefix="/admin/profiling", dependencies=[Depends(require_admin)], route_class=TimedRoute)
+
+    @router.get("")
+    async def profiling_status():
+        return profiler.status()
+
+    @router.put("")
+    async def start_profiling(body: ProfilingSettings):
+        profiler.configure(body.sample_rate, body.duration)
+        return profiler.status()
+
+    @router.delete("")
+    async def stop_profiling():
+        profiler.configure(0.0, 0.0)
+        return profiler.status()
+
+    return router
+
+def require_admin_token(expected: str | None):
+    """Admin guard for services without user auth: X-Admin-Token must equal 'expected' (unset = disabled)."""
+    async def dependency(x_admin_token: str | None = Header(None)):
+        if not expected:
+            raise HTTPException(status_code=403, detail="Admin endpoints are disabled (no admin token configured)")
+        if x_admin_token is None or not secrets.compare_digest(x_admin_token, expected):
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+    return dependency
@@ -0,0 +1,103 @@
+# services/notification-service/coalesce.py
+import asyncio
+import hashlib
+
+from dispatcher import Dispatcher
+from spool import SpooledMessage
+
+
+class _Window:
+    def __init__(self):
+        self.messages: list[SpooledMessage] = []
+        self.by_hash: dict[str, SpooledMessage] = {}
+        self.handle: asyncio.TimerHandle | None = None
+
+
+class Coalescer:
+    """
+    Merges notifications for the same (recipient, type) that arrive within a window
+    into a single digest send. Exact repeats (same subject and message) are dropped.
+
+    Messages are journaled as soon as they arrive (held until the window closes), so a
+    restart mid-window still delivers them, just individually instead of as a digest.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, windows: dict[str, float], max_items: int = 50):
+        self.dispatcher = dispatcher
+        self.windows = windows # channel -> window seconds (0 = send immediately)
+        self.max_items = max_items # Close the window early once this many messages are waiting
+        self._open: dict[tuple[str, str], _Window] = {}
+
+    @staticmethod
+    def content_hash(payload: dict) -> str:
+        return hashlib.sha256(f"{payload['subject']}\0{payload['message']}".encode()).hexdigest()
+
+    async def submit(self, channel: str, payloads: list[dict]) -> list[str]:
+        """Accept payloads for one channel; returns a message id per payload (shared for duplicates)."""
+        window_seconds = self.windows.get(channel, 0)
+        if window_seconds <= 0:
+            return [message.id for message in await self.dispatcher.submit(channel, payloads)]
+
+        ids, new_payloads, new_keys = [], [], []
+        seen_in_request: dict[tuple, int] = {}
+        for payload in payloads:
+            key = (channel, str(payload["recipient"]))
+            digest = self.content_hash(payload)
+            window = self._open.get(key)
+            if window is not None and digest in window.by_hash:
+                ids.append(window.by_hash[digest].id) # Duplicate of a message already waiting
+            elif (key, digest) in seen_in_request:
+                ids.append(seen_in_request[(key, digest)]) # Placeholder index, resolved below
+            else:
+                seen_in_request[(key, digest)] = len(new_payloads)
+                ids.append(len(new_payloads))
+                new_payloads.append(payload)
+                new_keys.append((key, digest))
+
+        messages = await self.dispatcher.submit(channel, new_payloads, hold_for=window_seconds) if new_payloads else []
+        for message, (key, digest) in zip(messages, new_keys):
+            if message.duplicate:
+                continue # Redelivery of a message accepted earlier (same idempotency key)
+            window = self._open.get(key)
+            if window is None:
+                window = self._open[key] = _Window()
+                window.handle = asyncio.get_running_loop().call_later(
+                    window_seconds, lambda key=key: asyncio.ensure_future(self._close(key))
+                )
+            window.messages.append(message)
+            window.by_hash[digest] = message
+            if len(window.messages) >= self.max_items:
+                await self._close(key)
+        return [messages[i].id if isinstance(i, int) else i for i in ids]
+
+    async def flush(self):
+        """Close every open window now (used on shutdown)."""
+        for key in list(self._open):
+            await self._close(key)
+
+    async def _close(self, key: tuple[str, str]):
+        window = self._open.pop(key, None)
+        if window is None:
+            return
+        if window.handle is not None:
+            window.handle.cancel()
+        if len(window.messages) == 1:
+            self.dispatcher.release(window.messages)
+            return
+        try:
+            await self.dispatcher.merge(window.messages, build_digest(window.messages))
+        except Exception as e:
+            print(f"Error building notification digest, sending individually: {e}")
+            self.dispatcher.release(window.messages)
+
+
+def build_digest(messages: list[SpooledMessage]) -> dict:
+    payloads = [message.payload for message in messages]
+    first = payloads[0]
+    subjects = {payload["subject"] for payload in payloads}
+    if len(subjects) == 1:
+        subject = f"{first['subject']} ({len(payloads)} updates)"
+    else:
+        subject = f"You have {len(payloads)} new notifications"
+    body = "\n\n".join(f"- {payload['subject']}\n  {payload['message']}" for payload in payloads)
+    return {**first, "subject": subject, "message": body, "idempotency_key": None}
@@ -0,0 +1,184 @@
+# services/notification-service/dispatcher.py
+import asyncio
+import random
+import time
+import uuid
+
+from senders import Sender
+from spool import Spool, SpooledMessage
+
+
+class RateLimiter:
+    """Token bucket: at most 'rate' sends per second on average, bursts up to 'burst'."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return # Unlimited
+        async with self._lock: # Waiters are served in order
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Channel:
+    def __init__(self, name: str, sender: Sender, concurrency: int, rate_limiter: RateLimiter):
+        self.name = name
+        self.sender = sender
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+
+class Dispatcher:
+    """
+    Delivers notifications through per-channel worker pools.
+    Every accepted message is journaled in the spool first; it is removed after delivery,
+    retried with exponential backoff on failure, and dead-lettered after 'max_attempts'.
+    Pending messages are reloaded from the spool on startup, so a restart loses nothing.
+    """
+
+    def __init__(self, spool: Spool, parse_payload, max_attempts: int = 5, base_backoff: float = 1.0, max_backoff: float = 300.0):
+        self.spool = spool
+        self.parse_payload = parse_payload # Spooled dict -> payload object handed to senders
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.channels: dict[str, Channel] = {}
+        self._workers: list[asyncio.Task] = []
+        self._retry_handles: set[asyncio.TimerHandle] = set()
+
+    def register(self, name: str, sender: Sender, concurrency: int = 4, rate: float = 0.0, burst: int = 1):
+        """Register a channel. 'rate' is the provider limit in sends/second (0 = unlimited)."""
+        self.channels[name] = Channel(name, sender, concurrency, RateLimiter(rate, max(burst, 1)))
+
+    async def start(self):
+        self.spool.open()
+        for channel in self.channels.values():
+            for _ in range(channel.concurrency):
+                self._workers.append(asyncio.create_task(self._worker(channel)))
+        pending = await self.spool.load("pending")
+        for message in pending:
+            self._schedule(message)
+        if pending:
+            print(f"Recovered {len(pending)} pending notifications from the spool.")
+
+    async def stop(self):
+        """Stop workers. Anything not yet delivered stays in the spool for the next start."""
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        for channel in self.channels.values():
+            await channel.sender.close()
+        self.spool.close()
+
+    def pending(self) -> dict[str, int]:
+        return {name: channel.queue.qsize() for name, channel in self.channels.items()}
+
+    async def submit(self, channel: str, payloads: list[dict], hold_for: float = 0.0) -> list[SpooledMessage]:
+        """
+        Journal payloads for a channel and enqueue them. With 'hold_for' > 0 they are only
+        journaled (due after 'hold_for' seconds) and the caller decides when to enqueue them;
+        after a restart they are sent individually once due.
+        Payloads repeating an accepted 'idempotency_key' come back flagged as duplicates and are not sent again.
+        """
+        if channel not in self.channels:
+            raise KeyError(channel)
+        now = time.time()
+        messages = [SpooledMessage(uuid.uuid4().hex, channel, payload, next_attempt_at=now + hold_for, created_at=now)
+                    for payload in payloads]
+        fresh = await self.spool.append(messages) # Durable before we acknowledge; drops repeated idempotency keys
+        if hold_for <= 0:
+            for message in fresh:
+                self.channels[channel].queue.put_nowait(message)
+        return messages
+
+    def release(self, messages: list[SpooledMessage]):
+        """Enqueue held messages now."""
+        for message in messages:
+            message.next_attempt_at = time.time()
+            self._schedule(message)
+
+    async def merge(self, messages: list[SpooledMessage], payload: dict) -> SpooledMessage:
+        """Replace held messages with a single message (e.g. a digest) and enqueue it."""
+        now = time.time()
+        merged = SpooledMessage(uuid.uuid4().hex, messages[0].channel, payload, next_attempt_at=now, created_at=now)
+        await self.spool.replace([message.id for message in messages], merged)
+        self._schedule(merged)
+        return merged
+
+    async def retry_dead_letter(self, message_id: str) -> bool:
+        message = await self.spool.revive(message_id)
+        if message is None:
+            return False
+        self._schedule(message)
+        return True
+
+    def _schedule(self, message: SpooledMessage):
+        channel = self.channels.get(message.channel)
+        if channel is None:
+            print(f"Skipping spooled notification {message.id}: unknown channel '{message.channel}'")
+            return
+        delay = message.next_attempt_at - time.time()
+        if delay <= 0:
+            channel.queue.put_nowait(message)
+            return
+        loop = asyncio.get_running_loop()
+
+        def enqueue():
+            self._retry_handles.discard(handle)
+            channel.queue.put_nowait(message)
+        handle = loop.call_later(delay, enqueue)
+        self._retry_handles.add(handle)
+
+    async def _worker(self, channel: Channel):
+        while True:
+            message = await channel.queue.get()
+            try:
+                await channel.rate_limiter.acquire()
+                await channel.sender.send(self.parse_payload(message.payload))
+                error = None
+            except asyncio.CancelledError:
+                raise # Shutting down: the message stays pending in the spool
+            except Exception as e:
+                error = e
+            try:
+                if error is None:
+                    await self.spool.delete(message.id)
+                else:
+                    await self._failed(message, error)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # E.g. SQLite "database is locked": the message is still pending in the spool and is
+                # redelivered after a restart; the channel's worker must not die over it
+                print(f"Error updating spooled notification {message.id}: {e}")
+
+    async def _failed(self, message: SpooledMessage, error: Exception):
+        message.attempts += 1
+        message.last_error = f"{type(error).__name__}: {error}"
+        if message.attempts >= self.max_attempts:
+            print(f"Notification {message.id} failed {message.attempts} times, moving to dead letters: {message.last_error}")
+            await self.spool.mark_dead(message)
+            return
+        # Exponential backoff with jitter, so a provider outage doesn't get hammered in lockstep
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (message.attempts - 1))
+        message.next_attempt_at = time.time() + backoff * random.uniform(0.5, 1.0)
+        print(f"Notification {message.id} failed (attempt {message.attempts}), retrying in {backoff:.1f}s: {message.last_error}")
+        await self.spool.reschedule(message)
+        self._schedule(message)
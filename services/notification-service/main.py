@@ -1,13 +1,66 @@
 # services/notification-service/main.py
-from fastapi import FastAPI, HTTPException, status, BackgroundTasks
+from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, EmailStr
-import time # For simulating work
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")) # Shared metrics/timing
+from metrics import render_metrics
+import admission # Per-client rate limits, per-route concurrency caps, load shedding
+import responses
+import timing
+from coalesce import Coalescer
+from dispatcher import Dispatcher
+from senders import SimulatedSender, SMTPSender
+from spool import Spool
 
-app = FastAPI(
-    title="Notification Service",
-    description="Handles sending notifications like emails or in-app messages.",
-    version="0.1.0"
-)
+# --- Configuration ---
+SPOOL_PATH = os.getenv("NOTIFICATION_SPOOL_PATH", "notification_spool.db") # Local journal of undelivered messages
+MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5")) # Then the message goes to dead letters
+RETRY_BASE_BACKOFF = float(os.getenv("NOTIFICATION_RETRY_BASE_BACKOFF", "1.0")) # Seconds, doubled per attempt
+RETRY_MAX_BACKOFF = float(os.getenv("NOTIFICATION_RETRY_MAX_BACKOFF", "300.0"))
+SIMULATED_LATENCY = float(os.getenv("NOTIFICATION_SIMULATED_LATENCY", "2.0")) # Used when no real provider is set up
+COALESCE_MAX_ITEMS = int(os.getenv("NOTIFICATION_COALESCE_MAX_ITEMS", "50")) # Send a digest early once it has this many items
+MAX_BATCH_SIZE = int(os.getenv("NOTIFICATION_MAX_BATCH_SIZE", "1000")) # Per POST /send-notifications
+IDEMPOTENCY_KEY_TTL = float(os.getenv("NOTIFICATION_IDEMPOTENCY_KEY_TTL", "86400")) # Seconds a key blocks redelivery
+
+# Request timing / profiling (see services/common/timing.py)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles") # Where sampled request profiles are written
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") # X-Admin-Token for /admin/* (unset = admin endpoints disabled)
+
+# Response compression (see services/common/responses.py)
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")) # Bytes; -1 disables compression
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")) # When 'brotli' is installed
+
+# Admission control (see services/common/admission.py); callers are keyed by client address
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "200")) # Requests/second per client (0 = no rate limit)
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "400"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32")) # Concurrent requests per client (0 = unlimited)
+ADMISSION_ROUTE_CONCURRENCY = int(os.getenv("ADMISSION_ROUTE_CONCURRENCY", "64")) # Per route (0 = unlimited)
+ADMISSION_ROUTE_LIMITS = admission.parse_route_limits(os.getenv("ADMISSION_ROUTE_LIMITS", "GET /dead-letters=4"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100")) # Requests waiting for a route slot
+ADMISSION_MAX_QUEUE_WAIT = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "0.5")) # Seconds before a waiting request is shed (503)
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER") # e.g. "X-Forwarded-For" behind a proxy
+
+# SMTP (optional). Without SMTP_HOST, email is simulated like the other channels.
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_FROM = os.getenv("SMTP_FROM", "noreply@example.com")
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "false").lower() == "true"
+
+def channel_setting(channel: str, name: str, default: str) -> str:
+    # e.g. NOTIFICATION_EMAIL_CONCURRENCY, NOTIFICATION_IN_APP_RATE
+    return os.getenv(f"NOTIFICATION_{channel.upper().replace('-', '_')}_{name}", default)
+
+CHANNELS = ("email", "in-app", "sms")
 
 # --- Models ---
 class NotificationPayload(BaseModel):
@@ -15,39 +68,158 @@ class NotificationPayload(BaseModel):
     subject: str
     message: str
     type: str = "email" # e.g., 'email', 'in-app', 'sms'
+    idempotency_key: str | None = None # Set by producers that may redeliver (e.g. the task-service outbox)
+
+# --- Dispatcher ---
+dispatcher = Dispatcher(
+    Spool(SPOOL_PATH),
+    parse_payload=NotificationPayload.model_validate,
+    max_attempts=MAX_ATTEMPTS,
+    base_backoff=RETRY_BASE_BACKOFF,
+    max_backoff=RETRY_MAX_BACKOFF,
+)
 
-# --- Helper Function (Simulated) ---
-def send_email_notification(payload: NotificationPayload):
-    # In a real app, integrate with an email service (SMTP, SendGrid, Mailgun, etc.)
-    print(f"Simulating sending {payload.type} notification...")
-    print(f"To: {payload.recipient}")
-    print(f"Subject: {payload.subject}")
-    print(f"Message: {payload.message}")
-    time.sleep(2) # Simulate network latency/work
-    print("Notification 'sent'.")
+def build_sender(channel: str):
+    if channel == "email" and SMTP_HOST:
+        return SMTPSender(SMTP_HOST, SMTP_PORT, SMTP_FROM, SMTP_USERNAME, SMTP_PASSWORD, SMTP_USE_TLS)
+    return SimulatedSender(SIMULATED_LATENCY)
+
+for channel_name in CHANNELS:
+    dispatcher.register(
+        channel_name,
+        build_sender(channel_name),
+        concurrency=int(channel_setting(channel_name, "CONCURRENCY", "8")), # Concurrent sends per channel
+        rate=float(channel_setting(channel_name, "RATE", "0")), # Provider limit, sends/second (0 = unlimited)
+        burst=int(channel_setting(channel_name, "BURST", "10")),
+    )
+
+# Per-channel coalescing window in seconds, e.g. NOTIFICATION_EMAIL_COALESCE_WINDOW=60.
+# Messages to the same recipient within the window go out as one digest; 0 sends each one immediately.
+coalescer = Coalescer(
+    dispatcher,
+    windows={name: float(channel_setting(name, "COALESCE_WINDOW", "0")) for name in CHANNELS},
+    max_items=COALESCE_MAX_ITEMS,
+)
+
+async def prune_idempotency_keys():
+    while True:
+        try:
+            pruned = await dispatcher.spool.prune_idempotency_keys(time.time() - IDEMPOTENCY_KEY_TTL)
+            if pruned:
+                print(f"Pruned {pruned} expired idempotency keys.")
+        except Exception as e:
+            print(f"Error pruning idempotency keys: {e}")
+        await asyncio.sleep(min(IDEMPOTENCY_KEY_TTL, 3600))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: open the spool, start workers, and resume anything left over from the last run
+    await dispatcher.start()
+    pruner = asyncio.create_task(prune_idempotency_keys())
+    yield
+    # Shutdown: send open digests now, undelivered messages stay in the spool
+    pruner.cancel()
+    await coalescer.flush()
+    await dispatcher.stop()
+
+app = FastAPI(
+    title="Notification Service",
+    description="Handles sending notifications like emails or in-app messages.",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=responses.FastJSONResponse
+)
+# Before instrument(), so compression time and admission queueing show up in the request's timings
+app.add_middleware(
+    responses.CompressionMiddleware,
+    minimum_size=COMPRESSION_MINIMUM_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
+)
+if ADMISSION_ENABLED:
+    app.add_middleware(
+        admission.AdmissionMiddleware,
+        controller=admission.AdmissionController(
+            "notification-service",
+            rate=ADMISSION_RATE,
+            burst=ADMISSION_BURST,
+            max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+            route_concurrency=ADMISSION_ROUTE_CONCURRENCY,
+            route_limits=ADMISSION_ROUTE_LIMITS,
+            max_queue=ADMISSION_MAX_QUEUE,
+            max_queue_wait=ADMISSION_MAX_QUEUE_WAIT,
+        ),
+        key_func=admission.client_key_func(ADMISSION_CLIENT_HEADER),
+    )
+profiler = timing.SamplingProfiler("notification-service", PROFILE_DIR)
+timing.instrument(app, "notification-service", server_timing=SERVER_TIMING_ENABLED, profiler=profiler)
+# GET/PUT/DELETE /admin/profiling: profile a sample of requests for flame graphs
+app.include_router(timing.profiling_router(profiler, timing.require_admin_token(ADMIN_TOKEN)))
 
 # --- API Endpoint ---
 @app.post("/send-notification", status_code=status.HTTP_202_ACCEPTED)
-async def send_notification_endpoint(
-    payload: NotificationPayload,
-    background_tasks: BackgroundTasks # Use background tasks for non-critical operations
-):
+async def send_notification_endpoint(payload: NotificationPayload):
     """
     Accepts a notification request and schedules it for sending.
-    Uses background tasks so the API call returns quickly.
+    The request is journaled to the local spool before we answer, and delivered
+    by the dispatcher's worker pool for its channel (with retries).
+    If the channel has a coalescing window, it may be merged into a digest (the id is still returned).
     """
     print(f"Received notification request for {payload.recipient}")
+    if payload.type not in dispatcher.channels:
+        raise HTTPException(status_code=400, detail=f"Unsupported notification type '{payload.type}'")
+
+    with timing.phase("spool"): # Journaling to the local spool
+        [message_id] = await coalescer.submit(payload.type, [payload.model_dump()])
+    return {"message": "Notification request accepted and scheduled for sending.", "id": message_id}
+
+@app.post("/send-notifications", status_code=status.HTTP_202_ACCEPTED)
+async def send_notifications_endpoint(payloads: list[NotificationPayload]):
+    """
+    Batch version of /send-notification: one spool transaction per channel.
+    Returns one id per payload, in order (duplicates of a waiting message share its id).
+    """
+    if len(payloads) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} notifications per request")
+    unsupported = sorted({p.type for p in payloads if p.type not in dispatcher.channels})
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Unsupported notification type(s): {', '.join(unsupported)}")
+
+    by_channel: dict[str, list[int]] = {}
+    for index, payload in enumerate(payloads):
+        by_channel.setdefault(payload.type, []).append(index)
+    ids: list[str | None] = [None] * len(payloads)
+    for channel, indexes in by_channel.items():
+        with timing.phase("spool"):
+            channel_ids = await coalescer.submit(channel, [payloads[i].model_dump() for i in indexes])
+        for index, message_id in zip(indexes, channel_ids):
+            ids[index] = message_id
+    return {"message": f"{len(payloads)} notification requests accepted and scheduled for sending.", "ids": ids}
+
+@app.get("/dead-letters")
+async def list_dead_letters(limit: int = 100):
+    """Notifications that failed every retry."""
+    messages = await dispatcher.spool.load("dead", limit=limit)
+    return responses.FastJSONResponse([
+        {"id": m.id, "channel": m.channel, "payload": m.payload, "attempts": m.attempts, "last_error": m.last_error}
+        for m in messages
+    ])
 
-    # Schedule the actual sending as a background task
-    # This allows the API to respond quickly without waiting for the email to send
-    background_tasks.add_task(send_email_notification, payload)
+@app.post("/dead-letters/{message_id}/retry", status_code=status.HTTP_202_ACCEPTED)
+async def retry_dead_letter(message_id: str):
+    if not await dispatcher.retry_dead_letter(message_id):
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    return {"message": "Notification re-queued for sending.", "id": message_id}
 
-    return {"message": "Notification request accepted and scheduled for sending."}
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint (request/phase latencies)."""
+    return render_metrics()
 
 @app.get("/health")
 async def health_check():
     """Basic health check endpoint."""
-    return {"status": "ok"}
+    return {"status": "ok", "queued": dispatcher.pending()}
 
 # --- How will this be triggered? ---
 # Option 1: Direct REST call from Task Service (or others)
@@ -0,0 +1,65 @@
+# services/notification-service/senders.py
+import asyncio
+from abc import ABC, abstractmethod
+
+
+class Sender(ABC):
+    """
+    Delivers one notification over a channel ('email', 'in-app', 'sms').
+    Raise an exception to signal failure; the dispatcher retries with backoff.
+    Tests can register a fake implementation in place of a real provider.
+    """
+
+    @abstractmethod
+    async def send(self, payload) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class SimulatedSender(Sender):
+    """Logs the notification and waits to simulate provider latency (no real delivery)."""
+
+    def __init__(self, latency: float = 2.0):
+        self.latency = latency
+
+    async def send(self, payload) -> None:
+        # In a real app, integrate with an email service (SMTP, SendGrid, Mailgun, etc.)
+        print(f"Simulating sending {payload.type} notification...")
+        print(f"To: {payload.recipient}")
+        print(f"Subject: {payload.subject}")
+        print(f"Message: {payload.message}")
+        await asyncio.sleep(self.latency) # Simulate network latency without tying up a thread
+        print("Notification 'sent'.")
+
+
+class SMTPSender(Sender):
+    """Sends email through an SMTP server (requires the optional 'aiosmtplib' package)."""
+
+    def __init__(self, host: str, port: int, sender_address: str, username: str | None = None,
+                 password: str | None = None, use_tls: bool = False):
+        import aiosmtplib # Optional dependency, only needed when SMTP is configured
+        self._smtp = aiosmtplib
+        self.host = host
+        self.port = port
+        self.sender_address = sender_address
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+
+    async def send(self, payload) -> None:
+        from email.message import EmailMessage
+        message = EmailMessage()
+        message["From"] = self.sender_address
+        message["To"] = payload.recipient
+        message["Subject"] = payload.subject
+        message.set_content(payload.message)
+        await self._smtp.send(
+            message,
+            hostname=self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+        )
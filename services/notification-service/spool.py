@@ -0,0 +1,176 @@
+# services/notification-service/spool.py
+# Durable local journal of notifications that have been accepted but not yet delivered.
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', -- 'pending' or 'dead'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spool_status_next ON spool (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    message_id TEXT NOT NULL, -- The message accepted under this key
+    accepted_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_accepted ON idempotency_keys (accepted_at);
+"""
+
+
+class SpooledMessage:
+    def __init__(self, id: str, channel: str, payload: dict, attempts: int = 0,
+                 next_attempt_at: float = 0.0, last_error: str | None = None, created_at: float = 0.0):
+        self.id = id
+        self.channel = channel
+        self.payload = payload
+        self.attempts = attempts
+        self.next_attempt_at = next_attempt_at
+        self.last_error = last_error
+        self.created_at = created_at
+        self.duplicate = False # Set by Spool.append when its idempotency key was already accepted
+
+
+class Spool:
+    """
+    SQLite-backed spool. A message is written before the API answers 202 and removed
+    once it has been delivered, so anything pending survives a restart.
+    SQLite calls run in a worker thread so the event loop never blocks on disk I/O.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock() # One connection shared by the worker threads
+
+    def open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL") # Appends don't block readers
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Durable across process crashes, cheaper fsyncs
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _transaction(self, statements: list[tuple[str, list]]):
+        """Run several executemany() calls as one transaction (one fsync instead of one per row)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in statements:
+                    self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _insert_rows(messages: list[SpooledMessage]) -> tuple[str, list]:
+        return (
+            "INSERT INTO spool (id, channel, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(m.id, m.channel, json.dumps(m.payload), m.next_attempt_at or time.time(), m.created_at or time.time())
+             for m in messages],
+        )
+
+    def _append(self, messages: list[SpooledMessage]) -> list[SpooledMessage]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                fresh = []
+                for message in messages:
+                    key = message.payload.get("idempotency_key")
+                    if key is not None:
+                        row = self._conn.execute("SELECT message_id FROM idempotency_keys WHERE key = ?", (key,)).fetchone()
+                        if row is not None:
+                            message.id, message.duplicate = row[0], True
+                            continue
+                        self._conn.execute(
+                            "INSERT INTO idempotency_keys (key, message_id, accepted_at) VALUES (?, ?, ?)",
+                            (key, message.id, time.time()),
+                        )
+                    fresh.append(message)
+                sql, rows = self._insert_rows(fresh)
+                self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+                return fresh
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def append(self, messages: list[SpooledMessage]) -> list[SpooledMessage]:
+        """
+        Journal messages in one transaction and return the ones written. A message whose payload
+        'idempotency_key' was already accepted is skipped, flagged as a duplicate, and takes the
+        id of the original.
+        """
+        return await asyncio.to_thread(self._append, messages)
+
+    async def prune_idempotency_keys(self, older_than: float) -> int:
+        rows = await asyncio.to_thread(
+            self._execute, "DELETE FROM idempotency_keys WHERE accepted_at < ? RETURNING key", (older_than,)
+        )
+        return len(rows)
+
+    async def replace(self, message_ids: list[str], message: SpooledMessage):
+        """Atomically swap several pending messages for one (e.g. a digest)."""
+        await asyncio.to_thread(self._transaction, [
+            ("DELETE FROM spool WHERE id = ?", [(message_id,) for message_id in message_ids]),
+            self._insert_rows([message]),
+        ])
+
+    async def delete(self, message_id: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM spool WHERE id = ?", (message_id,))
+
+    async def reschedule(self, message: SpooledMessage):
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE spool SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            (message.attempts, message.next_attempt_at, message.last_error, message.id),
+        )
+
+    async def mark_dead(self, message: SpooledMessage):
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE spool SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+            (message.attempts, message.last_error, message.id),
+        )
+
+    async def revive(self, message_id: str) -> SpooledMessage | None:
+        """Move a dead letter back to pending (attempts reset) and return it."""
+        rows = await asyncio.to_thread(
+            self._execute,
+            "UPDATE spool SET status = 'pending', attempts = 0, next_attempt_at = ? "
+            "WHERE id = ? AND status = 'dead' RETURNING id, channel, payload, attempts, next_attempt_at, last_error, created_at",
+            (time.time(), message_id),
+        )
+        return self._to_message(rows[0]) if rows else None
+
+    async def load(self, status: str = "pending", limit: int | None = None) -> list[SpooledMessage]:
+        sql = ("SELECT id, channel, payload, attempts, next_attempt_at, last_error, created_at "
+               "FROM spool WHERE status = ? ORDER BY next_attempt_at")
+        params = (status,)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = (status, limit)
+        rows = await asyncio.to_thread(self._execute, sql, params)
+        return [self._to_message(row) for row in rows]
+
+    @staticmethod
+    def _to_message(row) -> SpooledMessage:
+        id, channel, payload, attempts, next_attempt_at, last_error, created_at = row
+        return SpooledMessage(id, channel, json.loads(payload), attempts, next_attempt_at, last_error, created_at)
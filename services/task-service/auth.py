@@ -0,0 +1,269 @@
+# services/task-service/auth.py
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import httpx # Async HTTP client, so fetching keys never blocks the event loop
+from fastapi import Depends, HTTPException, Query, status
+from fastapi.security import OAuth2AuthorizationCodeBearer # Or OpenIdConnect for discovery
+from jose import jwk, jwt, JWTError
+from starlette.datastructures import Headers
+
+from config import settings
+from timing import phase
+
+# --- Keycloak Configuration ---
+KEYCLOAK_REALM_URL = f"{settings.KEYCLOAK_URL}/auth/realms/{settings.REALM_NAME}"
+KEYCLOAK_CERTS_URL = f"{KEYCLOAK_REALM_URL}/protocol/openid-connect/certs"
+
+
+# --- JWKS Key Manager ---
+class JWKSKeyManager:
+    """
+    Holds Keycloak's RSA signing keys indexed by 'kid'.
+    Keys are refreshed periodically in the background; an unknown 'kid'
+    (e.g. right after a key rotation) triggers at most one refetch per cooldown.
+    """
+
+    def __init__(self, certs_url: str, refresh_interval: float, min_refetch_interval: float):
+        self.certs_url = certs_url
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self._keys: dict = {} # kid -> constructed jose key
+        self._last_attempt = float("-inf") # monotonic time of the last fetch attempt
+        self._lock = asyncio.Lock() # Only one fetch in flight at a time
+        self._client: httpx.AsyncClient | None = None
+        self._refresh_task: asyncio.Task | None = None
+
+    @property
+    def has_keys(self) -> bool:
+        return bool(self._keys)
+
+    async def start(self):
+        """Fetch the keys once and start the background refresh loop."""
+        try:
+            await self.refresh()
+            print(f"Successfully fetched {len(self._keys)} Keycloak signing key(s).")
+        except Exception as e:
+            # Don't fail startup; the refresh loop and unknown-'kid' path will retry
+            print(f"Error fetching Keycloak signing keys: {e}")
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def refresh(self):
+        async with self._lock:
+            await self._fetch()
+
+    async def get_key(self, kid: str | None):
+        """Return the key for 'kid', refetching the JWKS once (rate limited) if it is unknown."""
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        async with self._lock:
+            key = self._keys.get(kid) # Another request may have refetched while we waited
+            if key is None and time.monotonic() - self._last_attempt >= self.min_refetch_interval:
+                try:
+                    await self._fetch()
+                except Exception as e:
+                    print(f"Error refetching Keycloak signing keys: {e}")
+                key = self._keys.get(kid)
+        return key
+
+    async def _fetch(self):
+        self._last_attempt = time.monotonic()
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=5.0)
+        response = await self._client.get(self.certs_url)
+        response.raise_for_status() # Raise an exception for bad status codes
+        keys = {}
+        for key_data in response.json().get("keys", []):
+            # Only RSA signing keys are relevant for RS256 tokens
+            if key_data.get("use", "sig") != "sig" or key_data.get("kty") != "RSA":
+                continue
+            keys[key_data.get("kid")] = jwk.construct(key_data, key_data.get("alg", "RS256"))
+        if not keys:
+            raise ValueError("RSA signing key not found in JWKS")
+        self._keys = keys # Swap atomically so readers never see a partial set
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing Keycloak signing keys: {e}") # Keep serving with the old keys
+
+
+# --- Verified Token Cache ---
+class VerifiedTokenCache:
+    """
+    Bounded LRU of already-verified tokens, keyed by the token's SHA-256 digest.
+    Entries expire after 'ttl' seconds or at the token's 'exp', whichever comes first.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict() # digest -> (expires_at, user)
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        digest = self._digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.time():
+            del self._entries[digest]
+            return None
+        self._entries.move_to_end(digest)
+        return user
+
+    def put(self, token: str, user: dict, exp: float | None = None):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        digest = self._digest(token)
+        self._entries[digest] = (expires_at, user)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False) # Evict least recently used
+
+    def clear(self):
+        self._entries.clear()
+
+
+key_manager = JWKSKeyManager(
+    KEYCLOAK_CERTS_URL,
+    refresh_interval=settings.JWKS_REFRESH_INTERVAL,
+    min_refetch_interval=settings.JWKS_MIN_REFETCH_INTERVAL,
+)
+token_cache = VerifiedTokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+# Tokens that just failed verification, so repeats (admission keying, then the route itself,
+# or a client retrying a bad token) get their 401 without another signature check
+rejected_tokens = VerifiedTokenCache(settings.REJECTED_TOKEN_CACHE_SIZE, settings.REJECTED_TOKEN_CACHE_TTL)
+
+
+# --- Authentication Dependency ---
+# This expects the token in the Authorization header: Bearer <token>
+oauth2_scheme = OAuth2AuthorizationCodeBearer(
+    authorizationUrl=f"{KEYCLOAK_REALM_URL}/protocol/openid-connect/auth", # Not directly used by API, but good practice
+    tokenUrl=f"{KEYCLOAK_REALM_URL}/protocol/openid-connect/token" # Not directly used by API
+)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    with phase("auth"): # Reported in Server-Timing / metrics
+        return await authenticate(token)
+
+# Same scheme without the automatic 401, for routes that also take the token elsewhere
+optional_oauth2_scheme = OAuth2AuthorizationCodeBearer(
+    authorizationUrl=oauth2_scheme.model.flows.authorizationCode.authorizationUrl,
+    tokenUrl=oauth2_scheme.model.flows.authorizationCode.tokenUrl,
+    auto_error=False,
+)
+
+async def get_stream_user(header_token: str | None = Depends(optional_oauth2_scheme), token: str | None = Query(None)):
+    # Browsers' EventSource can't set headers, so streams also accept ?token= (like /tasks/ws)
+    if header_token is None and token is None:
+        raise _credentials_exception()
+    with phase("auth"):
+        return await authenticate(header_token if header_token is not None else token)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def authenticate(token: str) -> dict:
+    # Fast paths: this exact token was verified, or rejected, recently
+    cached_user = token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+    if rejected_tokens.get(token) is not None:
+        raise _credentials_exception()
+    try:
+        return await _verify(token)
+    except HTTPException as e:
+        if e.status_code == status.HTTP_401_UNAUTHORIZED:
+            rejected_tokens.put(token, {}) # Not 500s: those are about our configuration, not the token
+        raise
+
+async def _verify(token: str) -> dict:
+    credentials_exception = _credentials_exception()
+
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+    except JWTError as e:
+        print(f"JWT Error: {e}") # Log the error
+        raise credentials_exception
+
+    public_key = await key_manager.get_key(kid)
+    if public_key is None:
+        if not key_manager.has_keys:
+            raise HTTPException(status_code=500, detail="Authentication service not properly configured")
+        raise credentials_exception
+
+    try:
+        # Decode the token
+        payload = jwt.decode(
+            token,
+            public_key,
+            algorithms=["RS256"], # Algorithm used by Keycloak
+            # Specify audience if your clients have it configured
+            # audience="account", # Default Keycloak audience, adjust if needed for your client
+            options={"verify_aud": False} # Set to True and add audience if needed
+        )
+        username: str = payload.get("preferred_username")
+        user_id: str = payload.get("sub") # Keycloak User ID
+        roles: list = payload.get("realm_access", {}).get("roles", [])
+
+        if username is None or user_id is None:
+            raise credentials_exception
+    except JWTError as e:
+        print(f"JWT Error: {e}") # Log the error
+        raise credentials_exception
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Token validation error: {e}") # Log unexpected errors
+        raise credentials_exception
+
+    # You can return a user model here
+    user = {"username": username, "id": user_id, "roles": roles}
+    token_cache.put(token, user, payload.get("exp"))
+    return user
+
+
+# --- Admission Key ---
+def admission_key_func(fallback):
+    """
+    Caller key for admission control: the user id from a valid bearer token (verified here, so the
+    route's get_current_user is served from the token cache), else 'fallback' (client address).
+    Either way the token is checked once: rejected tokens are remembered briefly too.
+    """
+    async def key_func(scope) -> str:
+        scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            try:
+                with phase("auth"):
+                    user = await authenticate(token)
+                return "user:" + user["id"]
+            except HTTPException:
+                pass # The route rejects it with 401; rate limit it by client meanwhile
+        return await fallback(scope)
+    return key_func
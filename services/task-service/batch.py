@@ -0,0 +1,148 @@
+# services/task-service/batch.py
+from fastapi import HTTPException, status
+from sqlalchemy import column, delete, insert, update, values
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from config import settings
+from schemas import BatchItemResult, BatchResult, TaskBatchUpdateItem, TaskCreate
+
+TASK_COLUMNS = models.Task.__table__.c
+
+
+def check_batch_size(count: int):
+    if count > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch too large: {count} items (max {settings.BATCH_MAX_ITEMS})",
+        )
+
+def _finish(results: list[BatchItemResult], atomic: bool, status_code: int) -> BatchResult:
+    """Build the batch summary; in all-or-nothing mode any failure aborts (and rolls back) the batch."""
+    results.sort(key=lambda r: r.index)
+    failed = sum(not r.ok for r in results)
+    summary = BatchResult(succeeded=len(results) - failed, failed=failed, results=results)
+    if atomic and failed:
+        # get_db rolls the transaction back when the exception propagates
+        detail = {"message": "Batch rolled back; no changes were applied", **summary.model_dump(mode="json")}
+        raise HTTPException(status_code=status_code, detail=detail)
+    return summary
+
+def _db_error(e: DBAPIError) -> str:
+    return str(e.orig).splitlines()[0] if e.orig else str(e)
+
+
+# --- Create ---
+async def create_tasks(db: AsyncSession, items: list[TaskCreate], reporter_id: str, atomic: bool) -> BatchResult:
+    """Insert all items with one multi-row INSERT ... RETURNING."""
+    rows = [dict(item.model_dump(), reporter_id=reporter_id) for item in items]
+    stmt = insert(models.Task).returning(models.Task, sort_by_parameter_order=True)
+
+    if atomic:
+        try:
+            tasks = (await db.scalars(stmt, rows)).all()
+        except DBAPIError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=_db_error(e))
+        results = [BatchItemResult(index=i, ok=True, id=task.id, task=task) for i, task in enumerate(tasks)]
+        return _finish(results, atomic, status.HTTP_409_CONFLICT)
+
+    try:
+        async with db.begin_nested(): # Savepoint, so a failed bulk insert can be retried row by row
+            tasks = (await db.scalars(stmt, rows)).all()
+        results = [BatchItemResult(index=i, ok=True, id=task.id, task=task) for i, task in enumerate(tasks)]
+    except DBAPIError:
+        # Partial mode: find the offending rows one at a time
+        results = []
+        for index, row in enumerate(rows):
+            try:
+                async with db.begin_nested():
+                    task = (await db.scalars(stmt, [row])).one()
+                results.append(BatchItemResult(index=index, ok=True, id=task.id, task=task))
+            except DBAPIError as e:
+                results.append(BatchItemResult(index=index, ok=False, error=_db_error(e)))
+    return _finish(results, atomic, status.HTTP_409_CONFLICT)
+
+
+# --- Update ---
+def _update_statement(fields: tuple[str, ...], items: list[TaskBatchUpdateItem]):
+    """UPDATE tasks SET ... FROM (VALUES ...) WHERE tasks.id = v.id RETURNING tasks.* for one field set."""
+    batch_values = values(
+        column("id", TASK_COLUMNS.id.type),
+        *(column(name, TASK_COLUMNS[name].type) for name in fields),
+        name="batch_values",
+    ).data([(item.id, *(getattr(item, name) for name in fields)) for item in items])
+    return (
+        update(models.Task)
+        .where(models.Task.id == batch_values.c.id)
+        .values({name: batch_values.c[name] for name in fields})
+        .returning(models.Task)
+        .execution_options(synchronize_session=False)
+    )
+
+async def _apply_update_group(db: AsyncSession, fields, group) -> list[BatchItemResult]:
+    tasks = {task.id: task for task in (await db.scalars(_update_statement(fields, [item for _, item in group])))}
+    return [
+        BatchItemResult(index=index, ok=True, id=item.id, task=tasks[item.id]) if item.id in tasks
+        else BatchItemResult(index=index, ok=False, id=item.id, error="Task not found")
+        for index, item in group
+    ]
+
+async def update_tasks(db: AsyncSession, items: list[TaskBatchUpdateItem], atomic: bool) -> BatchResult:
+    """
+    Apply partial updates with one UPDATE ... FROM (VALUES ...) RETURNING per distinct
+    set of changed fields (usually just one, e.g. a status rollover).
+    """
+    results: list[BatchItemResult] = []
+    groups: dict[tuple[str, ...], list] = {}
+    seen_ids = set()
+    for index, item in enumerate(items):
+        fields = tuple(sorted(item.model_dump(exclude_unset=True).keys() - {"id"}))
+        if item.id in seen_ids:
+            results.append(BatchItemResult(index=index, ok=False, id=item.id, error="Duplicate task id in batch"))
+        elif not fields:
+            results.append(BatchItemResult(index=index, ok=False, id=item.id, error="No fields to update"))
+        else:
+            groups.setdefault(fields, []).append((index, item))
+        seen_ids.add(item.id)
+
+    for fields, group in groups.items():
+        if atomic:
+            try:
+                results.extend(await _apply_update_group(db, fields, group))
+            except DBAPIError as e:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=_db_error(e))
+            continue
+        try:
+            async with db.begin_nested():
+                results.extend(await _apply_update_group(db, fields, group))
+        except DBAPIError:
+            for index, item in group:
+                try:
+                    async with db.begin_nested():
+                        results.extend(await _apply_update_group(db, fields, [(index, item)]))
+                except DBAPIError as e:
+                    results.append(BatchItemResult(index=index, ok=False, id=item.id, error=_db_error(e)))
+    return _finish(results, atomic, status.HTTP_404_NOT_FOUND)
+
+
+# --- Delete ---
+async def delete_tasks(db: AsyncSession, ids: list[int], atomic: bool) -> tuple[BatchResult, list]:
+    """
+    Delete all ids with one DELETE ... WHERE id IN (...) RETURNING id, status, assignee_id.
+    Also returns those rows, for callers that maintain derived data (e.g. summary counters).
+    """
+    stmt = (
+        delete(models.Task)
+        .where(models.Task.id.in_(ids))
+        .returning(models.Task.id, models.Task.status, models.Task.assignee_id)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).all()
+    deleted = {row.id for row in rows}
+    results = [
+        BatchItemResult(index=index, ok=task_id in deleted, id=task_id,
+                        error=None if task_id in deleted else "Task not found")
+        for index, task_id in enumerate(ids)
+    ]
+    return _finish(results, atomic, status.HTTP_404_NOT_FOUND), rows
@@ -0,0 +1,198 @@
+# services/task-service/cache.py
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+
+from config import settings
+
+
+def task_etag(task_id: int, last_modified: datetime) -> str:
+    """Strong ETag from the task id and its last modification time."""
+    return f'"{task_id}-{int(last_modified.timestamp() * 1_000_000)}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison is what If-None-Match uses, so ignore a W/ prefix
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class CachedTask(NamedTuple):
+    etag: str
+    body: bytes # Already-serialised TaskSchema JSON, so hits skip serialisation too
+
+
+# --- Cache Backends ---
+class CacheBackend(ABC):
+    """Interface for a cache shared between service instances (e.g. Redis)."""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        ...
+
+    async def close(self):
+        pass
+
+
+class InMemoryBackend(CacheBackend):
+    """Process-local stand-in for a shared backend (tests, local development)."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float, bytes]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str):
+        import redis.asyncio as redis # Optional dependency, only needed when a Redis URL is configured
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._client.set(key, value, px=int(ttl * 1000))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._client.delete(*keys)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def backend_from_url(url: str | None) -> CacheBackend | None:
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return InMemoryBackend()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported cache backend URL: {url}")
+
+
+# --- In-Process LRU ---
+class LRUCache:
+    """Size-bounded LRU with a per-entry TTL."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict() # key -> (expires_at, value)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False) # Evict least recently used
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# --- Read-Through Task Cache ---
+class TaskCache:
+    """
+    Serialised tasks keyed by id: in-process LRU first, then the optional shared backend.
+    Writers call invalidate(); a per-id generation counter stops a read that started
+    before an invalidation from putting the old row back afterwards.
+    """
+
+    def __init__(self, local: LRUCache, shared: CacheBackend | None = None):
+        self.local = local
+        self.shared = shared
+        self._generations: dict[int, int] = {}
+        self._epoch = 0 # Bumped whenever _generations is reset
+
+    @staticmethod
+    def _key(task_id: int) -> str:
+        return f"task:{task_id}"
+
+    def generation(self, task_id: int) -> tuple[int, int]:
+        return self._epoch, self._generations.get(task_id, 0)
+
+    async def get(self, task_id: int) -> CachedTask | None:
+        entry = self.local.get(task_id)
+        if entry is not None or self.shared is None:
+            return entry
+        try:
+            raw = await self.shared.get(self._key(task_id))
+        except Exception as e:
+            print(f"Error reading shared task cache: {e}") # Fall back to the database
+            return None
+        if raw is None:
+            return None
+        etag, body = raw.split(b"\n", 1)
+        entry = CachedTask(etag.decode(), body)
+        self.local.put(task_id, entry)
+        return entry
+
+    async def put(self, task_id: int, entry: CachedTask, generation: tuple[int, int]):
+        if self.generation(task_id) != generation:
+            return # Invalidated while we were loading; don't cache a possibly stale row
+        self.local.put(task_id, entry)
+        if self.shared is not None:
+            try:
+                await self.shared.set(self._key(task_id), entry.etag.encode() + b"\n" + entry.body, self.local.ttl)
+            except Exception as e:
+                print(f"Error writing shared task cache: {e}")
+
+    async def invalidate(self, *task_ids: int):
+        for task_id in task_ids:
+            self._generations[task_id] = self._generations.get(task_id, 0) + 1
+            self.local.pop(task_id)
+        if len(self._generations) > self.local.max_size * 4:
+            # Keep the counter map bounded; in-flight reads just skip caching once
+            self._generations.clear()
+            self._epoch += 1
+        if self.shared is not None and task_ids:
+            try:
+                await self.shared.delete(*(self._key(task_id) for task_id in task_ids))
+            except Exception as e:
+                print(f"Error invalidating shared task cache: {e}")
+
+
+task_cache = TaskCache(
+    LRUCache(settings.TASK_CACHE_SIZE, settings.TASK_CACHE_TTL),
+    backend_from_url(settings.TASK_CACHE_BACKEND_URL),
+)
@@ -0,0 +1,336 @@
+# services/task-service/changefeed.py
+# Live task change feed. Writes append to task_changes in the same transaction as the change; one hub per
+# process picks new rows up (woken by Postgres LISTEN/NOTIFY, or by local commits and a fallback
+# poll elsewhere) and fans them out in memory to every subscriber, so Postgres sees one query
+# per batch of changes no matter how many dashboards are connected.
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, insert, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+import models
+from config import settings
+from database import AsyncSessionLocal, after_commit, engine
+from schemas import TaskSchema
+
+FETCH_LIMIT = 1000 # Rows per catch-up query
+GAP_TIMEOUT = 10.0 # Seconds to wait for a skipped id (a transaction that committed late) before giving up on it
+MAX_GAPS = 1000
+PRUNE_INTERVAL = 60.0
+
+RESET = object() # Queued when a subscriber fell too far behind; the client should refetch
+
+
+class Change:
+    """One task change, serialised once and shared by every subscriber."""
+
+    def __init__(self, id: int, op: str, task_id: int, task: dict | None):
+        self.id = id
+        self.op = op
+        self.task_id = task_id
+        self.task = task
+        self.data = json.dumps({"id": id, "op": op, "task_id": task_id, "task": task}, separators=(",", ":"))
+        self.fetch = 0 # Which of the hub's fetches picked it up
+
+    @classmethod
+    def from_row(cls, row: models.TaskChange) -> "Change":
+        return cls(row.id, row.op, row.task_id, row.task)
+
+    def removed_data(self) -> str:
+        # For filtered subscribers: the task changed but no longer matches their filter
+        return json.dumps({"id": self.id, "op": "removed", "task_id": self.task_id, "task": None}, separators=(",", ":"))
+
+
+class Subscriber:
+    def __init__(self, assignee_id: str | None, status: str | None, max_queue: int):
+        self.assignee_id = assignee_id
+        self.status = status
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+
+    @property
+    def filtered(self) -> bool:
+        return self.assignee_id is not None or self.status is not None
+
+    def render(self, change: Change) -> tuple[str, str] | None:
+        """(event name, JSON data) this subscriber should get for a change, or None."""
+        if change.op == "deleted" or not self.filtered:
+            return change.op, change.data
+        task = change.task or {}
+        if (self.assignee_id is None or task.get("assignee_id") == self.assignee_id) and \
+                (self.status is None or task.get("status") == self.status):
+            return change.op, change.data
+        if change.op == "updated":
+            return "removed", change.removed_data() # It may have been in the client's view before
+        return None
+
+    def offer(self, change: Change) -> bool:
+        """Queue a change without blocking; on overflow, reset the subscriber. Returns False once reset."""
+        try:
+            self.queue.put_nowait(change)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+            return False
+
+
+class ChangeFeedHub:
+    def __init__(self, session_factory, buffer_size: int, max_replay: int, poll_interval: float,
+                 retention: float, subscriber_queue: int, heartbeat: float):
+        self.session_factory = session_factory
+        self.max_replay = max_replay
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.subscriber_queue = subscriber_queue
+        self.heartbeat = heartbeat
+        self.last_id = 0
+        self._floor = 0 # The buffer holds every change with id > _floor
+        self._buffer: deque[Change] = deque()
+        self._buffered: dict[int, Change] = {} # The buffer by id
+        self._buffer_size = buffer_size
+        self._fetches = 0
+        self._gaps: dict[int, float] = {} # Skipped ids -> when we first noticed
+        self._subscribers: set[Subscriber] = set()
+        self._wakeup = asyncio.Event()
+        self._listener = None # asyncpg connection doing LISTEN (Postgres only)
+        self._task: asyncio.Task | None = None
+        self._last_prune = 0.0
+
+    # --- Lifecycle ---
+    async def start(self):
+        try:
+            async with self.session_factory() as session:
+                self.last_id = self._floor = await session.scalar(select(func.coalesce(func.max(models.TaskChange.id), 0)))
+        except Exception as e:
+            print(f"Error reading the task change log position, starting from the beginning: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._close_listener()
+        for subscriber in self._subscribers:
+            subscriber.offer(RESET) # Ends open streams; clients reconnect elsewhere and resume
+
+    async def wake(self):
+        self._wakeup.set()
+
+    # --- Subscribers ---
+    def subscribe(self, assignee_id: str | None = None, status: str | None = None) -> Subscriber:
+        subscriber = Subscriber(assignee_id, status, self.subscriber_queue)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _replay_from(self, last_event_id: int) -> int:
+        """
+        The lowest id a client that last saw 'last_event_id' may be missing. Ids are taken in insert
+        order but committed in any order, so a change with a lower id can commit after the client's
+        last event; it is at or after that event in the order this hub fetched them. Resending
+        changes the client already has is harmless: replayed in id order, each task's changes
+        (which are in id order, as writers lock the task row) end on its latest state.
+        """
+        seen = self._buffered.get(last_event_id)
+        if seen is None:
+            if last_event_id > self.last_id:
+                return last_event_id + 1 # Ahead of this hub (another instance): the rest arrives live
+            # Fetched before the buffer starts (e.g. before a restart), or still a gap here: the
+            # change can only have been skipped by a gap the hub tracks, at most MAX_GAPS back
+            return max(last_event_id - MAX_GAPS, 0) + 1
+        start = last_event_id + 1
+        for change in reversed(self._buffer): # Fetched in the same round as the client's last event, or later
+            if change.fetch < seen.fetch:
+                break
+            if change.id < start and change is not seen:
+                start = change.id
+        return start
+
+    async def missed_since(self, last_event_id: int) -> list[Change] | None:
+        """
+        Changes a client may have missed since 'last_event_id' (possibly some it already has, see
+        _replay_from), in id order; None if they can't be replayed (client must refetch).
+        """
+        start = self._replay_from(last_event_id)
+        if start > self._floor:
+            return sorted((change for change in self._buffer if change.id >= start), key=lambda change: change.id)
+        async with self.session_factory() as session:
+            oldest = await session.scalar(select(func.min(models.TaskChange.id)))
+            if oldest is None or oldest > start:
+                return None # Pruned past the client's position (can't tell a hole from a lost change)
+            rows = (await session.scalars(
+                select(models.TaskChange)
+                .where(models.TaskChange.id >= start, models.TaskChange.id <= self.last_id)
+                .order_by(models.TaskChange.id)
+                .limit(self.max_replay + 1)
+            )).all()
+        if len(rows) > self.max_replay:
+            return None
+        return [Change.from_row(row) for row in rows]
+
+    async def events(self, subscriber: Subscriber, last_event_id: int | None = None):
+        """
+        Yield (event, id, data) for a subscriber: missed changes first (when resuming), then live ones.
+        Yields None when idle for a heartbeat interval. Ends after a 'reset' event.
+        """
+        try:
+            replayed = set()
+            if last_event_id is not None:
+                missed = await self.missed_since(last_event_id)
+                if missed is None:
+                    yield "reset", None, "{}"
+                    return
+                for change in missed:
+                    replayed.add(change.id)
+                    rendered = subscriber.render(change)
+                    if rendered is not None:
+                        yield rendered[0], change.id, rendered[1]
+            while True:
+                try:
+                    change = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if change is RESET:
+                    yield "reset", None, "{}"
+                    return
+                if change.id in replayed:
+                    continue # Already sent from the replay (it arrived live while we were catching up)
+                rendered = subscriber.render(change)
+                if rendered is not None:
+                    yield rendered[0], change.id, rendered[1]
+        finally:
+            self.unsubscribe(subscriber)
+
+    # --- Hub loop ---
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            await self._ensure_listener()
+            try:
+                fetched = await self._fetch()
+                await self._prune()
+            except Exception as e:
+                print(f"Error reading task changes: {e}")
+                fetched = 0
+            if fetched == FETCH_LIMIT:
+                continue # Catching up
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fetch(self) -> int:
+        condition = models.TaskChange.id > self.last_id
+        if self._gaps:
+            condition = or_(condition, models.TaskChange.id.in_(list(self._gaps)))
+        async with self.session_factory() as session:
+            rows = (await session.scalars(
+                select(models.TaskChange).where(condition).order_by(models.TaskChange.id).limit(FETCH_LIMIT)
+            )).all()
+
+        now = time.monotonic()
+        self._fetches += 1
+        for row in rows:
+            if row.id in self._gaps:
+                del self._gaps[row.id] # A transaction that took an id earlier committed after later ones
+            elif row.id > self.last_id + 1 and row.id - self.last_id <= MAX_GAPS:
+                for missing in range(self.last_id + 1, row.id):
+                    self._gaps[missing] = now
+            self.last_id = max(self.last_id, row.id)
+            change = Change.from_row(row)
+            change.fetch = self._fetches
+            self._publish(change)
+        # Ids that never show up were rolled back
+        self._gaps = {gap: seen for gap, seen in self._gaps.items() if now - seen < GAP_TIMEOUT}
+        return len(rows)
+
+    def _publish(self, change: Change):
+        self._buffer.append(change)
+        self._buffered[change.id] = change
+        if len(self._buffer) > self._buffer_size:
+            evicted = self._buffer.popleft()
+            del self._buffered[evicted.id]
+            self._floor = max(self._floor, evicted.id)
+        for subscriber in list(self._subscribers):
+            if not subscriber.offer(change):
+                self._subscribers.discard(subscriber) # Too slow: it gets a reset and resumes or refetches
+
+    async def _prune(self):
+        if time.monotonic() - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = time.monotonic()
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.retention)
+        async with self.session_factory() as session, session.begin():
+            await session.execute(
+                delete(models.TaskChange)
+                .where(models.TaskChange.created_at < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+
+    # --- Postgres LISTEN ---
+    async def _ensure_listener(self):
+        if engine.dialect.name != "postgresql":
+            return # Woken by local commits (after_commit) and the poll interval instead
+        if self._listener is not None and not self._listener.is_closed():
+            return
+        try:
+            import asyncpg
+            url = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+            self._listener = await asyncpg.connect(url)
+            await self._listener.add_listener(models.TASK_CHANGES_CHANNEL, lambda *args: self._wakeup.set())
+        except Exception as e:
+            print(f"Error starting LISTEN for task changes, polling instead: {e}")
+            self._listener = None
+
+    async def _close_listener(self):
+        if self._listener is not None:
+            try:
+                await self._listener.close()
+            except Exception as e:
+                print(f"Error closing task changes listener: {e}")
+            self._listener = None
+
+
+hub = ChangeFeedHub(
+    AsyncSessionLocal, # Reads the primary: replica lag would look like missing changes
+    buffer_size=settings.CHANGE_FEED_BUFFER_SIZE,
+    max_replay=settings.CHANGE_FEED_MAX_REPLAY,
+    poll_interval=settings.CHANGE_FEED_POLL_INTERVAL,
+    retention=settings.CHANGE_FEED_RETENTION,
+    subscriber_queue=settings.CHANGE_FEED_SUBSCRIBER_QUEUE,
+    heartbeat=settings.CHANGE_FEED_HEARTBEAT,
+)
+
+
+def format_sse(event: str, id: int | None, data: str) -> bytes:
+    lines = [f"event: {event}"]
+    if id is not None:
+        lines.append(f"id: {id}")
+    lines.append(f"data: {data}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+# --- Writing changes (inside the request's transaction) ---
+async def record(db: AsyncSession, op: str, tasks: list = (), task_ids: list[int] = ()):
+    """Append changes for the given tasks (created/updated) or ids (deleted)."""
+    rows = [{"task_id": task.id, "op": op, "task": TaskSchema.model_validate(task).model_dump(mode="json")} for task in tasks]
+    rows += [{"task_id": task_id, "op": op, "task": None} for task_id in task_ids]
+    if not rows:
+        return
+    await db.execute(insert(models.TaskChange), rows)
+    if settings.CHANGE_FEED_ENABLED:
+        after_commit(db, hub.wake) # This process's subscribers hear about it right away, NOTIFY or not
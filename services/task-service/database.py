@@ -1,34 +1,148 @@
 # services/task-service/database.py
+import time
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from .config import settings # Import settings from config.py
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config import settings # Import settings from config.py
+from metrics import Gauge, Histogram
+import timing
 
-# Create async engine instance
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=True, # Log SQL queries (useful for debugging)
-    future=True # Use SQLAlchemy 2.0 style execution
+# --- Pool Metrics ---
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the pool",
 )
 
-# Create sessionmaker
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    role = "writer" # Metrics label, set per engine below
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.role = self.role
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            POOL_CHECKOUT_SECONDS.observe(elapsed, role=self.role)
+            timing.record("db-checkout", elapsed)
+
+
+def _engine_kwargs(url: str) -> dict:
+    kwargs = {
+        "echo": settings.DB_ECHO, # Off by default: logging every statement is synchronous and slow
+        "future": True, # Use SQLAlchemy 2.0 style execution
+    }
+    if url.startswith("sqlite"):
+        return kwargs # SQLite (local dev/benchmarks) keeps SQLAlchemy's default pool
+    kwargs.update(
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if "+asyncpg" in url:
+        # Prepared statements are cached per connection, so repeated queries skip parse/plan
+        kwargs["connect_args"] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    return kwargs
+
+def _time_statements(sync_engine):
+    # Statement execution time per request ("db-execute" in Server-Timing / metrics)
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timing.record("db-execute", time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        # A failed statement gets no after_cursor_execute: pop its start so the stack doesn't grow
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts: # Empty if it failed before reaching the cursor
+            timing.record("db-execute", time.perf_counter() - starts.pop())
+
+def _create_engine(url: str, role: str):
+    engine = create_async_engine(url, **_engine_kwargs(url))
+    if isinstance(engine.sync_engine.pool, InstrumentedPool):
+        engine.sync_engine.pool.role = role
+    _time_statements(engine.sync_engine)
+    return engine
+
+# Create async engine instances: the writer (primary) and an optional read replica
+engine = _create_engine(settings.DATABASE_URL, "writer")
+read_engine = _create_engine(settings.DATABASE_READ_URL, "reader") if settings.DATABASE_READ_URL else engine
+
+def _pool_connections():
+    engines = {"writer": engine}
+    if read_engine is not engine:
+        engines["reader"] = read_engine
+    for role, eng in engines.items():
+        pool = eng.sync_engine.pool # Read at scrape time: the pool is replaced on recreate()
+        if isinstance(pool, InstrumentedPool):
+            yield {"role": role, "state": "in_use"}, pool.checkedout()
+            yield {"role": role, "state": "idle"}, pool.checkedin()
+
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections held by the pool, by state",
+    _pool_connections,
+)
+
+# Create sessionmakers
 # expire_on_commit=False prevents attributes from expiring after commit
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
+ReadSessionLocal = sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
+def after_commit(session: AsyncSession, callback):
+    """Run 'callback' (an async callable) once get_db has committed this session's transaction."""
+    session.info.setdefault("after_commit", []).append(callback)
 
-# Dependency to get DB session
+async def _run_after_commit(session: AsyncSession):
+    for callback in session.info.pop("after_commit", []):
+        try:
+            await callback()
+        except Exception as e:
+            print(f"Error in after-commit callback: {e}") # The commit itself already succeeded
+
+# Dependency to get DB session (writer)
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
             yield session
             await session.commit() # Commit changes if everything went well
+            await _run_after_commit(session)
         except Exception:
             await session.rollback() # Rollback on error
             raise
         finally:
             await session.close() # Close session
 
+# Dependency to get a read-only DB session (replica if configured)
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close() # Nothing to commit; closing ends the read transaction
+
 # We might need Base for Alembic later, but don't need it directly here
-# from .models import Base
\ No newline at end of file
+# from .models import Base
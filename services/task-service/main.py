@@ -1,201 +1,329 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import OAuth2AuthorizationCodeBearer # Or OpenIdConnect for discovery
-from jose import jwt, JWTError
-from pydantic import BaseModel
-import requests # To fetch Keycloak public key
-
-# --- Keycloak Configuration ---
-KEYCLOAK_URL = "http://localhost:8080" # Use Docker service name 'keycloak' later
-REALM_NAME = "task-app-realm"
-# In a real app, these would come from env vars or config service
-KEYCLOAK_PUBLIC_KEY = None
+# services/task-service/main.py
+from datetime import datetime
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from auth import admission_key_func, get_current_user, get_stream_user, key_manager # Keycloak JWT verification
+import admission # Per-user rate limits, per-route concurrency caps, load shedding
+import batch # Bulk create/update/delete
+import changefeed # Live change feed (SSE/WebSocket)
+from cache import CachedTask, etag_matches, task_cache, task_etag
+from database import after_commit, engine, get_db, get_read_db, read_engine
+from export import MEDIA_TYPES, ExportFormat, stream_tasks
+from metrics import render_metrics
+import responses # Fast JSON encoding, ORM output without re-validation, compression
+import timing
+import models # Import your models file
+import outbox # Task events for analytics/notifications, written in the request's transaction
+from config import settings
+import search # Full-text search
+import summary # Precomputed task counts
+from pagination import LAST_MODIFIED, SortField, TaskFilters, build_page_query, split_page
+from schemas import TaskSchema, TaskCreate, TaskUpdate, TaskBatchUpdateItem, TaskBatchDelete, BatchResult, TaskSearchHit
 
 # --- FastAPI App ---
-app = FastAPI()
-
-# --- Fetch Keycloak Public Key ---
-def get_keycloak_public_key():
-    global KEYCLOAK_PUBLIC_KEY
-    if KEYCLOAK_PUBLIC_KEY is None:
-        try:
-            # Construct the certs URL dynamically
-            certs_url = f"{KEYCLOAK_URL}/auth/realms/{REALM_NAME}/protocol/openid-connect/certs"
-            response = requests.get(certs_url)
-            response.raise_for_status() # Raise an exception for bad status codes
-            jwks = response.json()
-
-            # Find the RSA signing key (usually 'sig' use)
-            rsa_key = next((key for key in jwks['keys'] if key['use'] == 'sig' and key['kty'] == 'RSA'), None)
-
-            if rsa_key:
-                # Construct the public key in PEM format
-                KEYCLOAK_PUBLIC_KEY = (
-                    "-----BEGIN PUBLIC KEY-----\n"
-                    f"{rsa_key['x5c'][0]}" # Usually the first cert in the chain
-                    "\n-----END PUBLIC KEY-----"
-                )
-                print("Successfully fetched Keycloak public key.")
-            else:
-                 print("Error: RSA signing key not found in JWKS.")
-                 raise HTTPException(status_code=500, detail="Could not fetch Keycloak public key")
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching Keycloak public key: {e}")
-            # Handle error appropriately, maybe retry or exit
-            raise HTTPException(status_code=500, detail="Could not fetch Keycloak public key")
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            raise HTTPException(status_code=500, detail="Error processing Keycloak public key")
-    return KEYCLOAK_PUBLIC_KEY
-
-
-# --- Authentication Dependency ---
-# This expects the token in the Authorization header: Bearer <token>
-oauth2_scheme = OAuth2AuthorizationCodeBearer(
-    authorizationUrl=f"{KEYCLOAK_URL}/auth/realms/{REALM_NAME}/protocol/openid-connect/auth", # Not directly used by API, but good practice
-    tokenUrl=f"{KEYCLOAK_URL}/auth/realms/{REALM_NAME}/protocol/openid-connect/token" # Not directly used by API
+app = FastAPI(default_response_class=responses.FastJSONResponse)
+# Before instrument(), so compression time and admission queueing show up in the request's timings
+app.add_middleware(
+    responses.CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
 )
-
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(
+        admission.AdmissionMiddleware,
+        controller=admission.AdmissionController(
+            "task-service",
+            rate=settings.ADMISSION_RATE,
+            burst=settings.ADMISSION_BURST,
+            max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+            route_concurrency=settings.ADMISSION_ROUTE_CONCURRENCY,
+            route_limits=settings.ADMISSION_ROUTE_LIMITS,
+            uncapped_routes=settings.ADMISSION_UNCAPPED_ROUTES,
+            max_queue=settings.ADMISSION_MAX_QUEUE,
+            max_queue_wait=settings.ADMISSION_MAX_QUEUE_WAIT,
+        ),
+        key_func=admission_key_func(admission.client_key_func(settings.ADMISSION_CLIENT_HEADER)),
+        exempt_paths=("/", "/metrics"),
     )
-    public_key = get_keycloak_public_key()
-    if not public_key:
-         raise HTTPException(status_code=500, detail="Authentication service not properly configured")
+profiler = timing.SamplingProfiler("task-service", settings.PROFILE_DIR)
+timing.instrument(app, "task-service", server_timing=settings.SERVER_TIMING_ENABLED, profiler=profiler)
+summary_maintainer = summary.SummaryMaintainer(engine, settings.SUMMARY_FOLD_INTERVAL, settings.SUMMARY_RECONCILE_INTERVAL)
 
-    try:
-        # Decode the token
-        payload = jwt.decode(
-            token,
-            public_key,
-            algorithms=["RS256"], # Algorithm used by Keycloak
-            # Specify audience if your clients have it configured
-            # audience="account", # Default Keycloak audience, adjust if needed for your client
-            options={"verify_aud": False} # Set to True and add audience if needed
-        )
-        username: str = payload.get("preferred_username")
-        user_id: str = payload.get("sub") # Keycloak User ID
-        roles: list = payload.get("realm_access", {}).get("roles", [])
-
-        if username is None or user_id is None:
-            raise credentials_exception
-        # You can return a user model here
-        return {"username": username, "id": user_id, "roles": roles }
-    except JWTError as e:
-        print(f"JWT Error: {e}") # Log the error
-        raise credentials_exception
-    except Exception as e:
-        print(f"Token validation error: {e}") # Log unexpected errors
-        raise credentials_exception
-
-# --- Pydantic Models (Data Shapes) ---
-class Task(BaseModel):
-    id: int
-    title: str
-    description: str | None = None
-    status: str = "todo"
-    assignee_id: str | None = None # Link to Keycloak user ID
-
-# Dummy database for now
-fake_db = {
-    1: Task(id=1, title="Setup Keycloak", description="Run Keycloak via Docker", status="done"),
-    2: Task(id=2, title="Create Task Service", description="Build basic FastAPI app", status="inprogress"),
-}
-
-# --- API Endpoints ---
 @app.on_event("startup")
 async def startup_event():
-    print("Fetching Keycloak public key on startup...")
-    get_keycloak_public_key() # Fetch key on startup
+    print("Fetching Keycloak signing keys on startup...")
+    await key_manager.start() # Fetch keys and start background refresh
+    if settings.OUTBOX_RELAY_ENABLED:
+        await outbox.relay.start() # Deliver task events left over from before, and new ones as they commit
+    if settings.CHANGE_FEED_ENABLED:
+        await changefeed.hub.start() # One LISTEN connection per process, shared by all subscribers
+    await summary_maintainer.start() # Folds summary count deltas, recounts periodically
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await key_manager.stop()
+    await outbox.relay.stop() # Undelivered events stay in the outbox
+    await changefeed.hub.stop() # Open streams get a reset and reconnect
+    await summary_maintainer.stop()
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+    if task_cache.shared is not None:
+        await task_cache.shared.close()
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the Task Management Service"}
 
-# Example protected endpoint
-@app.get("/tasks/", response_model=list[Task])
-async def get_tasks(current_user: dict = Depends(get_current_user)):
-     # Later: Filter tasks based on current_user roles or assignments
-    print(f"User {current_user['username']} requested tasks.")
-    return list(fake_db.values())
-
-@app.get("/tasks/{task_id}", response_model=Task)
-async def get_task(task_id: int, current_user: dict = Depends(get_current_user)):
-    if task_id not in fake_db:
-         raise HTTPException(status_code=404, detail="Task not found")
-    # Later: Add authorization checks (can this user view this task?)
-    print(f"User {current_user['username']} requested task {task_id}.")
-    return fake_db[task_id]
-
-@app.post("/tasks/", response_model=Task, status_code=status.HTTP_201_CREATED)
-async def create_task(task_data: Task, current_user: dict = Depends(get_current_user)):
-    # Basic role check example
-    if "project_manager" not in current_user['roles'] and "app_admin" not in current_user['roles']:
-         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions to create tasks")
-
-    new_id = max(fake_db.keys()) + 1 if fake_db else 1
-    new_task = task_data.copy(update={"id": new_id})
-    fake_db[new_id] = new_task
-    print(f"User {current_user['username']} created task {new_id}.")
-    return new_task
-
-# Add PUT, DELETE endpoints similarly, with auth checks
-# services/task-service/main.py
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint (request/phase latencies, pool checkout wait times, connections in use)."""
+    return render_metrics()
 
-# ... other imports ...
-from datetime import datetime # Import datetime
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy import update, delete # Import update and delete
-from database import get_db
-import models # Import your models file
-# Import your schemas (assuming they are defined above or in schemas.py)
-# from schemas import TaskSchema, TaskCreate, TaskUpdate
+# --- Admin ---
+async def require_admin(current_user: dict = Depends(get_current_user)):
+    if "app_admin" not in current_user["roles"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required")
 
-# ... (Keep FastAPI app setup, Keycloak auth, etc.) ...
+# GET/PUT/DELETE /admin/profiling: profile a sample of requests for flame graphs
+app.include_router(timing.profiling_router(profiler, require_admin))
+
+# --- Cache Helpers ---
+async def invalidate_cached_tasks(db: AsyncSession, *task_ids: int):
+    """Drop tasks from the read cache now, and again once the write has committed."""
+    # The second pass catches a reader that re-cached the old row before our commit landed
+    await task_cache.invalidate(*task_ids)
+    after_commit(db, lambda: task_cache.invalidate(*task_ids))
 
 # --- API Endpoints Refactored ---
 
 @app.get("/tasks/", response_model=list[TaskSchema]) # Use TaskSchema
 async def get_tasks(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db), # Replica if configured
     current_user: dict = Depends(get_current_user),
-    skip: int = 0, # Add pagination
-    limit: int = 100 # Add pagination
+    filters: TaskFilters = Depends(), # status, assignee_id, reporter_id, mine
+    sort: SortField = "created_at",
+    cursor: str | None = None, # Opaque cursor from the previous page's X-Next-Cursor header
+    limit: int = Query(100, ge=1, le=500)
 ):
-    # Example: Only show tasks assigned to or reported by the user (adjust logic as needed)
-    user_id = current_user["id"]
-    # query = select(models.Task).where(
-    #     (models.Task.assignee_id == user_id) | (models.Task.reporter_id == user_id)
-    # ).offset(skip).limit(limit)
-
-    # Simpler: Get all tasks for now, filter later based on roles/permissions
-    query = select(models.Task).offset(skip).limit(limit)
+    # Keyset pagination: each page continues after the last (sort key, id) seen,
+    # so deep pages cost the same as the first one (no OFFSET scan-and-discard).
+    # ?mine=true narrows the list to tasks assigned to or reported by the caller
+    query = build_page_query(filters, current_user["id"], sort, limit, cursor)
 
     result = await db.execute(query)
-    tasks = result.scalars().all()
-    return tasks
+    tasks, next_cursor = split_page(result.scalars().all(), sort, limit)
+    # Rows straight from our own database: serialised without another validation pass
+    return responses.orm_response(tasks, TaskSchema, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+# --- Streaming Export ---
+# Registered before /tasks/{task_id} so "export" isn't parsed as a task id.
+@app.get("/tasks/export")
+async def export_tasks(
+    current_user: dict = Depends(get_current_user),
+    filters: TaskFilters = Depends(), # Same filters as GET /tasks/
+    sort: SortField = "created_at",
+    format: ExportFormat = "ndjson"
+):
+    headers = {}
+    if format == "csv":
+        headers["Content-Disposition"] = 'attachment; filename="tasks.csv"'
+    return StreamingResponse(
+        stream_tasks(filters, current_user["id"], sort, format),
+        media_type=MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+# --- Summary Counters ---
+# Also registered before /tasks/{task_id}.
+@app.get("/tasks/summary")
+async def get_task_summary(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user),
+    assignee_id: str | None = Query(None, description="Only count tasks assigned to this user"),
+    by_assignee: bool = Query(False, description="Also break the counts down per assignee")
+):
+    # Served from task_counters (+ pending deltas): cost depends on the number of
+    # (status, assignee) pairs, not on the number of tasks
+    counts = await summary.read_counts(db, assignee_id)
+    return responses.FastJSONResponse(summary.summarize(counts, by_assignee))
+
+# --- Full-Text Search ---
+# Also registered before /tasks/{task_id}.
+@app.get("/tasks/search", response_model=list[TaskSearchHit])
+async def search_tasks(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to find; each one also matches as a prefix"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user),
+    filters: TaskFilters = Depends(), # Same filters as GET /tasks/
+    cursor: str | None = None, # From the previous page's X-Next-Cursor header
+    limit: int = Query(20, ge=1, le=100)
+):
+    # Ranked by relevance (title matches first), using the GIN index instead of an ILIKE table scan
+    terms = search.search_terms(q)
+    result = await db.execute(search.build_search_query(terms, filters, current_user["id"], limit, cursor))
+    hits, next_cursor = search.split_hits(result.all(), terms, limit)
+    return responses.orm_response(hits, TaskSearchHit, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+# --- Live Change Feed ---
+# Also registered before /tasks/{task_id}. Clients load GET /tasks/ once, then apply deltas
+# from here instead of re-polling. Events: created/updated/deleted carry the task (or its id);
+# "removed" means an updated task no longer matches the subscriber's filter; "reset" means
+# the client fell too far behind to resume and should refetch.
+@app.get("/tasks/stream")
+async def stream_task_changes(
+    current_user: dict = Depends(get_stream_user), # Authorization header, or ?token= for EventSource
+    assignee_id: str | None = None,
+    status_filter: str | None = Query(None, alias="status"),
+    last_event_id: int | None = Header(None), # Sent by EventSource when it reconnects
+    after: int | None = Query(None, description="Resume after this event id (alternative to Last-Event-ID)")
+):
+    if not settings.CHANGE_FEED_ENABLED:
+        raise HTTPException(status_code=404, detail="Change feed is disabled")
+
+    async def body():
+        yield b"retry: 2000\n\n" # Client reconnect delay (ms)
+        subscriber = changefeed.hub.subscribe(assignee_id, status_filter) # Unsubscribed when the stream ends
+        async for event in changefeed.hub.events(subscriber, last_event_id if last_event_id is not None else after):
+            yield changefeed.format_sse(*event) if event is not None else b": keep-alive\n\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, # Don't let proxies buffer the stream
+    )
+
+@app.websocket("/tasks/ws")
+async def task_changes_websocket(
+    websocket: WebSocket,
+    token: str = Query(...), # Browsers can't set headers on WebSocket connections
+    assignee_id: str | None = None,
+    status_filter: str | None = Query(None, alias="status"),
+    after: int | None = None
+):
+    """Same feed as /tasks/stream, one JSON message per change."""
+    try:
+        await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=1008) # Policy violation: bad or expired token
+        return
+    if not settings.CHANGE_FEED_ENABLED:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    events = changefeed.hub.events(changefeed.hub.subscribe(assignee_id, status_filter), after)
+    try:
+        async for event in events:
+            if event is None:
+                await websocket.send_text('{"op":"keep-alive"}')
+            elif event[0] == "reset":
+                await websocket.send_text('{"op":"reset"}')
+            else:
+                await websocket.send_text(event[2])
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await events.aclose() # Unsubscribes
+
+# --- Batch Endpoints ---
+# Also registered before the /tasks/{task_id} routes.
+# ?atomic=true (default): all-or-nothing; ?atomic=false: apply what succeeds, report the rest.
+
+@app.post("/tasks/batch", response_model=BatchResult)
+async def create_tasks_batch(
+    items: list[TaskCreate],
+    atomic: bool = True,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    batch.check_batch_size(len(items))
+    result = await batch.create_tasks(db, items, current_user["id"], atomic)
+    created = [item.task for item in result.results if item.ok]
+    await summary.record(db, summary.created(created))
+    await outbox.record_created(db, created, current_user["id"])
+    await changefeed.record(db, "created", tasks=created)
+    return responses.FastJSONResponse(result) # Already a validated BatchResult
+
+@app.patch("/tasks/batch", response_model=BatchResult)
+async def update_tasks_batch(
+    items: list[TaskBatchUpdateItem],
+    atomic: bool = True,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    batch.check_batch_size(len(items))
+    # Lock and read the current status/assignee of tasks moving between summary counters
+    previous = await summary.lock_current_keys(
+        db, [item.id for item in items if summary.TRACKED_FIELDS & item.model_fields_set]
+    )
+    result = await batch.update_tasks(db, items, atomic)
+    updated = [item for item in result.results if item.ok]
+    await summary.record(db, summary.moved(previous, [item.task for item in updated]))
+    await invalidate_cached_tasks(db, *(item.id for item in updated))
+    await outbox.record_updated(
+        db,
+        [
+            (item.task, items[item.index].model_dump(exclude_unset=True, exclude={"id"}), previous.get(item.id))
+            for item in updated
+        ],
+        current_user["id"],
+    )
+    await changefeed.record(db, "updated", tasks=[item.task for item in updated])
+    return responses.FastJSONResponse(result)
+
+@app.delete("/tasks/batch", response_model=BatchResult)
+async def delete_tasks_batch(
+    body: TaskBatchDelete,
+    atomic: bool = True,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    batch.check_batch_size(len(body.ids))
+    result, deleted_rows = await batch.delete_tasks(db, body.ids, atomic)
+    deleted_ids = [item.id for item in result.results if item.ok]
+    await summary.record(db, summary.removed(deleted_rows))
+    await invalidate_cached_tasks(db, *deleted_ids)
+    await outbox.record_deleted(db, deleted_ids, current_user["id"])
+    await changefeed.record(db, "deleted", task_ids=deleted_ids)
+    return responses.FastJSONResponse(result)
 
 @app.get("/tasks/{task_id}", response_model=TaskSchema) # Use TaskSchema
 async def get_task(
     task_id: int,
+    if_none_match: str | None = Header(None),
+    # Sessions connect lazily, so cache hits never touch the pool. Misses read the primary,
+    # not the replica: a lagging replica could put a pre-write row back into the cache.
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    query = select(models.Task).where(models.Task.id == task_id)
-    result = await db.execute(query)
-    task = result.scalar_one_or_none()
-    if task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
-
     # Add authorization: Can current_user view this specific task?
     # Example: if task.assignee_id != current_user['id'] and task.reporter_id != current_user['id'] and 'app_admin' not in current_user['roles']:
     #    raise HTTPException(status_code=403, detail="Not authorized to view this task")
-
-    return task
+    # (check it before answering from the cache, too)
+
+    cached = await task_cache.get(task_id)
+    if cached is None:
+        # Read-through: load, serialise once, and cache the bytes with their ETag
+        generation = task_cache.generation(task_id)
+        query = select(models.Task).where(models.Task.id == task_id)
+        result = await db.execute(query)
+        task = result.scalar_one_or_none()
+        if task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        with timing.phase("serialise"):
+            cached = CachedTask(
+                etag=task_etag(task.id, task.updated_at or task.created_at),
+                body=responses.dumps(responses.project(task, TaskSchema)),
+            )
+        await task_cache.put(task_id, cached, generation)
+
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": cached.etag})
+    return Response(content=cached.body, media_type="application/json", headers={"ETag": cached.etag})
 
 @app.post("/tasks/", response_model=TaskSchema, status_code=status.HTTP_201_CREATED) # Use TaskSchema
 async def create_task(
@@ -208,65 +336,82 @@ async def create_task(
     #     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions to create tasks")
 
     user_id = current_user["id"] # Get user ID from token
-    db_task = models.Task(
-        **task_in.model_dump(), # Create model from schema data
-        reporter_id=user_id # Set the reporter
-    )
-    db.add(db_task)
+    # INSERT ... RETURNING gives us DB-generated values (id, created_at) in the same round trip,
+    # and counts the task for the summary in the same statement (see summary.insert_counted)
+    db_task = await summary.insert_counted(db, {**task_in.model_dump(), "reporter_id": user_id})
+    # A successful single-task write costs this statement, the outbox and change feed INSERTs below
+    # (one each) and the COMMIT; on SQLite the summary delta is one more (see summary.py)
+    # Events go out through the outbox: same transaction, no extra network hop on the request path
+    await outbox.record_created(db, [db_task], user_id)
+    await changefeed.record(db, "created", tasks=[db_task])
     # No need for explicit commit here, get_db handles it
-    # await db.commit() # get_db handles commit/rollback
-    await db.refresh(db_task) # Refresh to get DB-generated values like ID, created_at
-    return db_task
+    return responses.orm_response(db_task, TaskSchema, status_code=status.HTTP_201_CREATED)
+
+
+async def raise_write_miss(db: AsyncSession, task_id: int, expected_updated_at: datetime | None):
+    """A conditional write matched no row: tell 'not found' apart from 'modified since'."""
+    # Only runs on the failure path, so successful writes don't pay for it
+    exists = await db.scalar(select(models.Task.id).where(models.Task.id == task_id))
+    if exists is None or expected_updated_at is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Task was modified by someone else")
+
+def write_conditions(task_id: int, expected_updated_at: datetime | None) -> list:
+    conditions = [models.Task.id == task_id]
+    if expected_updated_at is not None:
+        # Optimistic concurrency: only write if nobody changed the task since the client read it
+        conditions.append(LAST_MODIFIED == expected_updated_at)
+    return conditions
 
 
 @app.put("/tasks/{task_id}", response_model=TaskSchema)
 async def update_task(
     task_id: int,
     task_in: TaskUpdate, # Use TaskUpdate schema for partial updates
+    expected_updated_at: datetime | None = Query(None, description="Reject with 412 if the task changed since this updated_at"),
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    query = select(models.Task).where(models.Task.id == task_id)
-    result = await db.execute(query)
-    db_task = result.scalar_one_or_none()
-
-    if db_task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
-
     # Add authorization: Can current_user update this task? (e.g., assignee, reporter, admin)
-    # ... authorization logic ...
+    # ... authorization logic ... (fold it into the WHERE clause to keep this a single statement)
 
     # Get updated data, excluding unset fields to allow partial updates
     update_data = task_in.model_dump(exclude_unset=True)
-
-    # Update the task object attributes
-    for key, value in update_data.items():
-        setattr(db_task, key, value)
-
-    db.add(db_task) # Add the updated object to the session
-    # await db.commit() # get_db handles commit/rollback
-    await db.refresh(db_task)
-    return db_task
+    conditions = write_conditions(task_id, expected_updated_at)
+
+    if update_data:
+        # Single UPDATE ... WHERE id = :id RETURNING *: no read-then-write race, one statement that
+        # also moves the task between summary counters (see summary.update_counted)
+        db_task, previous = await summary.update_counted(db, task_id, conditions, update_data)
+    else:
+        db_task = (await db.scalars(select(models.Task).where(*conditions))).one_or_none() # Nothing to change, just return the task
+    if db_task is None:
+        await raise_write_miss(db, task_id, expected_updated_at)
+    if update_data:
+        await invalidate_cached_tasks(db, task_id)
+        await outbox.record_updated(db, [(db_task, update_data, previous)], current_user["id"])
+        await changefeed.record(db, "updated", tasks=[db_task])
+    return responses.orm_response(db_task, TaskSchema)
 
 
 @app.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_task(
     task_id: int,
+    expected_updated_at: datetime | None = Query(None, description="Reject with 412 if the task changed since this updated_at"),
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    query = select(models.Task).where(models.Task.id == task_id)
-    result = await db.execute(query)
-    db_task = result.scalar_one_or_none()
-
-    if db_task is None:
-        # Avoid revealing existence, could just return 204, or 404 if preferred
-        raise HTTPException(status_code=404, detail="Task not found")
-
     # Add authorization: Can current_user delete this task? (e.g., reporter, admin)
-    # ... authorization logic ...
+    # ... authorization logic ... (fold it into the WHERE clause to keep this a single statement)
 
-    await db.delete(db_task)
+    # DELETE ... RETURNING, uncounting the task in the same statement (see summary.delete_counted)
+    deleted = await summary.delete_counted(db, write_conditions(task_id, expected_updated_at))
+    if deleted is None:
+        # Avoid revealing existence, could just return 204, or 404 if preferred
+        await raise_write_miss(db, task_id, expected_updated_at)
+    await invalidate_cached_tasks(db, task_id)
+    await outbox.record_deleted(db, [task_id], current_user["id"])
+    await changefeed.record(db, "deleted", task_ids=[task_id])
     # await db.commit() # get_db handles commit/rollback
     return None # Return None for 204 No Content
 
@@ -1,5 +1,5 @@
 # services/task-service/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Text, Index, JSON, DDL, event
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func # For default timestamps
 
@@ -11,19 +11,121 @@ class Task(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(100), nullable=False) # Added length limit
     description = Column(Text, nullable=True)
-    status = Column(String(50), index=True, default="todo") # e.g., todo, inprogress, done
+    status = Column(String(50), default="todo") # e.g., todo, inprogress, done
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # We will link to Keycloak User ID (sub), which is a string (UUID)
     # Store it directly, or create a separate User mapping table if needed
-    assignee_id = Column(String, index=True, nullable=True)
-    reporter_id = Column(String, index=True, nullable=False) # Who created the task
+    assignee_id = Column(String, nullable=True)
+    reporter_id = Column(String, nullable=False) # Who created the task
+
+    # Composite indexes for keyset (cursor) pagination on GET /tasks/.
+    # Each page is "WHERE <filter> AND (sort_key, id) < cursor ORDER BY sort_key DESC, id DESC LIMIT n",
+    # which these turn into a bounded index range scan (one index per filter and sort key). They also cover plain
+    # equality lookups on status/assignee_id/reporter_id, so no separate single-column indexes.
+    __table_args__ = (
+        Index("ix_tasks_created_at_id", created_at, id),
+        Index("ix_tasks_updated_at_id", func.coalesce(updated_at, created_at), id),
+        Index("ix_tasks_status_created_at_id", status, created_at, id),
+        Index("ix_tasks_assignee_created_at_id", assignee_id, created_at, id),
+        Index("ix_tasks_reporter_created_at_id", reporter_id, created_at, id),
+        # Same filters with sort=updated_at ("last modified", see pagination.LAST_MODIFIED)
+        Index("ix_tasks_status_updated_at_id", status, func.coalesce(updated_at, created_at), id),
+        Index("ix_tasks_assignee_updated_at_id", assignee_id, func.coalesce(updated_at, created_at), id),
+        Index("ix_tasks_reporter_updated_at_id", reporter_id, func.coalesce(updated_at, created_at), id),
+    )
+
+    # Full-text search (GET /tasks/search) uses a generated "search_vector" tsvector column with a
+    # GIN index. It is deliberately not mapped here: it only exists on Postgres (see SEARCH_DDL
+    # below), and loading it with every Task would just be wasted bytes.
 
     # Add relationships later if needed (e.g., to a Project model)
     # project_id = Column(Integer, ForeignKey("projects.id"))
     # project = relationship("Project", back_populates="tasks")
 
+# Title matches rank above description matches (weights A and B). Postgres keeps the column
+# up to date on every INSERT/UPDATE. For an existing database, run these statements once
+# (the ALTER rewrites the table; build the index CONCURRENTLY on a busy one).
+TEXT_SEARCH_CONFIG = "english"
+SEARCH_DDL = [
+    f"""ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(description, '')), 'B')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN (search_vector)",
+]
+for statement in SEARCH_DDL:
+    event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+class TaskCounter(Base):
+    # Task counts per (status, assignee) for GET /tasks/summary. Writes don't touch these rows
+    # (that would make a few hot rows a lock bottleneck); they append to task_count_deltas,
+    # which a background job folds in here every few seconds.
+    __tablename__ = "task_counters"
+
+    status = Column(String(50), primary_key=True)
+    assignee_key = Column(String, primary_key=True) # assignee_id, or "" for unassigned
+    count = Column(BigInteger, nullable=False, default=0)
+
+class TaskCountDelta(Base):
+    __tablename__ = "task_count_deltas"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    status = Column(String(50), nullable=False)
+    assignee_key = Column(String, nullable=False)
+    delta = Column(Integer, nullable=False) # +1 / -1 (or the net change of one transaction)
+
+class OutboxEvent(Base):
+    # Events for other services, written in the same transaction as the task change
+    # and deleted by the outbox relay once the destination has accepted them. Events it refuses
+    # (or that run out of attempts) stay, with status "dead".
+    __tablename__ = "outbox"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True) # Delivery order
+    destination = Column(String(32), nullable=False) # "analytics" or "notification"
+    payload = Column(JSON, nullable=False) # Request item, including its idempotency key
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(Text, nullable=True)
+    status = Column(String(16), nullable=False, default="pending", server_default="pending") # "pending" or "dead"
+
+    __table_args__ = (
+        # The relay reads "WHERE destination = ? AND status = 'pending' AND next_attempt_at <= now() ORDER BY id"
+        Index("ix_outbox_destination_status_next_attempt", destination, status, next_attempt_at, id),
+    )
+
+class TaskChange(Base):
+    # Change log behind the live feed (GET /tasks/stream). Written in the same transaction as
+    # the change; the id is the SSE event id clients resume from. Pruned after a retention window.
+    __tablename__ = "task_changes"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    op = Column(String(16), nullable=False) # "created", "updated" or "deleted"
+    task = Column(JSON, nullable=True) # The task after the change (None for deletes)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_task_changes_created_at", created_at), # Retention pruning
+    )
+
+# On Postgres, every INSERT statement into task_changes sends one NOTIFY (delivered at commit)
+# with the highest new id, so listeners wake up without polling.
+TASK_CHANGES_CHANNEL = "task_changes"
+event.listen(TaskChange.__table__, "after_create", DDL(f"""
+CREATE OR REPLACE FUNCTION notify_task_changes() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{TASK_CHANGES_CHANNEL}', (SELECT max(id) FROM new_rows)::text);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql
+""").execute_if(dialect="postgresql"))
+event.listen(TaskChange.__table__, "after_create", DDL("""
+CREATE TRIGGER task_changes_notify AFTER INSERT ON task_changes
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_task_changes()
+""").execute_if(dialect="postgresql"))
+
 # Example Project model (optional for now)
 # class Project(Base):
 #     __tablename__ = "projects"
@@ -0,0 +1,284 @@
+# services/task-service/outbox.py
+# Transactional outbox. Task events are written to the outbox table in the same
+# transaction as the task change (so they exist if and only if the change committed),
+# and OutboxRelay posts them to analytics/notification in batches in the background.
+# Delivery is at-least-once; every event carries an idempotency key the receivers dedupe on.
+# Dead-lettered rows (status 'dead') stay in the table with their last_error; to send them again:
+#   UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = now() WHERE status = 'dead' AND ...
+import asyncio
+import json
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from config import settings
+from database import AsyncSessionLocal, after_commit
+
+ANALYTICS = "analytics"
+NOTIFICATION = "notification"
+
+
+PENDING = "pending"
+DEAD = "dead" # Refused by the destination or out of attempts: kept for inspection, not retried
+
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent # The destination refused the request (4xx): resending it as is won't help
+
+
+class OutboxRelay:
+    """
+    Drains the outbox, one loop per destination so a slow or failing service doesn't
+    hold up the other. Rows are claimed with FOR UPDATE SKIP LOCKED and leased (next_attempt_at
+    pushed out) in a short transaction, so several instances can relay at once without holding
+    row locks across the HTTP call. Rows are deleted once the destination accepted them and
+    dead-lettered when it refuses them or they run out of attempts.
+    """
+
+    def __init__(self, session_factory, endpoints: dict[str, str], batch_size: int,
+                 poll_interval: float, max_backoff: float, timeout: float,
+                 max_attempts: int, lease: float):
+        self.session_factory = session_factory
+        self.endpoints = endpoints # destination -> URL the batch is POSTed to
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.lease = lease # Seconds claimed rows stay hidden from other relays while being delivered
+        self._client: httpx.AsyncClient | None = None
+        self._wakeups = {destination: asyncio.Event() for destination in endpoints}
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        self._client = httpx.AsyncClient(timeout=self.timeout)
+        self._tasks = [asyncio.create_task(self._run(destination)) for destination in self.endpoints]
+
+    async def stop(self):
+        """Stop relaying; undelivered events stay in the outbox for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def wake(self):
+        """Called after a commit that wrote events, so they go out without waiting for the next poll."""
+        for event in self._wakeups.values():
+            event.set()
+
+    async def _run(self, destination: str):
+        wakeup = self._wakeups[destination]
+        while True:
+            wakeup.clear()
+            try:
+                relayed = await self.relay_batch(destination)
+            except Exception as e:
+                print(f"Error relaying outbox events to {destination}: {e}")
+                relayed = 0
+            if relayed == self.batch_size:
+                continue # Backlog: keep draining
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def relay_batch(self, destination: str) -> int:
+        """
+        Deliver up to batch_size due events. Returns how many were settled (delivered or
+        dead-lettered); 0 when the destination failed and the batch was rescheduled.
+        """
+        now = datetime.now(timezone.utc)
+        async with self.session_factory() as session, session.begin():
+            stmt = (
+                select(models.OutboxEvent.id, models.OutboxEvent.payload, models.OutboxEvent.attempts)
+                .where(
+                    models.OutboxEvent.destination == destination,
+                    models.OutboxEvent.status == PENDING,
+                    models.OutboxEvent.next_attempt_at <= now,
+                )
+                .order_by(models.OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True) # Other relays skip these rows instead of waiting
+            )
+            rows = (await session.execute(stmt)).all()
+            if not rows:
+                return 0
+            # Lease the rows and commit right away: if this relay dies mid-delivery they come due again
+            await session.execute(
+                update(models.OutboxEvent)
+                .where(models.OutboxEvent.id.in_([row.id for row in rows]))
+                .values(next_attempt_at=now + timedelta(seconds=self.lease))
+                .execution_options(synchronize_session=False)
+            )
+
+        delivered, refused = [], {}
+        failure = None
+        try:
+            await self._deliver(destination, rows, delivered, refused)
+        except DeliveryError as e:
+            failure = e
+        settled = set(delivered) | set(refused)
+        retry = [row for row in rows if row.id not in settled]
+        if failure is None and retry:
+            failure = DeliveryError(f"{len(retry)} events rejected without details") # Sent again; accepted ones are deduplicated
+
+        async with self.session_factory() as session, session.begin():
+            if delivered:
+                await session.execute(
+                    delete(models.OutboxEvent)
+                    .where(models.OutboxEvent.id.in_(delivered))
+                    .execution_options(synchronize_session=False)
+                )
+            exhausted = {row.id: f"Gave up after {row.attempts + 1} attempts: {failure}" for row in retry if row.attempts + 1 >= self.max_attempts}
+            dead = {**refused, **exhausted}
+            if dead:
+                attempts = {row.id: row.attempts + 1 for row in rows}
+                await session.execute(
+                    update(models.OutboxEvent),
+                    [{"id": row_id, "status": DEAD, "attempts": attempts[row_id], "last_error": error[:1000]} for row_id, error in dead.items()],
+                )
+                print(f"Outbox dead-lettered {len(dead)} events for {destination}, e.g.: {next(iter(dead.values()))[:200]}")
+            retry = [row for row in retry if row.id not in exhausted]
+            if retry:
+                await session.execute(self._backoff_statement([row.id for row in retry], max(row.attempts for row in retry) + 1, failure))
+                print(f"Outbox delivery of {len(retry)} events to {destination} failed, will retry: {failure}")
+        return 0 if retry else len(rows)
+
+    async def _deliver(self, destination: str, rows: list, delivered: list[int], refused: dict[int, str]):
+        """
+        POST 'rows', sorting their ids into 'delivered' and 'refused' (id -> error). A request the
+        destination refuses as a whole is split in halves until the offending rows are isolated.
+        Raises DeliveryError on transient failures; rows not sorted by then are retried later.
+        """
+        try:
+            rejected, complete = await self._post(destination, [row.payload for row in rows])
+        except DeliveryError as e:
+            if not e.permanent:
+                raise
+            if len(rows) == 1:
+                refused[rows[0].id] = str(e)
+                return
+            middle = len(rows) // 2
+            await self._deliver(destination, rows[:middle], delivered, refused)
+            await self._deliver(destination, rows[middle:], delivered, refused)
+            return
+        for index, row in enumerate(rows):
+            if index in rejected:
+                refused[row.id] = rejected[index]
+            elif complete:
+                delivered.append(row.id)
+
+    async def _post(self, destination: str, payloads: list[dict]) -> tuple[dict[int, str], bool]:
+        """
+        Returns the per-event rejections of an accepted request (index -> error, from the
+        /log-events "errors" list) and whether that list covers all of them ("rejected" count).
+        """
+        try:
+            response = await self._client.post(self.endpoints[destination], json=payloads)
+        except httpx.HTTPError as e:
+            raise DeliveryError(f"{type(e).__name__}: {e}")
+        if response.status_code in (408, 429) or response.status_code >= 500:
+            raise DeliveryError(f"HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise DeliveryError(f"HTTP {response.status_code}: {response.text[:200]}", permanent=True)
+        try:
+            body = response.json()
+        except ValueError:
+            return {}, True
+        if not isinstance(body, dict) or not body.get("rejected"):
+            return {}, True
+        errors = {item["index"]: f"Rejected: {json.dumps(item.get('error'))}" for item in body.get("errors", [])}
+        return errors, len(errors) >= body["rejected"] # The receiver lists only the first errors; the rest go again
+
+    def _backoff_statement(self, ids: list[int], attempts: int, error: DeliveryError):
+        # Exponential backoff with jitter
+        delay = min(self.max_backoff, 2 ** (attempts - 1))
+        next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=delay * random.uniform(0.5, 1.0))
+        return (
+            update(models.OutboxEvent)
+            .where(models.OutboxEvent.id.in_(ids))
+            .values(attempts=models.OutboxEvent.attempts + 1, next_attempt_at=next_attempt_at, last_error=str(error))
+            .execution_options(synchronize_session=False)
+        )
+
+
+relay = OutboxRelay(
+    AsyncSessionLocal,
+    endpoints={
+        ANALYTICS: f"{settings.ANALYTICS_SERVICE_URL.rstrip('/')}/log-events",
+        NOTIFICATION: f"{settings.NOTIFICATION_SERVICE_URL.rstrip('/')}/send-notifications",
+    },
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    max_backoff=settings.OUTBOX_MAX_BACKOFF,
+    timeout=settings.OUTBOX_REQUEST_TIMEOUT,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    lease=settings.OUTBOX_LEASE,
+)
+
+
+# --- Writing events (inside the request's transaction) ---
+def _analytics_event(event_type: str, user_id: str, **details) -> tuple[str, dict]:
+    return ANALYTICS, {
+        "event_id": uuid.uuid4().hex, # Idempotency key: analytics stores each event_id once
+        "event_type": event_type,
+        "user_id": user_id,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "details": details,
+    }
+
+def _assignment_notification(task) -> tuple[str, dict]:
+    return NOTIFICATION, {
+        "idempotency_key": uuid.uuid4().hex, # Notification service drops repeats of this key
+        "recipient": task.assignee_id,
+        "subject": f"Task assigned: {task.title}",
+        "message": f"You have been assigned task #{task.id}: {task.title}",
+        "type": settings.OUTBOX_NOTIFICATION_TYPE,
+    }
+
+async def add_events(db: AsyncSession, events: list[tuple[str, dict]]):
+    """Queue (destination, payload) events in the current transaction; they are relayed after commit."""
+    if not events:
+        return
+    rows = [{"destination": destination, "payload": payload} for destination, payload in events]
+    await db.execute(insert(models.OutboxEvent), rows) # One executemany round trip
+    if settings.OUTBOX_RELAY_ENABLED:
+        after_commit(db, relay.wake)
+
+async def record_created(db: AsyncSession, tasks: list, user_id: str):
+    events = []
+    for task in tasks:
+        events.append(_analytics_event("task_created", user_id, task_id=task.id, status=task.status, assignee_id=task.assignee_id))
+        if task.assignee_id:
+            events.append(_assignment_notification(task))
+    await add_events(db, events)
+
+async def record_updated(db: AsyncSession, changes: list[tuple[object, dict, tuple[str, str] | None]], user_id: str):
+    """
+    'changes' are (updated task as returned by the write, the fields that were set, its previous
+    summary.count_key() or None if unknown). Completion and assignment events fire only on an
+    actual transition, not when a client re-sends the current value.
+    """
+    events = []
+    for task, fields, previous in changes:
+        old_status, old_assignee = previous if previous is not None else (None, None)
+        events.append(_analytics_event("task_updated", user_id, task_id=task.id, fields=sorted(fields)))
+        if fields.get("status") == "done" and old_status != "done":
+            events.append(_analytics_event("task_completed", user_id, task_id=task.id))
+        if fields.get("assignee_id") and old_assignee != task.assignee_id:
+            events.append(_analytics_event("task_assigned", user_id, task_id=task.id, assignee_id=task.assignee_id))
+            events.append(_assignment_notification(task))
+    await add_events(db, events)
+
+async def record_deleted(db: AsyncSession, task_ids: list[int], user_id: str):
+    await add_events(db, [_analytics_event("task_deleted", user_id, task_id=task_id) for task_id in task_ids])
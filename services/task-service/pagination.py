@@ -0,0 +1,130 @@
+# services/task-service/pagination.py
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Literal
+
+from fastapi import HTTPException, Query
+from sqlalchemy import func, tuple_
+from sqlalchemy.future import select
+from sqlalchemy.sql import union
+
+import models
+
+SortField = Literal["created_at", "updated_at"]
+
+# updated_at is NULL until the first update, so "last modified" falls back to created_at
+LAST_MODIFIED = func.coalesce(models.Task.updated_at, models.Task.created_at)
+
+# Sort expressions for keyset pagination. Each one is backed by a composite
+# (sort_key, id) index in models.Task, so a page is a bounded index range scan.
+SORT_EXPRESSIONS = {
+    "created_at": models.Task.created_at,
+    "updated_at": LAST_MODIFIED,
+}
+
+
+# --- Opaque Cursors ---
+def pack_cursor(values: list) -> str:
+    """JSON-serialisable position -> opaque, URL-safe string."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def unpack_cursor(cursor: str) -> list:
+    """Inverse of pack_cursor. Raises ValueError/TypeError/binascii.Error on garbage."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded))
+    if not isinstance(values, list):
+        raise ValueError("malformed cursor")
+    return values
+
+def encode_cursor(sort: SortField, sort_value: datetime, task_id: int) -> str:
+    """Encode the position after (sort_value, task_id) as an opaque, URL-safe string."""
+    return pack_cursor([sort, sort_value.isoformat(), task_id])
+
+def decode_cursor(cursor: str, sort: SortField) -> tuple[datetime, int]:
+    try:
+        cursor_sort, sort_value, task_id = unpack_cursor(cursor)
+        if cursor_sort != sort:
+            raise ValueError("cursor was issued for a different sort order")
+        return datetime.fromisoformat(sort_value), int(task_id)
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+# --- Filters ---
+class TaskFilters:
+    """Query-string filters shared by the task listing endpoints."""
+
+    def __init__(
+        self,
+        status: str | None = None,
+        assignee_id: str | None = None,
+        reporter_id: str | None = None,
+        mine: bool = Query(False, description="Only tasks assigned to or reported by the current user"),
+    ):
+        self.status = status
+        self.assignee_id = assignee_id
+        self.reporter_id = reporter_id
+        self.mine = mine
+
+    def clauses(self) -> list:
+        clauses = []
+        if self.status is not None:
+            clauses.append(models.Task.status == self.status)
+        if self.assignee_id is not None:
+            clauses.append(models.Task.assignee_id == self.assignee_id)
+        if self.reporter_id is not None:
+            clauses.append(models.Task.reporter_id == self.reporter_id)
+        return clauses
+
+
+# --- Keyset Page Query ---
+def build_page_query(filters: TaskFilters, user_id: str, sort: SortField, limit: int, cursor: str | None = None):
+    """
+    Build a SELECT for one page of tasks, newest first, ordered by (sort, id).
+    Fetches limit + 1 rows so the caller can tell whether another page exists.
+    """
+    sort_expr = SORT_EXPRESSIONS[sort]
+    clauses = filters.clauses()
+    if cursor is not None:
+        sort_value, task_id = decode_cursor(cursor, sort)
+        clauses.append(tuple_(sort_expr, models.Task.id) < tuple_(sort_value, task_id))
+
+    if not filters.mine:
+        return (
+            select(models.Task)
+            .where(*clauses)
+            .order_by(sort_expr.desc(), models.Task.id.desc())
+            .limit(limit + 1)
+        )
+
+    # "Assigned to or reported by me": an OR across two columns can't use a single
+    # ordered index, so take the top rows from each index separately and merge them.
+    # Each branch is its own subquery: SQLite rejects parenthesised ORDER BY/LIMIT union members.
+    def branch(column):
+        return select(
+            select(models.Task.id, sort_expr.label("sort_key"))
+            .where(column == user_id, *clauses)
+            .order_by(sort_expr.desc(), models.Task.id.desc())
+            .limit(limit + 1)
+            .subquery()
+        )
+
+    merged = union(branch(models.Task.assignee_id), branch(models.Task.reporter_id)).subquery()
+    return (
+        select(models.Task)
+        .join(merged, models.Task.id == merged.c.id)
+        .order_by(merged.c.sort_key.desc(), merged.c.id.desc())
+        .limit(limit + 1)
+    )
+
+def split_page(rows: list, sort: SortField, limit: int) -> tuple[list, str | None]:
+    """Drop the look-ahead row and return (page, cursor for the next page or None)."""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    sort_value = last.created_at if sort == "created_at" else (last.updated_at or last.created_at)
+    return page, encode_cursor(sort, sort_value, last.id)
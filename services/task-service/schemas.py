@@ -0,0 +1,55 @@
+# services/task-service/schemas.py
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
+
+# --- Pydantic Schemas (Data Shapes) ---
+class TaskBase(BaseModel):
+    title: str = Field(..., max_length=100) # Matches models.Task.title length
+    description: str | None = None
+    status: str = "todo" # e.g., todo, inprogress, done
+    assignee_id: str | None = None # Link to Keycloak user ID
+
+class TaskCreate(TaskBase):
+    pass
+
+class TaskUpdate(BaseModel):
+    # All fields optional to allow partial updates
+    title: str | None = Field(None, max_length=100)
+    description: str | None = None
+    status: str | None = None
+    assignee_id: str | None = None
+
+class TaskSchema(TaskBase):
+    model_config = ConfigDict(from_attributes=True) # Read data from ORM objects
+
+    id: int
+    reporter_id: str
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+# --- Search Schemas ---
+class TaskSearchHit(BaseModel):
+    task: TaskSchema
+    rank: float # Higher is more relevant
+    # HTML: the task's text, escaped, with matched terms wrapped in <mark>...</mark>
+    title_highlight: str | None = None
+    snippet: str | None = None # Best-matching fragments of the description
+
+# --- Batch Schemas ---
+class TaskBatchUpdateItem(TaskUpdate):
+    id: int # Which task to update; other fields as in TaskUpdate
+
+class TaskBatchDelete(BaseModel):
+    ids: list[int]
+
+class BatchItemResult(BaseModel):
+    index: int # Position of the item in the request array
+    ok: bool
+    id: int | None = None
+    task: TaskSchema | None = None # Omitted for deletes
+    error: str | None = None
+
+class BatchResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: list[BatchItemResult]
@@ -0,0 +1,131 @@
+# services/task-service/search.py
+# Full-text search over task title/description. On Postgres, matching runs against the
+# GIN-indexed search_vector column (see models.SEARCH_DDL); other databases (SQLite in local
+# dev) fall back to unranked substring matching.
+import binascii
+import html
+import re
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, literal, literal_column, or_, tuple_
+from sqlalchemy.future import select
+
+import models
+from database import read_engine
+from pagination import TaskFilters, pack_cursor, unpack_cursor
+
+MAX_TERMS = 8 # Words beyond this are ignored
+SEARCH_VECTOR = literal_column("tasks.search_vector")
+# ts_headline returns the task's own text, so matches are marked with private-use characters
+# (stripped from the text beforehand) and turned into <mark> tags only after HTML-escaping
+START_SEL, STOP_SEL = "\ue000", "\ue001"
+HEADLINE_OPTIONS = f'StartSel="{START_SEL}", StopSel="{STOP_SEL}", MaxFragments=2, MaxWords=20, MinWords=5'
+TITLE_HEADLINE_OPTIONS = f'StartSel="{START_SEL}", StopSel="{STOP_SEL}", HighlightAll=true'
+
+
+def search_terms(q: str) -> list[str]:
+    terms = re.findall(r"\w+", q.lower())[:MAX_TERMS]
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query must contain at least one word")
+    return terms
+
+def prefix_tsquery(terms: list[str]) -> str:
+    """'fix login' -> 'fix:* & login:*': every word must match, each as a prefix (as-you-type search)."""
+    return " & ".join(f"{term}:*" for term in terms) # \w+ terms contain no tsquery operators
+
+
+def _without_markers(column):
+    return func.replace(func.replace(column, START_SEL, ""), STOP_SEL, "")
+
+def render_highlight(text: str | None) -> str | None:
+    """HTML-escape a headline, then swap its markers for <mark> tags."""
+    if text is None:
+        return None
+    return html.escape(text).replace(START_SEL, "<mark>").replace(STOP_SEL, "</mark>")
+
+
+# --- Cursors ---
+# Results are ordered by (rank DESC, id DESC); the cursor also pins the query it was issued for.
+def encode_search_cursor(terms: list[str], rank: float, task_id: int) -> str:
+    return pack_cursor(["search", " ".join(terms), rank, task_id])
+
+def decode_search_cursor(cursor: str, terms: list[str]) -> tuple[float, int]:
+    try:
+        kind, query, rank, task_id = unpack_cursor(cursor)
+        if kind != "search" or query != " ".join(terms):
+            raise ValueError("cursor was issued for a different search")
+        return float(rank), int(task_id)
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+# --- Query ---
+def _filter_clauses(filters: TaskFilters, user_id: str) -> list:
+    clauses = filters.clauses()
+    if filters.mine:
+        # The GIN index narrows the rows first, so a plain OR is fine here
+        clauses.append(or_(models.Task.assignee_id == user_id, models.Task.reporter_id == user_id))
+    return clauses
+
+def build_search_query(terms: list[str], filters: TaskFilters, user_id: str, limit: int, cursor: str | None = None):
+    """
+    SELECT (Task, rank, title_highlight, snippet) for one page of matches, best first.
+    Fetches limit + 1 rows so the caller can tell whether another page exists.
+    """
+    if read_engine.dialect.name != "postgresql":
+        return _fallback_query(terms, filters, user_id, limit, cursor)
+
+    tsquery = func.to_tsquery(models.TEXT_SEARCH_CONFIG, prefix_tsquery(terms))
+    # Normalization 32 maps the rank into [0, 1)
+    rank = func.ts_rank_cd(SEARCH_VECTOR, tsquery, 32)
+    clauses = [SEARCH_VECTOR.op("@@")(tsquery), *_filter_clauses(filters, user_id)]
+    if cursor is not None:
+        cursor_rank, cursor_id = decode_search_cursor(cursor, terms)
+        clauses.append(tuple_(rank, models.Task.id) < tuple_(cursor_rank, cursor_id))
+
+    # Rank and cut the page first, then build headlines (which re-parse the text) for just those rows
+    page = (
+        select(models.Task.id, rank.label("rank"))
+        .where(*clauses)
+        .order_by(rank.desc(), models.Task.id.desc())
+        .limit(limit + 1)
+        .subquery()
+    )
+    return (
+        select(
+            models.Task,
+            page.c.rank,
+            func.ts_headline(models.TEXT_SEARCH_CONFIG, _without_markers(models.Task.title), tsquery, TITLE_HEADLINE_OPTIONS).label("title_highlight"),
+            func.ts_headline(models.TEXT_SEARCH_CONFIG, _without_markers(models.Task.description), tsquery, HEADLINE_OPTIONS).label("snippet"),
+        )
+        .join(page, models.Task.id == page.c.id)
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+    )
+
+def _fallback_query(terms: list[str], filters: TaskFilters, user_id: str, limit: int, cursor: str | None):
+    # Every term must appear in the title or description; newest first, all ranked 0
+    clauses = [
+        or_(models.Task.title.ilike(f"%{term}%"), models.Task.description.ilike(f"%{term}%"))
+        for term in terms
+    ]
+    clauses += _filter_clauses(filters, user_id)
+    if cursor is not None:
+        _, cursor_id = decode_search_cursor(cursor, terms)
+        clauses.append(models.Task.id < cursor_id)
+    return (
+        select(models.Task, literal(0.0).label("rank"), _without_markers(models.Task.title).label("title_highlight"), literal(None).label("snippet"))
+        .where(and_(*clauses))
+        .order_by(models.Task.id.desc())
+        .limit(limit + 1)
+    )
+
+def split_hits(rows: list, terms: list[str], limit: int) -> tuple[list[dict], str | None]:
+    """Turn result rows into hits, dropping the look-ahead row; returns (hits, next cursor or None)."""
+    hits = [
+        {"task": task, "rank": rank, "title_highlight": render_highlight(title_highlight), "snippet": render_highlight(snippet)}
+        for task, rank, title_highlight, snippet in rows[:limit]
+    ]
+    if len(rows) <= limit:
+        return hits, None
+    last = hits[-1]
+    return hits, encode_search_cursor(terms, last["rank"], last["task"].id)
@@ -0,0 +1,311 @@
+# services/task-service/summary.py
+# Precomputed task counts per (status, assignee) for GET /tasks/summary.
+#
+# Write paths append +1/-1 rows to task_count_deltas in the same transaction as the change
+# (no shared hot rows to lock); on Postgres, single-task writes do it in the same statement. A background job folds the deltas into task_counters every
+# few seconds, and a periodic recount from the tasks table corrects any drift. Reads add up
+# counters plus the not-yet-folded deltas, so they are exact and never scan tasks.
+import asyncio
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, literal, or_, union_all, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+
+import models
+
+UNASSIGNED = "" # assignee_key for tasks without an assignee
+TRACKED_FIELDS = {"status", "assignee_id"} # Updates touching these move a task between counters
+
+
+def count_key(status: str | None, assignee_id: str | None) -> tuple[str, str]:
+    return status or "", assignee_id or UNASSIGNED
+
+
+# --- Recording deltas (inside the request's transaction) ---
+async def lock_current_keys(db: AsyncSession, task_ids: list[int]) -> dict[int, tuple[str, str]]:
+    """
+    Current (status, assignee) of tasks about to be updated, row-locked until commit so the
+    values can't change under us. Only needed for updates that touch TRACKED_FIELDS.
+    """
+    if not task_ids:
+        return {}
+    rows = await db.execute(
+        select(models.Task.id, models.Task.status, models.Task.assignee_id)
+        .where(models.Task.id.in_(task_ids))
+        .order_by(models.Task.id) # Consistent lock order across concurrent batches
+        .with_for_update()
+    )
+    return {task_id: count_key(status, assignee_id) for task_id, status, assignee_id in rows}
+
+def created(tasks: list) -> Counter:
+    return Counter(count_key(task.status, task.assignee_id) for task in tasks)
+
+def removed(rows: list) -> Counter:
+    """'rows' are (id, status, assignee_id) as returned by DELETE ... RETURNING."""
+    deltas = Counter()
+    for _, status, assignee_id in rows:
+        deltas[count_key(status, assignee_id)] -= 1
+    return deltas
+
+def moved(previous: dict[int, tuple[str, str]], tasks: list) -> Counter:
+    """Deltas for updated tasks, given their keys from lock_current_keys()."""
+    deltas = Counter()
+    for task in tasks:
+        old, new = previous.get(task.id), count_key(task.status, task.assignee_id)
+        if old is not None and old != new:
+            deltas[old] -= 1
+            deltas[new] += 1
+    return deltas
+
+async def record(db: AsyncSession, deltas: Counter):
+    rows = [
+        {"status": status, "assignee_key": assignee_key, "delta": delta}
+        for (status, assignee_key), delta in deltas.items() if delta
+    ]
+    if rows:
+        await db.execute(insert(models.TaskCountDelta), rows)
+
+
+# --- Single-task writes that record their own deltas ---
+# On Postgres the deltas ride along in the write itself as a data-modifying CTE, and an
+# update reads the old status/assignee from the row it locks (UPDATE ... FROM (SELECT ... FOR
+# UPDATE) old ... RETURNING old.*), so keeping the counters costs no extra round trip. SQLite
+# has no data-modifying CTEs; there the deltas are a second statement (a third, the locking
+# read, for updates that touch TRACKED_FIELDS).
+def _inline(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def _key_columns(status, assignee_id) -> tuple:
+    return func.coalesce(status, literal("")), func.coalesce(assignee_id, literal(UNASSIGNED))
+
+def _recording(written, *terms):
+    """The deltas CTE: INSERT ... SELECT a row per (status, assignee_id, delta[, condition]) from 'written'."""
+    selects = [
+        select(*_key_columns(status, assignee_id), literal(delta)).select_from(written).where(*condition)
+        for status, assignee_id, delta, *condition in terms
+    ]
+    rows = union_all(*selects) if len(selects) > 1 else selects[0]
+    return insert(models.TaskCountDelta).from_select(["status", "assignee_key", "delta"], rows).cte("deltas")
+
+async def insert_counted(db: AsyncSession, values: dict):
+    """INSERT a task and count it; returns the new task."""
+    stmt = insert(models.Task).values(**values)
+    if not _inline(db):
+        task = (await db.scalars(stmt.returning(models.Task))).one()
+        await record(db, created([task]))
+        return task
+    written = stmt.returning(*models.Task.__table__.c).cte("written")
+    deltas = _recording(written, (written.c.status, written.c.assignee_id, 1))
+    return (await db.scalars(select(aliased(models.Task, written)).add_cte(deltas))).one()
+
+async def update_counted(db: AsyncSession, task_id: int, conditions: list, values: dict):
+    """
+    UPDATE task 'task_id' if it matches 'conditions', and move it between counters. Returns (task,
+    its previous count_key(), or None when 'values' touch no TRACKED_FIELDS); (None, None) if no row matched.
+    """
+    stmt = update(models.Task).values(**values).execution_options(synchronize_session=False)
+    if not TRACKED_FIELDS & values.keys():
+        return (await db.scalars(stmt.where(*conditions).returning(models.Task))).one_or_none(), None
+    if not _inline(db):
+        previous = await lock_current_keys(db, [task_id])
+        task = (await db.scalars(stmt.where(*conditions).returning(models.Task))).one_or_none()
+        if task is None:
+            return None, None
+        await record(db, moved(previous, [task]))
+        return task, previous.get(task.id)
+
+    old = select(models.Task.id, models.Task.status, models.Task.assignee_id).where(*conditions).with_for_update().cte("old")
+    written = (
+        stmt.where(models.Task.id == old.c.id)
+        .returning(*models.Task.__table__.c, old.c.status.label("old_status"), old.c.assignee_id.label("old_assignee_id"))
+        .cte("written")
+    )
+    old_key, new_key = _key_columns(written.c.old_status, written.c.old_assignee_id), _key_columns(written.c.status, written.c.assignee_id)
+    changed = or_(old_key[0] != new_key[0], old_key[1] != new_key[1])
+    deltas = _recording(
+        written,
+        (written.c.old_status, written.c.old_assignee_id, -1, changed),
+        (written.c.status, written.c.assignee_id, 1, changed),
+    )
+    row = (await db.execute(
+        select(aliased(models.Task, written), written.c.old_status, written.c.old_assignee_id).add_cte(deltas)
+    )).one_or_none()
+    if row is None:
+        return None, None
+    task, old_status, old_assignee_id = row
+    return task, count_key(old_status, old_assignee_id)
+
+async def delete_counted(db: AsyncSession, conditions: list):
+    """DELETE the task matching 'conditions' and uncount it; returns its (id, status, assignee_id), or None."""
+    stmt = (
+        delete(models.Task)
+        .where(*conditions)
+        .returning(models.Task.id, models.Task.status, models.Task.assignee_id) # Old values, for the counters
+        .execution_options(synchronize_session=False)
+    )
+    if not _inline(db):
+        deleted = (await db.execute(stmt)).one_or_none()
+        if deleted is not None:
+            await record(db, removed([deleted]))
+        return deleted
+    written = stmt.cte("written")
+    deltas = _recording(written, (written.c.status, written.c.assignee_id, -1))
+    return (await db.execute(select(written.c.id, written.c.status, written.c.assignee_id).add_cte(deltas))).one_or_none()
+
+
+# --- Reading ---
+def _counts_query(assignee_id: str | None = None):
+    counters = select(models.TaskCounter.status, models.TaskCounter.assignee_key, models.TaskCounter.count.label("count"))
+    deltas = select(models.TaskCountDelta.status, models.TaskCountDelta.assignee_key, models.TaskCountDelta.delta.label("count"))
+    if assignee_id is not None:
+        counters = counters.where(models.TaskCounter.assignee_key == assignee_id)
+        deltas = deltas.where(models.TaskCountDelta.assignee_key == assignee_id)
+    combined = union_all(counters, deltas).subquery()
+    return (
+        select(combined.c.status, combined.c.assignee_key, func.sum(combined.c.count))
+        .group_by(combined.c.status, combined.c.assignee_key)
+    )
+
+async def read_counts(db, assignee_id: str | None = None) -> dict[tuple[str, str], int]:
+    """Exact counts per (status, assignee_key): folded counters plus pending deltas."""
+    rows = await db.execute(_counts_query(assignee_id))
+    return {(status, assignee_key): int(count) for status, assignee_key, count in rows if count}
+
+def summarize(counts: dict[tuple[str, str], int], by_assignee: bool) -> dict:
+    by_status, assignees = Counter(), Counter()
+    for (status, assignee_key), count in counts.items():
+        by_status[status] += count
+        assignees[assignee_key or None] += count
+    summary = {"total": sum(by_status.values()), "by_status": dict(by_status)}
+    if by_assignee:
+        summary["by_assignee"] = [
+            {"assignee_id": assignee_id, "count": count} for assignee_id, count in assignees.most_common()
+        ]
+    return summary
+
+
+# --- Maintenance ---
+def _increment_counts(dialect_name: str):
+    """INSERT ... ON CONFLICT (status, assignee_key) DO UPDATE SET count = count + excluded.count"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(models.TaskCounter)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.TaskCounter.status, models.TaskCounter.assignee_key],
+        set_={"count": models.TaskCounter.count + stmt.excluded.count},
+    )
+
+async def _serializable(engine):
+    # Both jobs read-then-replace; a serializable snapshot makes "the deltas we consumed" and
+    # "the counts we wrote" match exactly even while writers keep appending deltas
+    conn = await engine.connect()
+    return await conn.execution_options(isolation_level="SERIALIZABLE")
+
+async def fold(engine) -> int:
+    """Move pending deltas into task_counters. Returns how many delta rows were folded."""
+    conn = await _serializable(engine)
+    try:
+        async with conn.begin():
+            rows = (await conn.execute(
+                delete(models.TaskCountDelta).returning(
+                    models.TaskCountDelta.status, models.TaskCountDelta.assignee_key, models.TaskCountDelta.delta
+                )
+            )).all()
+            totals = Counter()
+            for status, assignee_key, delta in rows:
+                totals[(status, assignee_key)] += delta
+            changed = [
+                {"status": status, "assignee_key": assignee_key, "count": count}
+                for (status, assignee_key), count in totals.items() if count
+            ]
+            if changed:
+                await conn.execute(_increment_counts(conn.dialect.name), changed)
+                await conn.execute(delete(models.TaskCounter).where(models.TaskCounter.count == 0))
+        return len(rows)
+    finally:
+        await conn.close()
+
+async def reconcile(engine) -> int:
+    """Recount from the tasks table and replace the counters. Returns how many keys had drifted."""
+    conn = await _serializable(engine)
+    try:
+        async with conn.begin():
+            current = await read_counts(conn)
+            status = func.coalesce(models.Task.status, literal(""))
+            assignee_key = func.coalesce(models.Task.assignee_id, literal(UNASSIGNED))
+            actual = {
+                (row_status, row_assignee): int(count)
+                for row_status, row_assignee, count in await conn.execute(
+                    select(status, assignee_key, func.count()).group_by(status, assignee_key)
+                )
+            }
+            drifted = sum(current.get(key, 0) != actual.get(key, 0) for key in current.keys() | actual.keys())
+            await conn.execute(delete(models.TaskCountDelta))
+            await conn.execute(delete(models.TaskCounter))
+            if actual:
+                await conn.execute(
+                    insert(models.TaskCounter),
+                    [{"status": s, "assignee_key": a, "count": c} for (s, a), c in actual.items()],
+                )
+        return drifted
+    finally:
+        await conn.close()
+
+
+class SummaryMaintainer:
+    """Background fold (every 'fold_interval' seconds) and recount (every 'reconcile_interval')."""
+
+    def __init__(self, engine, fold_interval: float, reconcile_interval: float):
+        self.engine = engine
+        self.fold_interval = fold_interval
+        self.reconcile_interval = reconcile_interval
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_reconcile = loop.time() + self.reconcile_interval
+        while True:
+            await asyncio.sleep(self.fold_interval)
+            try:
+                if self.reconcile_interval > 0 and loop.time() >= next_reconcile:
+                    next_reconcile = loop.time() + self.reconcile_interval
+                    drifted = await reconcile(self.engine)
+                    if drifted:
+                        print(f"Task summary reconciliation corrected {drifted} counters.")
+                else:
+                    await fold(self.engine)
+            except DBAPIError as e:
+                # Usually a serialization failure because another instance ran the same job; retried next round
+                print(f"Task summary maintenance skipped: {str(e.orig).splitlines()[0] if e.orig else e}")
+            except Exception as e:
+                print(f"Error maintaining task summary counters: {e}")
+
+
+if __name__ == "__main__":
+    # Usage: python summary.py reconcile
+    import sys
+
+    from database import engine
+
+    async def main():
+        if sys.argv[1:] != ["reconcile"]:
+            sys.exit("Usage: python summary.py reconcile")
+        drifted = await reconcile(engine)
+        print(f"Recounted task summary; {drifted} counters had drifted.")
+        await engine.dispose()
+
+    asyncio.run(main())